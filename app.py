@@ -1,21 +1,40 @@
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, Response, g, has_request_context, jsonify, request, make_response
 import pandas as pd
 import pickle
 import os
+import bisect
+import cProfile
+import functools
 import glob
+import hashlib
+import hmac
+import http.client
+import logging
 import re
+import socket
 import json
 import math
+import multiprocessing
+import pstats
+import sys
+import threading
+from urllib.parse import urlsplit
+import time
+import tracemalloc
+import warnings
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait as _wait_connections
 from datetime import datetime
 import numpy as np
 
-# optional requests - jeśli nie ma, użyjemy urllib
+app = Flask(__name__)
 try:
-    import requests
+    # opcjonalna kompresja brotli (Accept-Encoding: br); bez pakietu zostaje gzip
+    import brotli  # type: ignore
 except Exception:
-    requests = None
-
-app = Flask(__name__)
+    brotli = None
 try:
     # opcjonalne CORS dla wywołań z frontendu (Vite/localhost inny port)
     from flask_cors import CORS  # type: ignore
@@ -32,35 +51,138 @@ CURRENT_DATA_DIR = None
 DATA_DIR_CANDIDATES = ['S2', 'S3']
 # Max number of items allowed to include as 'full' in summaries when slicing ranges
 MAX_FULL_IN_SUMMARY = 200000
+# Budżet pamięci (w bajtach) dla cache odpicklowanych plików uczestników (domyślnie 2 GiB)
+PICKLE_CACHE_MAX_BYTES = int(os.environ.get('PICKLE_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# ===================== FAZY ŻĄDANIA (Server-Timing) =====================
+# Lekkie liczniki czasu faz (rozwiązanie pliku, unpickling, pętla po sygnałach, cechy, konwersja,
+# serializacja) zbierane w `g` bieżącego żądania i wysyłane w nagłówku Server-Timing — devtools
+# przeglądarki pokazują je bezpośrednio. Fazy mogą się zagnieżdżać; każda raportuje czas własny
+# (bez faz zagnieżdżonych), więc suma faz nie przekracza `total`. Poza żądaniem liczniki nic nie robią.
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '1').lower() not in ('0', 'false')
+# TIMING_LOG=1: dodatkowo jedna linia JSON na żądanie w loggerze 'wesad.timing'
+TIMING_LOG_ENABLED = os.environ.get('TIMING_LOG', '0').lower() in ('1', 'true')
+_TIMING_LOGGER = logging.getLogger('wesad.timing')
+if TIMING_LOG_ENABLED and not _TIMING_LOGGER.handlers:
+    _TIMING_LOGGER.addHandler(logging.StreamHandler())
+    _TIMING_LOGGER.setLevel(logging.INFO)
+
+
+class _Phase:
+    """Licznik jednej fazy: `with _Phase('unpickle'):` albo start()/stop() dla długich bloków."""
+
+    __slots__ = ('name', 't0', 'child', 'timings')
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = None
+
+    def start(self):
+        if SERVER_TIMING_ENABLED and has_request_context():
+            self.timings = g.get('_timings')
+            if self.timings is None:
+                self.timings = g._timings = {'phases': {}, 'stack': []}
+            self.child = 0.0
+            self.timings['stack'].append(self)
+            self.t0 = time.perf_counter()
+        return self
+
+    def stop(self):
+        timings, self.timings = self.timings, None
+        if timings is None:
+            return
+        dt = time.perf_counter() - self.t0
+        stack = timings['stack']
+        if stack and stack[-1] is self:
+            stack.pop()
+        if stack:
+            stack[-1].child += dt
+        phases = timings['phases']
+        phases[self.name] = phases.get(self.name, 0.0) + dt - self.child
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _timed_phase(name):
+    """Dekorator: całe wywołanie funkcji liczone jako faza `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _server_timing_header(phases, total):
+    parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in phases.items()]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
 
 # ===================== KLASYFIKACJA STRESU / STANU EMOCJONALNEGO =====================
 # Funkcje progowe dostarczone przez użytkownika – przeniesione do backendu.
 
+# Progi modelu (wyznaczone na WESAD). Stres: wystarczy jedna cecha po stronie "stresowej";
+# zadowolenie: wszystkie cechy po stronie "spokojnej"; neutralny: wszystkie cechy pomiędzy progami.
+CLASSIFY_FEATURES = ('mean_eda', 'hr', 'hrv', 'temp', 'acc_rms')
+STRESS_RULES = (
+    ('mean_eda', '>', 0.761343),
+    ('hr', '>', 66.870546),
+    ('hrv', '<', 325.906461),
+    ('temp', '<', 31.217497),
+    ('acc_rms', '>', 1.015106),
+)
+PLEASURE_RULES = (
+    ('mean_eda', '<', 0.557787),
+    ('hr', '<', 59.803059),
+    ('hrv', '>', 371.946967),
+    ('temp', '>', 31.238812),
+    ('acc_rms', '<', 1.011331),
+)
+_RULE_OPS = {'>': lambda a, b: a > b, '<': lambda a, b: a < b}
+# przedział neutralny cechy: [min(próg zadowolenia, próg stresu), max(...)]
+NEUTRAL_RANGES = {
+    name: (min(p, s), max(p, s))
+    for (name, _, s), (_, _, p) in zip(STRESS_RULES, PLEASURE_RULES)
+}
+CLASSIFY_LABELS = ('stres', 'zadowolenie', 'neutralny', 'nieokreślony')
+
+
+def _feature_value(f, name):
+    """Wartość cechy albo None, gdy jej brak — NaN traktowany jak brak (tak samo jak w classify_batch)."""
+    v = f.get(name)
+    try:
+        if v is None or math.isnan(v):
+            return None
+    except TypeError:
+        pass
+    return v
+
+
+def _rule_hits(f, rules):
+    """Dla każdej reguły: True/False, albo None gdy cechy brak (None lub NaN)."""
+    hits = []
+    for name, op, thr in rules:
+        v = _feature_value(f, name)
+        hits.append(None if v is None else bool(_RULE_OPS[op](v, thr)))
+    return hits
+
+
 def is_stress(f):
-    return (
-        (f.get('mean_eda') is not None and f['mean_eda'] > 0.761343)
-        or (f.get('hr') is not None and f['hr'] > 66.870546)
-        or (f.get('hrv') is not None and f['hrv'] < 325.906461)
-        or (f.get('temp') is not None and f['temp'] < 31.217497)
-        or (f.get('acc_rms') is not None and f['acc_rms'] > 1.015106)
-    )
+    return any(h for h in _rule_hits(f, STRESS_RULES))
 
 def is_pleasure(f):
-    return (
-        (f.get('mean_eda') is not None and f['mean_eda'] < 0.557787)
-        and (f.get('hr') is not None and f['hr'] < 59.803059)
-        and (f.get('hrv') is not None and f['hrv'] > 371.946967)
-        and (f.get('temp') is not None and f['temp'] > 31.238812)
-        and (f.get('acc_rms') is not None and f['acc_rms'] < 1.011331)
-    )
+    return all(h is True for h in _rule_hits(f, PLEASURE_RULES))
 
 def is_neutral(f):
-    return (
-        (f.get('mean_eda') is not None and 0.557787 <= f['mean_eda'] <= 0.761343)
-        and (f.get('hr') is not None and 59.803059 <= f['hr'] <= 66.870546)
-        and (f.get('hrv') is not None and 325.906461 <= f['hrv'] <= 371.946967)
-        and (f.get('temp') is not None and 31.217497 <= f['temp'] <= 31.238812)
-        and (f.get('acc_rms') is not None and 1.011331 <= f['acc_rms'] <= 1.015106)
+    return all(
+        _feature_value(f, name) is not None and lo <= f[name] <= hi
+        for name, (lo, hi) in NEUTRAL_RANGES.items()
     )
 
 def classify(f):
@@ -73,32 +195,155 @@ def classify(f):
     else:
         return 'nieokreślony'
 
-def _safe_mean(seq):
+def _stress_score(f):
+    """Wynik 0-100: odsetek znanych cech spełniających warunek stresu (None gdy brak cech)."""
+    known = [h for h in _rule_hits(f, STRESS_RULES) if h is not None]
+    return int(round(100 * (sum(1 for c in known if c) / len(known)))) if known else None
+
+
+def _feature_matrix(features):
+    """Macierz (n, len(CLASSIFY_FEATURES)) float64 z DataFrame, ndarray strukturalnego, dict kolumn
+    lub listy słowników. Brakujące cechy (kolumna, None, NaN) to NaN."""
+    if isinstance(features, pd.DataFrame):
+        cols = {c: features[c].to_numpy() for c in CLASSIFY_FEATURES if c in features.columns}
+        n = len(features)
+    elif isinstance(features, np.ndarray) and features.dtype.names:
+        cols = {c: features[c] for c in CLASSIFY_FEATURES if c in features.dtype.names}
+        n = len(features)
+    elif isinstance(features, dict):
+        cols = {c: features[c] for c in CLASSIFY_FEATURES if c in features}
+        lengths = {len(v) for v in cols.values()}
+        if len(lengths) > 1:
+            raise ValueError('Kolumny cech mają różne długości')
+        n = lengths.pop() if lengths else 0
+    else:
+        rows = list(features)
+        if not all(isinstance(r, dict) for r in rows):
+            raise ValueError('Oczekiwano listy słowników z cechami')
+        cols = {c: [r.get(c) for r in rows] for c in CLASSIFY_FEATURES}
+        n = len(rows)
+    X = np.full((n, len(CLASSIFY_FEATURES)), np.nan)
+    for j, c in enumerate(CLASSIFY_FEATURES):
+        if c in cols:
+            # None -> NaN; wartości nienumeryczne dają ValueError
+            X[:, j] = pd.to_numeric(pd.Series(cols[c], dtype=object), errors='raise').astype(float).to_numpy()
+    return X
+
+
+def classify_batch(features):
+    """Wektorowa wersja classify/_stress_score dla wielu okien naraz (jedno przejście NumPy).
+
+    Zwraca dict: 'state' (ndarray etykiet), 'score' (float ndarray 0-100, NaN gdy brak cech).
+    Brakujące cechy (także NaN) traktowane jak None w classify.
+    """
+    X = _feature_matrix(features)
+    col = {c: j for j, c in enumerate(CLASSIFY_FEATURES)}
+    with np.errstate(invalid='ignore'):
+        # porównania z NaN dają False, więc brakująca cecha nigdy nie spełnia reguły
+        stress_hits = np.column_stack([_RULE_OPS[op](X[:, col[name]], thr) for name, op, thr in STRESS_RULES])
+        pleasure_hits = np.column_stack([_RULE_OPS[op](X[:, col[name]], thr) for name, op, thr in PLEASURE_RULES])
+        lo = np.array([NEUTRAL_RANGES[c][0] for c in CLASSIFY_FEATURES])
+        hi = np.array([NEUTRAL_RANGES[c][1] for c in CLASSIFY_FEATURES])
+        neutral = ((X >= lo) & (X <= hi)).all(axis=1)
+    stress = stress_hits.any(axis=1)
+    pleasure = pleasure_hits.all(axis=1)
+    state = np.select([stress, pleasure, neutral], list(CLASSIFY_LABELS[:3]), CLASSIFY_LABELS[3])
+
+    known = ~np.isnan(X[:, [col[name] for name, _, _ in STRESS_RULES]])
+    known = known.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score = np.rint(100 * (stress_hits.sum(axis=1) / known))
+    score[known == 0] = np.nan
+    return {'state': state, 'score': score}
+
+
+def _as_float_array(seq):
+    """Zamienia sekwencję (list/ndarray/Series) na tablicę float64; None -> NaN. Zwraca None gdy się nie da."""
+    if seq is None:
+        return None
     try:
-        if seq is None:
-            return None
-        if hasattr(seq, 'tolist'):
-            seq = seq.tolist()
-        seq = [float(x) for x in seq if x is not None]
-        if not seq:
-            return None
-        return sum(seq) / len(seq)
+        if isinstance(seq, pd.Series):
+            return seq.to_numpy(dtype=np.float64, na_value=np.nan)
+        arr = np.asarray(seq)
+        if arr.dtype == object:
+            arr = np.array([np.nan if x is None else x for x in arr.ravel()], dtype=np.float64)
+        return arr.astype(np.float64, copy=False)
     except Exception:
         return None
 
+
+def _safe_mean(seq):
+    """Średnia z pominięciem None/NaN (NumPy, bez konwersji do list). None gdy brak wartości."""
+    arr = _as_float_array(seq)
+    if arr is None or arr.size == 0:
+        return None
+    m = float(arr.mean())
+    if not math.isnan(m):
+        return m
+    # są NaN-y — policz ponownie tylko po poprawnych wartościach
+    arr = arr[~np.isnan(arr)]
+    return float(arr.mean()) if arr.size else None
+
+
 def _rms(seq):
-    try:
-        if seq is None:
-            return None
-        if hasattr(seq, 'tolist'):
-            seq = seq.tolist()
-        vals = [float(x) for x in seq if x is not None]
-        if not vals:
-            return None
-        return math.sqrt(sum(x*x for x in vals) / len(vals))
-    except Exception:
+    """RMS z pominięciem None/NaN. None gdy brak wartości."""
+    arr = _as_float_array(seq)
+    if arr is None or arr.size == 0:
+        return None
+    arr = arr.ravel()
+    ms = float(np.dot(arr, arr)) / arr.size
+    if not math.isnan(ms):
+        return math.sqrt(ms)
+    arr = arr[~np.isnan(arr)]
+    return math.sqrt(float(np.dot(arr, arr)) / arr.size) if arr.size else None
+
+
+def _std(seq):
+    """Odchylenie standardowe próby (ddof=1) z pominięciem NaN — przybliżenie HRV z odstępów RR."""
+    arr = _as_float_array(seq)
+    if arr is None:
+        return None
+    arr = arr.ravel()
+    arr = arr[~np.isnan(arr)]
+    if arr.size < 2:
         return None
+    return float(arr.std(ddof=1))
 
+
+def _acc_magnitude_rms(axes):
+    """Średnia z RMS po osiach liczonego dla każdej próbki.
+
+    `axes` to tablica (N, k) albo lista k tablic 1-D tej samej długości (bez kopiowania do wspólnej macierzy).
+    """
+    if isinstance(axes, (list, tuple)):
+        cols = [_as_float_array(a) for a in axes]
+    else:
+        arr = _as_float_array(axes)
+        if arr is None or arr.size == 0:
+            return None
+        if arr.ndim == 1:
+            return _rms(arr)
+        arr = arr.reshape(arr.shape[0], -1)
+        cols = [arr[:, i] for i in range(arr.shape[1])]
+    if not cols or any(c is None for c in cols):
+        return None
+    sq = np.square(cols[0])
+    for c in cols[1:]:
+        sq += np.square(c)
+    per_sample = np.sqrt(sq / len(cols), out=sq)
+    m = float(per_sample.mean()) if per_sample.size else float('nan')
+    if not math.isnan(m):
+        return m
+    # NaN w którejś osi: RMS tylko po dostępnych osiach danej próbki
+    stacked = np.column_stack(cols)
+    with warnings.catch_warnings():
+        # wiersze złożone z samych NaN dają NaN (pomijane niżej) — bez ostrzeżenia
+        warnings.simplefilter('ignore', RuntimeWarning)
+        per_sample = np.sqrt(np.nanmean(stacked * stacked, axis=1))
+    return _safe_mean(per_sample)
+
+
+@_timed_phase('features')
 def _extract_features_from_signals(raw_signals):
     """Próbuje wydobyć metryki: mean_eda, hr, hrv, temp, acc_rms.
 
@@ -106,6 +351,7 @@ def _extract_features_from_signals(raw_signals):
       {'chest': {'EDA': [...], 'TEMP': [...], 'HR': [...], 'HRV': [...]}, 'wrist': {...}}
     Szuka nazw kanałów (case-insensitive) zawierających odpowiednie fragmenty.
     Jeśli brak – zwraca None dla danej cechy.
+    Obliczenia są wektorowe (NumPy); wartości None/NaN są pomijane.
     """
     features = {
         'mean_eda': None,
@@ -115,194 +361,244 @@ def _extract_features_from_signals(raw_signals):
         'acc_rms': None,
     }
     # Jeśli surowe sygnały są DataFrame'em z kolumnami typu EDA/HR/TEMP itp.
-    try:
-        import pandas as _pd
-        if isinstance(raw_signals, _pd.DataFrame):
-            cols_lower = {c.lower(): c for c in raw_signals.columns}
-            # proste dopasowania nazw kolumn
-            if 'eda' in cols_lower:
-                features['mean_eda'] = _safe_mean(raw_signals[cols_lower['eda']])
-            if 'hr' in cols_lower:
-                features['hr'] = _safe_mean(raw_signals[cols_lower['hr']])
-            if 'hrv' in cols_lower:
-                features['hrv'] = _safe_mean(raw_signals[cols_lower['hrv']])
-            elif 'rr' in cols_lower:  # przybliżenie HRV ze zmienności RR
-                try:
-                    seq = [float(x) for x in list(raw_signals[cols_lower['rr']]) if x is not None]
-                    if len(seq) > 1:
-                        m = sum(seq)/len(seq)
-                        var = sum((x-m)**2 for x in seq)/(len(seq)-1)
-                        features['hrv'] = math.sqrt(var)
-                except Exception:
-                    pass
-            if 'temp' in cols_lower:
-                features['temp'] = _safe_mean(raw_signals[cols_lower['temp']])
-            # akcelerometr może mieć wiele osi; spróbuj ACC_X, ACC_Y, ACC_Z lub ACC
-            acc_candidates = [c for c in raw_signals.columns if c.lower().startswith('acc')]
-            if acc_candidates:
-                try:
-                    # jeśli wiele osi: RMS po wszystkich; jeśli jedna: RMS po niej
-                    if len(acc_candidates) > 1:
-                        # zbuduj listę RMS per wiersz, potem średnia RMS (globalna)
-                        sq_sum = None
-                        count_cols = 0
-                        for c in acc_candidates:
-                            try:
-                                vals = [float(v) for v in raw_signals[c].tolist() if v is not None]
-                            except Exception:
-                                vals = []
-                            if not vals:
-                                continue
-                            if sq_sum is None:
-                                sq_sum = [0.0]*len(vals)
-                            # Dopasuj długość jeśli różna — pomiń
-                            if len(vals) != len(sq_sum):
-                                continue
-                            for i, v in enumerate(vals):
-                                sq_sum[i] += v*v
-                            count_cols += 1
-                        if sq_sum and count_cols:
-                            rms_seq = [math.sqrt(x/count_cols) for x in sq_sum]
-                            features['acc_rms'] = _safe_mean(rms_seq)
-                    else:
-                        features['acc_rms'] = _rms(raw_signals[acc_candidates[0]])
-                except Exception:
-                    pass
-            return features
-    except Exception:
-        pass
+    if isinstance(raw_signals, pd.DataFrame):
+        # etykiety kolumn nie muszą być napisami (np. 0, 1 po wczytaniu CSV bez nagłówka)
+        cols_lower = {str(c).lower(): c for c in raw_signals.columns}
+        # proste dopasowania nazw kolumn
+        if 'eda' in cols_lower:
+            features['mean_eda'] = _safe_mean(raw_signals[cols_lower['eda']])
+        if 'hr' in cols_lower:
+            features['hr'] = _safe_mean(raw_signals[cols_lower['hr']])
+        if 'hrv' in cols_lower:
+            features['hrv'] = _safe_mean(raw_signals[cols_lower['hrv']])
+        elif 'rr' in cols_lower:  # przybliżenie HRV ze zmienności RR
+            features['hrv'] = _std(raw_signals[cols_lower['rr']])
+        if 'temp' in cols_lower:
+            features['temp'] = _safe_mean(raw_signals[cols_lower['temp']])
+        # akcelerometr może mieć wiele osi; spróbuj ACC_X, ACC_Y, ACC_Z lub ACC
+        acc_candidates = [c for c in raw_signals.columns if str(c).lower().startswith('acc')]
+        if len(acc_candidates) > 1:
+            # RMS po osiach dla każdego wiersza, potem średnia (globalna)
+            try:
+                features['acc_rms'] = _acc_magnitude_rms(raw_signals[acc_candidates].to_numpy(dtype=np.float64, na_value=np.nan))
+            except Exception:
+                pass
+        elif acc_candidates:
+            features['acc_rms'] = _rms(raw_signals[acc_candidates[0]])
+        return features
+
     # Jeżeli to nie jest dict, spróbujemy potraktować jako pojedynczy kontener sygnałów
-    # i zeskalować przez iterację po sub-kanałach (DataFrame/Series/list/ndarray)
     if not isinstance(raw_signals, dict):
-        # potraktuj jak jedną lokację bez nazw kanałów – jeśli DataFrame, obsłużymy kolumny
-        try:
-            import pandas as _pd
-            if isinstance(raw_signals, _pd.DataFrame):
-                # już obsłużone na początku – zwróć wynik
-                return features
-        except Exception:
-            pass
-        # nie wiemy jak nazwać kanał – spróbuj użyć RMS/mean tam gdzie ma sens
+        # nie wiemy jak nazwać kanał – spróbuj użyć średniej
         maybe = _safe_mean(raw_signals)
         if maybe is not None and features['mean_eda'] is None:
             features['mean_eda'] = maybe
         return features
 
-    # uniwersalny, rekurencyjny iterator po drzewie sygnałów
-    def _iter_channels(obj, path=""):
-        try:
-            import numpy as _np
-            import pandas as _pd
-        except Exception:
-            _np = None
-            _pd = None
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                new_path = f"{path}/{k}" if path else str(k)
-                yield from _iter_channels(v, new_path)
-        else:
-            # liść: DataFrame/Series/list/tuple/ndarray lub pojedyncza wartość
-            try:
-                if _pd is not None and isinstance(obj, _pd.DataFrame):
-                    for col in obj.columns:
-                        yield (f"{path}:{col}", obj[col])
-                    return
-                if _pd is not None and isinstance(obj, _pd.Series):
-                    yield (path, obj)
-                    return
-            except Exception:
-                pass
-            try:
-                if isinstance(obj, (list, tuple)):
-                    yield (path, obj)
-                    return
-            except Exception:
-                pass
-            try:
-                if _np is not None and isinstance(obj, _np.ndarray):
-                    yield (path, obj)
-                    return
-            except Exception:
-                pass
-            # fallback – pojedyncza wartość
-            yield (path, [obj])
+    channels = _match_feature_channels(raw_signals)
+    features['mean_eda'] = _safe_mean(channels.get('mean_eda'))
+    features['hr'] = _safe_mean(channels.get('hr'))
+    if 'hrv' in channels:
+        features['hrv'] = _safe_mean(channels['hrv'])
+    elif 'rr' in channels:
+        # przybliż HRV z RR jako odchylenie standardowe
+        features['hrv'] = _std(channels['rr'])
+    features['temp'] = _safe_mean(channels.get('temp'))
+    if 'acc' in channels:
+        features['acc_rms'] = _acc_magnitude_rms(channels['acc'])
+    return features
+
+
+def _iter_signal_channels(obj, path=""):
+    """Uniwersalny, rekurencyjny iterator po drzewie sygnałów — zwraca pary (ścieżka, wartości)."""
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            new_path = f"{path}/{k}" if path else str(k)
+            yield from _iter_signal_channels(v, new_path)
+    elif isinstance(obj, pd.DataFrame):
+        for col in obj.columns:
+            yield (f"{path}:{col}", obj[col])
+    elif isinstance(obj, (pd.Series, list, tuple, np.ndarray)):
+        yield (path, obj)
+    else:
+        # fallback – pojedyncza wartość
+        yield (path, [obj])
 
-    # Zbieraj kandydatów i specjalnie potraktuj ACC (może mieć wiele osi)
+
+def _match_feature_channels(raw_signals):
+    """Dopasowuje kanały drzewa sygnałów do cech (heurystyki po nazwach, pierwszy niepusty kanał wygrywa).
+
+    Zwraca dict z tablicami float64 pod kluczami: 'mean_eda', 'hr', 'hrv', 'rr', 'temp', 'acc'.
+    'acc' to tablica 1-D, (N, k) albo lista osi 1-D przyciętych do wspólnej długości.
+    """
+    channels = {}
     acc_axes = {}
-    for name, values in _iter_channels(raw_signals):
+
+    def _take(key, values):
+        arr = _as_float_array(values)
+        if arr is not None and arr.size:
+            channels[key] = arr
+
+    for name, values in _iter_signal_channels(raw_signals):
         lname = (name or "").lower()
         # heurystyki dopasowania nazw
-        if 'eda' in lname and features['mean_eda'] is None:
-            features['mean_eda'] = _safe_mean(values)
+        if 'eda' in lname and 'mean_eda' not in channels:
+            _take('mean_eda', values)
             continue
         if (lname == 'hr') or ('/hr' in lname) or (':hr' in lname) or (' heartrate' in lname) or lname.endswith('/hr'):
-            if features['hr'] is None:
-                features['hr'] = _safe_mean(values)
+            if 'hr' not in channels:
+                _take('hr', values)
             continue
-        if 'hrv' in lname and features['hrv'] is None:
-            features['hrv'] = _safe_mean(values)
+        if 'hrv' in lname and 'hrv' not in channels and 'rr' not in channels:
+            _take('hrv', values)
             continue
-        if re.search(r'(^|[/:_\-])rr($|[/:_\-])', lname) and features['hrv'] is None:
-            # przybliż HRV z RR jako odchylenie standardowe
-            try:
-                seq = list(values) if not hasattr(values, 'tolist') else values.tolist()
-                seq = [float(x) for x in seq if x is not None]
-                if len(seq) > 1:
-                    m = sum(seq)/len(seq)
-                    var = sum((x-m)**2 for x in seq)/(len(seq)-1)
-                    features['hrv'] = math.sqrt(var)
-            except Exception:
-                pass
+        if re.search(r'(^|[/:_\-])rr($|[/:_\-])', lname) and 'hrv' not in channels and 'rr' not in channels:
+            _take('rr', values)
             continue
-        if 'temp' in lname and features['temp'] is None:
-            features['temp'] = _safe_mean(values)
+        if 'temp' in lname and 'temp' not in channels:
+            _take('temp', values)
             continue
         if 'acc' in lname:
             # spróbuj zebrać osie (x/y/z) do wspólnego RMS
-            axis = None
             m = re.search(r'acc[^a-z0-9]?([xyz])', lname)
+            arr = _as_float_array(values)
+            if arr is None or not arr.size:
+                continue
             if m:
-                axis = m.group(1)
-            try:
-                seq = list(values) if not hasattr(values, 'tolist') else values.tolist()
-                seq = [float(x) for x in seq if x is not None]
-                if axis:
-                    acc_axes[axis] = seq
-                else:
-                    # pojedynczy kanał acc — policz rms bez osi
-                    if features['acc_rms'] is None:
-                        features['acc_rms'] = _rms(seq)
-            except Exception:
-                pass
+                acc_axes[m.group(1)] = arr.ravel()
+            elif 'acc' not in channels:
+                # kanał acc bez osi w nazwie: (N, 3) jak w WESAD -> RMS po osiach, 1-D -> zwykły RMS
+                channels['acc'] = arr if (arr.ndim == 2 and arr.shape[1] > 1) else arr.ravel()
 
-    # jeśli mamy wiele osi akcelerometru i jeszcze nie policzono acc_rms
-    if features['acc_rms'] is None and len(acc_axes) >= 2:
-        # znajdź minimalną wspólną długość i policz RMS po osiach dla każdej próbki
-        try:
-            L = min(len(v) for v in acc_axes.values() if isinstance(v, list) and v)
-            if L and L > 0:
-                axes = [acc_axes.get('x'), acc_axes.get('y'), acc_axes.get('z')]
-                axes = [a for a in axes if isinstance(a, list) and a]
-                if axes:
-                    rms_seq = []
-                    for i in range(L):
-                        s = 0.0
-                        c = 0
-                        for a in axes:
-                            try:
-                                v = float(a[i])
-                                s += v*v
-                                c += 1
-                            except Exception:
-                                pass
-                        if c:
-                            rms_seq.append(math.sqrt(s / c))
-                    if rms_seq:
-                        features['acc_rms'] = _safe_mean(rms_seq)
-        except Exception:
-            pass
+    # jeśli mamy wiele osi akcelerometru i brak kanału ACC bez osi
+    if 'acc' not in channels and len(acc_axes) >= 2:
+        axes = [acc_axes[a] for a in ('x', 'y', 'z') if a in acc_axes]
+        if axes:
+            # przytnij do minimalnej wspólnej długości
+            L = min(a.size for a in axes)
+            channels['acc'] = [a[:L] for a in axes]
+    return channels
 
-    return features
+
+# Zmiana wyniku (w punktach) między początkiem a końcem historii, powyżej której trend nie jest 'stabilny'
+STRESS_TREND_DELTA = 10
+# Górny limit liczby okien historii w jednym żądaniu
+STRESS_MAX_WINDOWS = 500
+
+
+def _window_edges(ref_len, windows, window_size, start=None, end=None):
+    """Granice (w próbkach kanału referencyjnego) ostatnich `windows` okien o rozmiarze `window_size` w zakresie start:end.
+
+    window_size=None oznacza jedno okno obejmujące cały zakres.
+    """
+    start, end, _ = slice(start, end).indices(ref_len)
+    if end <= start:
+        return np.empty(0, dtype=np.int64)
+    if not window_size or window_size <= 0:
+        return np.array([start, end], dtype=np.int64)
+    count = min(int(windows), (end - start) // int(window_size))
+    if count <= 0:
+        return np.array([start, end], dtype=np.int64)
+    return end - int(window_size) * np.arange(count, -1, -1, dtype=np.int64)
+
+
+def _window_reduce(x, edges, with_squares=False):
+    """Sumy (i opcjonalnie sumy kwadratów) oraz liczności wartości nie-NaN w oknach — jedno przejście cumsum."""
+    valid = ~np.isnan(x)
+    xz = np.where(valid, x, 0.0)
+    counts = np.concatenate(([0], np.cumsum(valid, dtype=np.int64)))
+    sums = np.concatenate(([0.0], np.cumsum(xz)))
+    n = counts[edges[1:]] - counts[edges[:-1]]
+    s1 = sums[edges[1:]] - sums[edges[:-1]]
+    if not with_squares:
+        return s1, n, None
+    sq = np.concatenate(([0.0], np.cumsum(xz * xz)))
+    return s1, n, sq[edges[1:]] - sq[edges[:-1]]
+
+
+def _acc_magnitude(axes):
+    """RMS po osiach dla każdej próbki (NaN w osi jest pomijany; próbka bez wartości -> NaN)."""
+    if isinstance(axes, (list, tuple)):
+        cols = axes
+    elif axes.ndim == 1:
+        return np.abs(axes)
+    else:
+        cols = [axes[:, i] for i in range(axes.shape[1])]
+    sq = np.zeros(len(cols[0]))
+    cnt = np.zeros(len(cols[0]))
+    for c in cols:
+        valid = ~np.isnan(c)
+        sq += np.where(valid, c * c, 0.0)
+        cnt += valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(sq / cnt)
+
+
+@_timed_phase('features')
+def _windowed_features(raw_signals, windows, window_size, start=None, end=None):
+    """Cechy (mean_eda, hr, hrv, temp, acc_rms) dla wielu okien w jednym, wektorowym przejściu.
+
+    Okna są liczone w próbkach najdłuższego dopasowanego kanału (referencja, np. 700 Hz w WESAD)
+    i przeskalowywane proporcjonalnie do długości kanałów o innej częstotliwości. Średnie i RMS
+    pochodzą z różnic sum skumulowanych, a HRV z RR — z sum kwadratów (odchylenie ddof=1).
+    Zwraca listę {'start_sample', 'end_sample', 'features'} od najstarszego okna; granice są
+    indeksami próbek kanału referencyjnego (nie sekundami).
+    """
+    channels = _match_feature_channels(raw_signals) if isinstance(raw_signals, dict) else {}
+    if not channels:
+        return []
+
+    def _length(v):
+        return len(v[0]) if isinstance(v, (list, tuple)) else v.shape[0]
+
+    ref_len = max(_length(v) for v in channels.values())
+    edges = _window_edges(ref_len, windows, window_size, start, end)
+    if edges.size < 2:
+        return []
+    count = edges.size - 1
+    out = {k: np.full(count, np.nan) for k in ('mean_eda', 'hr', 'hrv', 'temp', 'acc_rms')}
+
+    for key, values in channels.items():
+        L = _length(values)
+        ch_edges = (edges * L) // ref_len
+        lo, hi = int(ch_edges[0]), int(ch_edges[-1])
+        local = ch_edges - lo
+        if key == 'acc':
+            sl = [a[lo:hi] for a in values] if isinstance(values, (list, tuple)) else values[lo:hi]
+            x = _acc_magnitude(sl)
+        else:
+            x = values[lo:hi]
+            if x.ndim > 1:
+                x = x.reshape(x.shape[0], -1)
+                x = x[:, 0] if x.shape[1] == 1 else np.nanmean(x, axis=1)
+        s1, n, s2 = _window_reduce(x, local, with_squares=(key == 'rr'))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if key == 'rr':
+                var = (s2 - s1 * s1 / n) / (n - 1)
+                out['hrv'] = np.where(n > 1, np.sqrt(np.maximum(var, 0.0)), np.nan)
+            else:
+                target = 'acc_rms' if key == 'acc' else key
+                out[target] = np.where(n > 0, s1 / n, np.nan)
+
+    result = []
+    for i in range(count):
+        feats = {k: (None if np.isnan(v[i]) else float(v[i])) for k, v in out.items()}
+        result.append({'start_sample': int(edges[i]), 'end_sample': int(edges[i + 1]), 'features': feats})
+    return result
+
+
+def _stress_trend(scores):
+    """Trend historii wyników: 'rosnący' / 'malejący' / 'stabilny' (nachylenie prostej MNK)."""
+    ys = np.array([s for s in scores if s is not None], dtype=np.float64)
+    if ys.size < 2:
+        return 'stabilny'
+    slope = np.polyfit(np.arange(ys.size, dtype=np.float64), ys, 1)[0]
+    delta = slope * (ys.size - 1)
+    if delta > STRESS_TREND_DELTA:
+        return 'rosnący'
+    if delta < -STRESS_TREND_DELTA:
+        return 'malejący'
+    return 'stabilny'
 
 
 def get_data_dir():
@@ -327,6 +623,7 @@ def get_data_dir():
     # zwróć ścieżkę relatywną do projektu
     return os.path.join(BASE_DIR, DATA_DIR_CANDIDATES[0])
 
+@_timed_phase('unpickle')
 def _safe_pickle_load(f, allow_unpickle=True):
     """Próbuje bezpiecznie załadować pickle.
 
@@ -357,33 +654,496 @@ def make_json_safe(d):
         elif isinstance(v, float) and (np.isnan(v) or np.isinf(v)):
             d[k] = None
 
-def load_participant_features(subject_id):
-    csv_path = f"data/S{subject_id}.csv"
-    if not os.path.exists(csv_path):
+# Katalog z tabelami cech per uczestnik (S{n}.csv) — niezależny od bieżącego katalogu roboczego
+FEATURES_DIR = os.environ.get('FEATURES_DIR') or os.path.join(BASE_DIR, 'data')
+FEATURE_COLUMNS = ('mean_eda', 'temp', 'emg', 'acc_rms', 'hr', 'hrv')
+_FEATURE_TABLES = {}  # ścieżka CSV -> (tożsamość pliku, {subject: {'rows': DataFrame, 'first': dict}})
+_FEATURE_TABLES_LOCK = threading.Lock()
+_FEATURE_TABLES_STATS = {'hits': 0, 'misses': 0}
+
+
+def _features_csv_path(subject_id):
+    return os.path.join(FEATURES_DIR, f"S{subject_id}.csv")
+
+
+def _parse_feature_table(csv_path):
+    """Parsuje CSV cech (kolumny liczbowe jako float64) i indeksuje go po subjectach."""
+    # float64 z dokładnym parsowaniem (round_trip), nie float32: progi klasyfikacji mają 6 miejsc
+    # po przecinku, a API ma zwracać dokładnie te wartości, które są w CSV
+    df = pd.read_csv(csv_path, sep=',', dtype={c: 'float64' for c in FEATURE_COLUMNS}, float_precision='round_trip')
+    by_subject = {}
+    if 'subject' not in df.columns:
+        return by_subject
+    for subject, rows in df.groupby('subject', sort=False):
+        rows = rows.reset_index(drop=True)
+        row = rows.iloc[0]
+        by_subject[str(subject)] = {
+            'rows': rows,
+            'first': {
+                'mean_eda': float(row['mean_eda']),
+                'temp': float(row['temp']),
+                'emg': float(row['emg']) if row['emg'] else 0.0,
+                'acc_rms': float(row['acc_rms']),
+                'hr': float(row['hr']),
+                'hrv': float(row['hrv']),
+                'state': row['state'],
+            },
+        }
+    return by_subject
+
+
+def _feature_table_entry(subject_id):
+    """Zwraca wpis tabeli cech dla uczestnika; CSV jest parsowany ponownie tylko gdy zmienił się na dysku."""
+    csv_path = _features_csv_path(subject_id)
+    try:
+        ident = _file_identity(csv_path)
+    except OSError:
         raise FileNotFoundError(f"CSV for subject S{subject_id} not found")
 
-    df = pd.read_csv(csv_path, sep=',')  # tab-separated
-    subj_rows = df[df['subject'] == f'S{subject_id}']
-
-    if subj_rows.empty:
+    with _FEATURE_TABLES_LOCK:
+        cached = _FEATURE_TABLES.get(csv_path)
+        if cached is not None and cached[0] == ident:
+            _FEATURE_TABLES_STATS['hits'] += 1
+            table = cached[1]
+        else:
+            table = None
+            _FEATURE_TABLES_STATS['misses'] += 1
+    if table is None:
+        table = _parse_feature_table(csv_path)
+        with _FEATURE_TABLES_LOCK:
+            _FEATURE_TABLES[csv_path] = (ident, table)
+
+    entry = table.get(f'S{subject_id}')
+    if entry is None:
         raise ValueError(f"No data for subject S{subject_id}")
+    return entry
 
-    row = subj_rows.iloc[0]
 
-    features = {
-        'mean_eda': float(row['mean_eda']),
-        'temp': float(row['temp']),
-        'emg': float(row['emg']) if row['emg'] else 0.0,
-        'acc_rms': float(row['acc_rms']),
-        'hr': float(row['hr']),
-        'hrv': float(row['hrv']),
-        'state': row['state']
-    }
+def load_participant_feature_rows(subject_id):
+    """Zwraca wiersze (okna) cech uczestnika z S{id}.csv jako DataFrame (współdzielony — nie modyfikować)."""
+    return _feature_table_entry(subject_id)['rows']
 
-    print(f"[DEBUG] Features for subject S{subject_id}: {features}")  # <-- print here
 
+def load_participant_features(subject_id):
+    features = dict(_feature_table_entry(subject_id)['first'])
+    app.logger.debug("Features for subject S%s: %s", subject_id, features)
     return features
 
+
+def _estimate_nbytes(obj, _depth=0):
+    """Przybliżony rozmiar obiektu w pamięci (ndarray/pandas liczone po buforach danych)."""
+    if _depth > 20:
+        return 0
+    try:
+        if isinstance(obj, np.ndarray):
+            return int(obj.nbytes)
+        if isinstance(obj, pd.DataFrame):
+            return int(obj.memory_usage(index=True, deep=False).sum())
+        if isinstance(obj, pd.Series):
+            return int(obj.memory_usage(index=True, deep=False))
+        if isinstance(obj, dict):
+            return sys.getsizeof(obj) + sum(_estimate_nbytes(k, _depth + 1) + _estimate_nbytes(v, _depth + 1) for k, v in obj.items())
+        if isinstance(obj, (list, tuple)):
+            return sys.getsizeof(obj) + sum(_estimate_nbytes(v, _depth + 1) for v in obj)
+        return sys.getsizeof(obj)
+    except Exception:
+        return 0
+
+
+def _file_identity(path):
+    """Zwraca (realpath, mtime_ns, size) pliku — klucz cache zmieniający się razem z plikiem."""
+    real = os.path.realpath(path)
+    st = os.stat(real)
+    return (real, st.st_mtime_ns, st.st_size)
+
+
+class _LRUCache:
+    """Prosty, wątkowo-bezpieczny cache LRU z limitem bajtów i licznikami hit/miss/eviction.
+
+    Klucz to tożsamość pliku (path, mtime, size); zmiana pliku na dysku daje nowy klucz,
+    a stary wpis dla tej samej ścieżki jest usuwany przy kolejnym wstawieniu.
+    """
+
+    def __init__(self, max_bytes, sizeof=_estimate_nbytes):
+        self.max_bytes = int(max_bytes)
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (value, nbytes)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, count_miss=True):
+        """count_miss=False: ponowne sprawdzenie tego samego klucza nie liczy drugiego missa."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        nbytes = self._sizeof(value)
+        with self._lock:
+            # usuń nieaktualne wersje tego samego pliku (inne mtime/size)
+            for k in [k for k in self._items if k[0] == key[0] and k != key]:
+                self._bytes -= self._items.pop(k)[1]
+                self.invalidations += 1
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            if nbytes > self.max_bytes:
+                # obiekt większy niż cały budżet — nie cache'ujemy
+                return value
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._items:
+                _, (_, evicted_bytes) = self._items.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+_PICKLE_CACHE = _LRUCache(PICKLE_CACHE_MAX_BYTES)
+
+
+class _SingleFlight:
+    """Łączy równoległe wywołania dla tego samego klucza: jeden wątek wykonuje pracę, reszta czeka na jej wynik."""
+
+    class _Call:
+        __slots__ = ('event', 'result', 'error')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = self._Call()
+                self.executed += 1
+                leader = True
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+# równoległe żądania o ten sam plik czekają na jeden unpickling zamiast robić własny
+_LOAD_FLIGHT = _SingleFlight()
+
+
+# ===================== METRYKI (Prometheus) =====================
+# Middleware zlicza per trasa (szablon reguły, np. /participant/<subject_id>): histogram czasu odpowiedzi,
+# histogram rozmiaru odpowiedzi, żądania w toku i błędy; /metrics zwraca je razem ze statystykami cache
+# w formacie tekstowym Prometheusa. Koszt na żądanie: jeden lock i kilka operacji na słownikach.
+METRICS_ENABLED = os.environ.get('METRICS', '1').lower() not in ('0', 'false')
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Histogram:
+    """Histogram w stylu Prometheusa: liczniki kubełków (niekumulowane do czasu eksportu), suma i liczba."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        acc = 0
+        for bound, c in zip(self.bounds, self.counts):
+            acc += c
+            lines.append(f'{name}_bucket{_prom_labels(labels, le=_prom_number(bound))} {acc}')
+        lines.append(f'{name}_bucket{_prom_labels(labels, le="+Inf")} {self.count}')
+        lines.append(f'{name}_sum{_prom_labels(labels)} {_prom_number(self.sum)}')
+        lines.append(f'{name}_count{_prom_labels(labels)} {self.count}')
+        return lines
+
+
+def _prom_number(v):
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+def _prom_labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    esc = (lambda s: str(s).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in items) + '}'
+
+
+class _Metrics:
+    """Wątkowo-bezpieczny rejestr metryk HTTP i czasu ładowania pickli."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}   # (route, method, status) -> liczba
+        self.errors = {}     # (route, method, '4xx'|'5xx') -> liczba
+        self.latency = {}    # (route, method) -> _Histogram
+        self.sizes = {}      # (route, method) -> _Histogram
+        self.in_flight = {}  # route -> liczba
+        self.loads = _Histogram(METRICS_LATENCY_BUCKETS)
+
+    def start(self, route):
+        with self._lock:
+            self.in_flight[route] = self.in_flight.get(route, 0) + 1
+
+    def finish(self, route, method, status, seconds, nbytes):
+        key = (route, method)
+        with self._lock:
+            self.in_flight[route] = self.in_flight.get(route, 1) - 1
+            rkey = (route, method, status)
+            self.requests[rkey] = self.requests.get(rkey, 0) + 1
+            if status >= 400:
+                ekey = (route, method, f'{status // 100}xx')
+                self.errors[ekey] = self.errors.get(ekey, 0) + 1
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = _Histogram(METRICS_LATENCY_BUCKETS)
+                self.sizes[key] = _Histogram(METRICS_SIZE_BUCKETS)
+            hist.observe(seconds)
+            if nbytes is not None:
+                self.sizes[key].observe(nbytes)
+
+    def observe_load(self, seconds):
+        with self._lock:
+            self.loads.observe(seconds)
+
+    def render(self):
+        out = []
+        with self._lock:
+            out.append('# HELP wesad_http_requests_total Liczba obsłużonych żądań HTTP.')
+            out.append('# TYPE wesad_http_requests_total counter')
+            for (route, method, status), n in sorted(self.requests.items()):
+                out.append(f'wesad_http_requests_total{_prom_labels({"route": route, "method": method, "status": status})} {n}')
+            out.append('# HELP wesad_http_request_errors_total Liczba odpowiedzi z kodem 4xx/5xx.')
+            out.append('# TYPE wesad_http_request_errors_total counter')
+            for (route, method, cls), n in sorted(self.errors.items()):
+                out.append(f'wesad_http_request_errors_total{_prom_labels({"route": route, "method": method, "class": cls})} {n}')
+            out.append('# HELP wesad_http_requests_in_flight Żądania w toku (strumienie liczą się do zamknięcia).')
+            out.append('# TYPE wesad_http_requests_in_flight gauge')
+            for route, n in sorted(self.in_flight.items()):
+                out.append(f'wesad_http_requests_in_flight{_prom_labels({"route": route})} {n}')
+            out.append('# HELP wesad_http_request_duration_seconds Czas obsługi żądania (do wysłania ostatniego bajtu).')
+            out.append('# TYPE wesad_http_request_duration_seconds histogram')
+            for (route, method), hist in sorted(self.latency.items()):
+                out.extend(hist.render('wesad_http_request_duration_seconds', {'route': route, 'method': method}))
+            out.append('# HELP wesad_http_response_size_bytes Rozmiar treści odpowiedzi (po kompresji).')
+            out.append('# TYPE wesad_http_response_size_bytes histogram')
+            for (route, method), hist in sorted(self.sizes.items()):
+                out.extend(hist.render('wesad_http_response_size_bytes', {'route': route, 'method': method}))
+            out.append('# HELP wesad_pickle_load_duration_seconds Czas odpicklowania pliku uczestnika (chybienia cache).')
+            out.append('# TYPE wesad_pickle_load_duration_seconds histogram')
+            out.extend(self.loads.render('wesad_pickle_load_duration_seconds', {}))
+        return out
+
+
+_METRICS = _Metrics()
+
+
+def _counted_stream(chunks, box):
+    """Przepuszcza fragmenty strumienia, sumując ich rozmiar w box[0]."""
+    try:
+        for chunk in chunks:
+            box[0] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+# Hooki metryk i Server-Timing są rejestrowane przed _compress_response, więc after_request widzi już
+# skompresowaną odpowiedź (Flask wywołuje after_request w odwrotnej kolejności rejestracji).
+@app.before_request
+def _metrics_before():
+    if METRICS_ENABLED:
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        g._metrics = (route, time.perf_counter())
+        _METRICS.start(route)
+
+
+@app.after_request
+def _metrics_after(resp):
+    state = g.pop('_metrics', None)
+    if state is None:
+        return resp
+    route, t0 = state
+    method, status = request.method, resp.status_code
+    if resp.is_streamed and not resp.direct_passthrough:
+        box = [0]
+        resp.response = _counted_stream(resp.response, box)
+        size = lambda: box[0]
+    else:
+        nbytes = resp.content_length
+        size = lambda: nbytes
+    # czas i rozmiar liczone do zamknięcia odpowiedzi przez serwer — obejmuje wysyłkę strumieni
+    resp.call_on_close(lambda: _METRICS.finish(route, method, status, time.perf_counter() - t0, size()))
+    return resp
+
+
+@app.teardown_request
+def _metrics_teardown(exc):
+    # wyjątek przepuszczony poza Flaska (np. PROPAGATE_EXCEPTIONS) — after_request się nie wykonał
+    state = g.pop('_metrics', None)
+    if state is not None:
+        route, t0 = state
+        _METRICS.finish(route, request.method, 500, time.perf_counter() - t0, None)
+
+
+@app.before_request
+def _timing_before():
+    if SERVER_TIMING_ENABLED or TIMING_LOG_ENABLED:
+        g._request_t0 = time.perf_counter()
+
+
+@app.after_request
+def _timing_after(resp):
+    t0 = g.pop('_request_t0', None)
+    if t0 is None:
+        return resp
+    # dla odpowiedzi strumieniowych `total` to czas do wysłania nagłówków — reszta idzie już w treści
+    total = time.perf_counter() - t0
+    timings = g.pop('_timings', None)
+    phases = timings['phases'] if timings else {}
+    if SERVER_TIMING_ENABLED:
+        resp.headers['Server-Timing'] = _server_timing_header(phases, total)
+    if TIMING_LOG_ENABLED:
+        _TIMING_LOGGER.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule is not None else None,
+            'status': resp.status_code,
+            'total_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(sec * 1000, 3) for name, sec in phases.items()},
+        }, ensure_ascii=False))
+    return resp
+
+
+# liczniki z poniższych statystyk eksportowane jako counter (z sufiksem _total), pozostałe jako gauge
+_METRICS_COUNTER_KEYS = frozenset({'hits', 'misses', 'evictions', 'invalidations', 'expired', 'executed', 'coalesced',
+                                   'admitted', 'rejected', 'timeouts', 'created', 'reused', 'retries'})
+
+
+def _stats_metrics():
+    """Statystyki cache/bramki/puli czatu (te same co w /cache_stats) jako linie Prometheusa."""
+    with _SUBJECT_INDEX_LOCK:
+        index_stats = dict(_SUBJECT_INDEX_STATS)
+    with _FEATURE_TABLES_LOCK:
+        feature_stats = dict(_FEATURE_TABLES_STATS, entries=len(_FEATURE_TABLES))
+    sources = (
+        ('pickle_cache', _PICKLE_CACHE.stats()),
+        ('single_flight', _LOAD_FLIGHT.stats()),
+        ('subject_index', index_stats),
+        ('feature_tables', feature_stats),
+        ('chat_cache', _CHAT_CACHE.stats()),
+        ('chat_gate', _CHAT_GATE.stats()),
+        ('chat_pool', _CHAT_HTTP.stats()),
+    )
+    out = []
+    for source, stats in sources:
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in _METRICS_COUNTER_KEYS:
+                name, kind = f'wesad_{source}_{key}_total', 'counter'
+            else:
+                name, kind = f'wesad_{source}_{key}', 'gauge'
+            out.append(f'# TYPE {name} {kind}')
+            out.append(f'{name} {_prom_number(value)}')
+    return out
+
+
+def _load_pickle_cached(pkl_path, allow_unpickle=True):
+    """Ładuje plik .pkl przez cache LRU. Kolejne wywołania dla niezmienionego pliku nie robią unpicklingu,
+    a równoległe wywołania dla tego samego pliku współdzielą jedno ładowanie."""
+    if not allow_unpickle:
+        # zachowaj komunikat z _safe_pickle_load
+        return _safe_pickle_load(None, allow_unpickle=False)
+    key = _file_identity(pkl_path)
+    cached = _PICKLE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    def _load():
+        # poprzedni lider mógł skończyć między sprawdzeniem cache a wejściem do single-flight
+        cached = _PICKLE_CACHE.get(key, count_miss=False)
+        if cached is not None:
+            return cached
+        t0 = time.perf_counter()
+        with open(pkl_path, 'rb') as f:
+            obj = _safe_pickle_load(f, allow_unpickle=allow_unpickle)
+        _METRICS.observe_load(time.perf_counter() - t0)
+        return _PICKLE_CACHE.put(key, obj)
+
+    # oczekiwanie na cudze ładowanie tego samego pliku też jest czasem unpicklingu dla tego żądania
+    with _Phase('unpickle'):
+        return _LOAD_FLIGHT.do(key, _load)
+
+
+@_timed_phase('resolve')
 def load_participant_data(subject_id):
     """Wczytuje dane uczestnika z obsługą kompatybilności pickle (Py2 -> Py3)."""
     data_dir = get_data_dir()
@@ -391,19 +1151,13 @@ def load_participant_data(subject_id):
     # powinien przekazać allow_unpickle=False (lub endpoint sprawdzi uprawnienia przed wywołaniem)
     allow_unpickle = True
     target_name = f'S{subject_id}'
-    # 1) próba dedykowanego pliku
+    # 1) dedykowany plik S{id}.pkl albo S{id}*.pkl (katalog danych, potem DATA_DIR_CANDIDATES) — ten sam
+    # wybór co w _find_participant_pkl, więc ETag i piramida odnoszą się do pliku, który faktycznie ładujemy
+    found = _find_participant_pkl(subject_id)
+    if found:
+        return _load_pickle_cached(found, allow_unpickle=allow_unpickle)
 
     pkl_path = os.path.join(data_dir, f'{target_name}.pkl')
-    if os.path.exists(pkl_path):
-        with open(pkl_path, 'rb') as f:
-            return _safe_pickle_load(f, allow_unpickle=allow_unpickle)
-
-    # 2) spróbuj dopasować wzorzec S{subject_id}*.pkl
-    matches = glob.glob(os.path.join(data_dir, f'{target_name}*.pkl'))
-    if matches:
-        with open(matches[0], 'rb') as f:
-            return _safe_pickle_load(f, allow_unpickle=allow_unpickle)
-    
     sv_path = os.path.join(data_dir, f'{target_name}.csv')
     if os.path.exists(csv_path):
         # Load CSV
@@ -412,38 +1166,13 @@ def load_participant_data(subject_id):
         df.to_pickle(pkl_path)
         return df
 
-    # 3) jeśli nie znaleziono w bieżącym katalogu danych, spróbuj przeszukać
-    # pozostałe kandydackie katalogi (DATA_DIR_CANDIDATES), np. S2, S3.
-    for cand in DATA_DIR_CANDIDATES:
-        # znormalizuj ścieżkę względem BASE_DIR jeśli nie jest absolutna
-        cand_path = cand if os.path.isabs(cand) else os.path.join(BASE_DIR, cand)
-        # pomiń już sprawdzany katalog
-        try:
-            if os.path.abspath(cand_path) == os.path.abspath(data_dir):
-                continue
-        except Exception:
-            pass
-        if not os.path.isdir(cand_path):
-            continue
-        # sprawdź dedykowany plik
-        alt_pkl = os.path.join(cand_path, f'{target_name}.pkl')
-        if os.path.exists(alt_pkl):
-            with open(alt_pkl, 'rb') as f:
-                return _safe_pickle_load(f, allow_unpickle=allow_unpickle)
-        # spróbuj dopasować wzorzec
-        alt_matches = glob.glob(os.path.join(cand_path, f'{target_name}*.pkl'))
-        if alt_matches:
-            with open(alt_matches[0], 'rb') as f:
-                return _safe_pickle_load(f, allow_unpickle=allow_unpickle)
-
-    # 3) jeśli powyżej nie ma — załaduj pierwszy plik .pkl w katalogu (np. S2.pkl) i wyszukaj w nim
-    all_pkls = glob.glob(os.path.join(data_dir, '*.pkl'))
+    # 2) jeśli powyżej nie ma — załaduj pierwszy plik .pkl w katalogu (np. S2.pkl) i wyszukaj w nim
+    all_pkls = sorted(glob.glob(os.path.join(data_dir, '*.pkl')))
     if not all_pkls:
         dir_contents = os.listdir(data_dir) if os.path.isdir(data_dir) else 'brak katalogu'
         raise FileNotFoundError(f'Brak plików .pkl w katalogu danych. Zawartość: {dir_contents}')
 
-    with open(all_pkls[0], 'rb') as f:
-        container = _safe_pickle_load(f, allow_unpickle=allow_unpickle)
+    container = _load_pickle_cached(all_pkls[0], allow_unpickle=allow_unpickle)
 
     # jeśli container jest dict i ma klucz typu 'S1' lub '1'
     if isinstance(container, dict):
@@ -484,6 +1213,741 @@ def load_participant_data(subject_id):
     # jeśli nic nie znaleziono — zwróć pomocniczy błąd z listą plików
     raise FileNotFoundError(f'Nie znaleziono danych dla {target_name} w plikach: {", ".join(os.path.basename(p) for p in all_pkls)}')
 
+# ===================== MAGAZYN KOLUMNOWY (.npy + manifest) =====================
+# `python app.py ingest` zamienia S{n}.pkl na katalog S{n}.columnar/ z jednym plikiem .npy
+# na kanał oraz manifest.json (dtype, shape, częstotliwość próbkowania). Odczyt przez
+# np.load(mmap_mode='r') dotyka tylko bajtów, które żądanie faktycznie wycina, i nie wymaga unpicklingu.
+COLUMNAR_SUFFIX = '.columnar'
+COLUMNAR_MANIFEST = 'manifest.json'
+# częstotliwości próbkowania WESAD (Hz); klatka piersiowa (RespiBAN) w całości 700 Hz
+WESAD_SAMPLING_RATES = {
+    'chest': {'*': 700},
+    'wrist': {'ACC': 32, 'BVP': 64, 'EDA': 4, 'TEMP': 4},
+    'label': 700,
+}
+_COLUMNAR_CACHE = {}  # ścieżka manifestu -> (tożsamość manifestu, dane)
+_COLUMNAR_LOCK = threading.Lock()
+
+
+def _sampling_rate(loc, ch_name=None):
+    rates = WESAD_SAMPLING_RATES.get(str(loc).lower())
+    if isinstance(rates, dict):
+        for k, v in rates.items():
+            if ch_name is not None and k.lower() == str(ch_name).lower():
+                return v
+        return rates.get('*')
+    return rates
+
+
+def _channel_filename(*parts):
+    return '__'.join(re.sub(r'[^A-Za-z0-9_.-]', '_', str(p)) for p in parts) + '.npy'
+
+
+def _save_channel(out_dir, fname, values, fs):
+    arr = np.asarray(values)
+    if arr.dtype == object:
+        raise ValueError(f'Kanał {fname} ma typ object — nie można zapisać jako .npy')
+    # zapis zawsze little-endian, żeby klient/mmap nie musiał zamieniać bajtów
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('<'))
+    np.save(os.path.join(out_dir, fname), arr, allow_pickle=False)
+    return {'file': fname, 'dtype': arr.dtype.str, 'shape': list(arr.shape), 'fs': fs}
+
+
+def ingest_pickle_to_columnar(pkl_path, out_dir=None):
+    """Konwertuje plik S{n}.pkl (struktura WESAD) do magazynu kolumnowego.
+
+    Zwraca ścieżkę katalogu z manifestem. Obsługuje {'subject', 'signal': {loc: {ch: array}}, 'label'}
+    oraz lokacje będące pojedynczą tablicą ({loc: array}).
+    """
+    real, mtime_ns, size = _file_identity(pkl_path)
+    if out_dir is None:
+        out_dir = os.path.splitext(real)[0] + COLUMNAR_SUFFIX
+    with open(real, 'rb') as f:
+        data = _safe_pickle_load(f)
+    if not isinstance(data, dict) or not isinstance(data.get('signal'), dict):
+        raise ValueError(f'{os.path.basename(real)}: oczekiwano dict z kluczem "signal"')
+
+    tmp_dir = f"{out_dir}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    signal = {}
+    for loc, loc_val in data['signal'].items():
+        if isinstance(loc_val, dict):
+            signal[str(loc)] = {}
+            for ch_name, ch_val in loc_val.items():
+                signal[str(loc)][str(ch_name)] = _save_channel(tmp_dir, _channel_filename(loc, ch_name), ch_val, _sampling_rate(loc, ch_name))
+        else:
+            signal[str(loc)] = _save_channel(tmp_dir, _channel_filename(loc), loc_val, _sampling_rate(loc))
+    manifest = {
+        'version': 1,
+        'subject': str(data.get('subject', os.path.splitext(os.path.basename(real))[0])),
+        'source': {'name': os.path.basename(real), 'mtime_ns': mtime_ns, 'size': size},
+        'signal': signal,
+    }
+    if data.get('label') is not None:
+        manifest['label'] = _save_channel(tmp_dir, _channel_filename('label'), data['label'], _sampling_rate('label'))
+    with open(os.path.join(tmp_dir, COLUMNAR_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+    # podmień katalog docelowy dopiero po zapisaniu całości
+    if os.path.isdir(out_dir):
+        import shutil
+        shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+    with _COLUMNAR_LOCK:
+        _COLUMNAR_CACHE.pop(os.path.join(out_dir, COLUMNAR_MANIFEST), None)
+    return out_dir
+
+
+def _open_columnar(store_dir):
+    """Otwiera magazyn kolumnowy jako strukturę jak z pickla (kanały to np.memmap). None gdy nieaktualny."""
+    manifest_path = os.path.join(store_dir, COLUMNAR_MANIFEST)
+    try:
+        ident = _file_identity(manifest_path)
+    except OSError:
+        return None
+    with _COLUMNAR_LOCK:
+        cached = _COLUMNAR_CACHE.get(manifest_path)
+    if cached is not None and cached[0] == ident:
+        manifest, data = cached[1]
+    else:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        def _open(spec):
+            return np.load(os.path.join(store_dir, spec['file']), mmap_mode='r', allow_pickle=False)
+
+        signal = {}
+        for loc, loc_spec in manifest.get('signal', {}).items():
+            if 'file' in loc_spec:
+                signal[loc] = _open(loc_spec)
+            else:
+                signal[loc] = {ch: _open(spec) for ch, spec in loc_spec.items()}
+        data = {'subject': manifest.get('subject'), 'signal': signal}
+        if manifest.get('label'):
+            data['label'] = _open(manifest['label'])
+        with _COLUMNAR_LOCK:
+            _COLUMNAR_CACHE[manifest_path] = (ident, (manifest, data))
+
+    # jeśli obok leży plik źródłowy i zmienił się od ingestu — magazyn jest nieaktualny
+    src = manifest.get('source', {})
+    src_path = os.path.join(os.path.dirname(os.path.realpath(store_dir)), src.get('name', ''))
+    if src.get('name') and os.path.exists(src_path):
+        _, mtime_ns, size = _file_identity(src_path)
+        if (mtime_ns, size) != (src.get('mtime_ns'), src.get('size')):
+            return None
+    return data
+
+
+def _data_dirs():
+    """Bieżący katalog danych, a po nim pozostałe DATA_DIR_CANDIDATES (bez duplikatów)."""
+    dirs = [get_data_dir()]
+    for cand in DATA_DIR_CANDIDATES:
+        dirs.append(cand if os.path.isabs(cand) else os.path.join(BASE_DIR, cand))
+    out, seen = [], set()
+    for d in dirs:
+        key = os.path.abspath(d)
+        if key not in seen:
+            seen.add(key)
+            out.append(d)
+    return out
+
+
+def _find_columnar_store(subject_id):
+    """Ścieżka katalogu S{id}.columnar (pierwszy znaleziony) albo None."""
+    for d in _data_dirs():
+        store = os.path.join(d, f'S{subject_id}' + COLUMNAR_SUFFIX)
+        if os.path.isfile(os.path.join(store, COLUMNAR_MANIFEST)):
+            return store
+    return None
+
+
+def _find_participant_pkl(subject_id):
+    """Ścieżka dedykowanego pliku S{id}.pkl / S{id}*.pkl (katalog danych, potem kandydaci) albo None."""
+    target_name = f'S{subject_id}'
+    for d in _data_dirs():
+        p = os.path.join(d, f'{target_name}.pkl')
+        if os.path.exists(p):
+            return p
+        matches = sorted(glob.glob(os.path.join(d, f'{target_name}*.pkl')))
+        if matches:
+            return matches[0]
+    return None
+
+
+def load_participant_columnar(subject_id):
+    """Szuka magazynu S{subject_id}.columnar w katalogu danych (i kandydatach). Zwraca dane lub None."""
+    for d in _data_dirs():
+        store = os.path.join(d, f'S{subject_id}' + COLUMNAR_SUFFIX)
+        if os.path.isdir(store):
+            try:
+                data = _open_columnar(store)
+            except (OSError, ValueError, KeyError):
+                data = None
+            if data is not None:
+                return data
+    return None
+
+
+# ===================== PIRAMIDA AGREGATÓW (zoom O(1)) =====================
+# Dla każdego kanału: agregaty min/max/suma/liczność w kubełkach 2^L próbek (L >= PYRAMID_BASE_LEVEL),
+# zapisane w S{n}.pyramid/ obok pliku źródłowego. Zapytanie resolution=<points> składa kubełki odpowiedzi
+# z pełnych kubełków poziomu i surowych próbek na brzegach, czytanych (mmap) z magazynu kolumnowego
+# S{n}.columnar/ — piramida nie duplikuje próbek, więc powstaje tylko dla uczestników po `ingest`.
+# Wynik jest identyczny z decymacją na bieżąco, a odczyt rośnie jak points*sqrt(span/points) zamiast span.
+PYRAMID_SUFFIX = '.pyramid'
+PYRAMID_MANIFEST = 'manifest.json'
+PYRAMID_BASE_LEVEL = 4
+# zmiana formatu plików piramidy -> starsze katalogi są przebudowywane
+PYRAMID_VERSION = 3
+# ile etykiet zapisać w manifeście (labels_sample bez ładowania danych)
+PYRAMID_LABELS_HEAD = 1000
+_PYRAMID_CACHE = {}  # ścieżka manifestu -> (tożsamość, manifest)
+_PYRAMID_LOCK = threading.Lock()
+# równoległe pierwsze zapytania resolution= budują piramidę raz (osobno od łączenia ładowań pickli)
+_PYRAMID_FLIGHT = _SingleFlight()
+
+
+def _participant_source(subject_id):
+    """(katalog, {'name', 'mtime_ns', 'size'}) pliku źródłowego uczestnika — bez ładowania danych."""
+    p = _find_participant_pkl(subject_id)
+    if p:
+        real, mtime_ns, size = _file_identity(p)
+        return os.path.dirname(real), {'name': os.path.basename(real), 'mtime_ns': mtime_ns, 'size': size}
+    store = _find_columnar_store(subject_id)
+    if store:
+        try:
+            with open(os.path.join(store, COLUMNAR_MANIFEST), 'r', encoding='utf-8') as f:
+                src = json.load(f).get('source')
+        except (OSError, ValueError):
+            src = None
+        if src:
+            return os.path.dirname(os.path.realpath(store)), src
+    return None, None
+
+
+def _pyramid_levels(arr):
+    """Buduje poziomy piramidy: {L: tablica (kubełki, 4, ...) z [min, max, suma, liczba nie-NaN]}.
+
+    Suma i liczność (zamiast średniej) pozwalają dokładnie złożyć kubełki dowolnego zakresu.
+    """
+    data = np.asarray(arr).astype(np.float64, copy=False)
+    if data.ndim == 0 or data.shape[0] == 0:
+        return {}
+    valid = ~np.isnan(data)
+    starts = np.arange(0, data.shape[0], 2 ** PYRAMID_BASE_LEVEL)
+    agg = np.stack([
+        np.fmin.reduceat(data, starts, axis=0),
+        np.fmax.reduceat(data, starts, axis=0),
+        np.add.reduceat(np.where(valid, data, 0.0), starts, axis=0),
+        np.add.reduceat(valid, starts, axis=0, dtype=np.float64),
+    ], axis=1)
+    levels = {}
+    level = PYRAMID_BASE_LEVEL
+    while True:
+        levels[level] = agg
+        m = agg.shape[0]
+        if m <= 1:
+            break
+        # kolejny poziom z par kubełków; nieparzysty ostatni kubełek przechodzi bez zmian
+        pairs = np.arange(0, m, 2)
+        agg = np.stack([
+            np.fmin.reduceat(agg[:, 0], pairs, axis=0),
+            np.fmax.reduceat(agg[:, 1], pairs, axis=0),
+            np.add.reduceat(agg[:, 2], pairs, axis=0),
+            np.add.reduceat(agg[:, 3], pairs, axis=0),
+        ], axis=1)
+        level += 1
+    return levels
+
+
+def _columnar_channel_files(columnar_dir):
+    """{nazwa kanału ('loc/ch' albo 'loc'): plik .npy} z manifestu magazynu kolumnowego."""
+    with open(os.path.join(columnar_dir, COLUMNAR_MANIFEST), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    files = {}
+    for loc, loc_spec in manifest.get('signal', {}).items():
+        if 'file' in loc_spec:
+            files[loc] = loc_spec['file']
+        else:
+            for ch, spec in loc_spec.items():
+                files[f'{loc}/{ch}'] = spec['file']
+    return files
+
+
+def build_participant_pyramid(subject_id, columnar_dir, out_dir, source):
+    """Zapisuje piramidę agregatów dla wszystkich numerycznych kanałów magazynu kolumnowego do out_dir.
+
+    Zapisywane są tylko poziomy zdecymowane. Brzegi kubełków niewyrównane do poziomu piramidy są przy
+    odczycie brane z plików .npy magazynu kolumnowego (manifest wskazuje je w `raw_store` / `raw`),
+    więc odpowiedź jest identyczna z decymacją na bieżąco.
+    """
+    data = _open_columnar(columnar_dir)
+    if data is None:
+        raise ValueError(f'Magazyn kolumnowy {columnar_dir} jest nieaktualny')
+    raw_files = _columnar_channel_files(columnar_dir)
+    raw_signals = data.get('signal', {})
+    channels = {}
+    layout = []
+    tmp_dir = f"{out_dir}.tmp{os.getpid()}.{threading.get_ident()}"
+    import shutil
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        def _add(name, loc, ch_name, values):
+            try:
+                arr = _binary_array(values)
+                if arr is None or arr.ndim == 0 or arr.shape[0] == 0:
+                    return
+                levels = _pyramid_levels(arr)
+            except Exception:
+                return
+            parts = [loc, ch_name] if ch_name is not None else [loc]
+            entry = {'location': str(loc), 'channel': None if ch_name is None else str(ch_name),
+                     'length': int(arr.shape[0]), 'raw': raw_files[name], 'levels': {}}
+            for level, agg in levels.items():
+                fname = _channel_filename(*parts, f'L{level}')
+                np.save(os.path.join(tmp_dir, fname), agg, allow_pickle=False)
+                entry['levels'][str(level)] = {'file': fname, 'buckets': int(agg.shape[0])}
+            channels[name] = entry
+
+        # kolejność lokalizacji i kanałów jak w danych — odpowiedź z piramidy ma ten sam układ
+        for loc, loc_val in raw_signals.items():
+            if isinstance(loc_val, dict):
+                layout.append([str(loc), [str(c) for c in loc_val]])
+                for ch_name, ch_val in loc_val.items():
+                    _add(f"{loc}/{ch_name}", loc, ch_name, ch_val)
+            else:
+                layout.append([str(loc), None])
+                _add(str(loc), loc, None, loc_val)
+        labels = data.get('label')
+        labels_head = _summarize_object(labels, n=PYRAMID_LABELS_HEAD).get('sample', []) if labels is not None else []
+        manifest = {
+            'version': PYRAMID_VERSION,
+            'subject': str(data.get('subject') or f'S{subject_id}'),
+            'source': source,
+            'raw_store': os.path.basename(os.path.normpath(columnar_dir)),
+            'base_level': PYRAMID_BASE_LEVEL,
+            'labels_head': labels_head,
+            'metadata_preview': _metadata_preview(data),
+            'layout': layout,
+            'channels': channels,
+        }
+        with open(os.path.join(tmp_dir, PYRAMID_MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, default=str)
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir)
+        os.replace(tmp_dir, out_dir)
+    finally:
+        # po udanym os.replace katalogu już nie ma; po błędzie zapisu nie zostawiamy śmieci
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return out_dir
+
+
+def _open_pyramid(subject_id):
+    """(katalog, manifest) aktualnej piramidy uczestnika albo (None, None)."""
+    src_dir, source = _participant_source(subject_id)
+    if src_dir is None:
+        return None, None
+    store = os.path.join(src_dir, f'S{subject_id}' + PYRAMID_SUFFIX)
+    manifest_path = os.path.join(store, PYRAMID_MANIFEST)
+    try:
+        ident = _file_identity(manifest_path)
+    except OSError:
+        return None, None
+    with _PYRAMID_LOCK:
+        cached = _PYRAMID_CACHE.get(manifest_path)
+    if cached is not None and cached[0] == ident:
+        manifest = cached[1]
+    else:
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        with _PYRAMID_LOCK:
+            _PYRAMID_CACHE[manifest_path] = (ident, manifest)
+    if manifest.get('source') != source or manifest.get('version') != PYRAMID_VERSION:
+        return None, None
+    return store, manifest
+
+
+def _pyramid_columnar_dir(subject_id, src_dir, source):
+    """Aktualny magazyn kolumnowy uczestnika leżący obok źródła (z niego piramida czyta surowe brzegi) albo None."""
+    columnar_dir = os.path.join(src_dir, f'S{subject_id}' + COLUMNAR_SUFFIX)
+    try:
+        with open(os.path.join(columnar_dir, COLUMNAR_MANIFEST), 'r', encoding='utf-8') as f:
+            columnar_source = json.load(f).get('source')
+        if columnar_source != source or _open_columnar(columnar_dir) is None:
+            return None
+    except (OSError, ValueError):
+        return None
+    return columnar_dir
+
+
+def _ensure_participant_pyramid(subject_id):
+    """Buduje piramidę, jeśli jej brak lub jest nieaktualna (raz na wersję pliku źródłowego).
+    Bez magazynu kolumnowego (`python app.py ingest`) piramida nie powstaje — decymacja idzie na bieżąco."""
+    store, _ = _open_pyramid(subject_id)
+    if store is not None:
+        return store
+    src_dir, source = _participant_source(subject_id)
+    if src_dir is None:
+        return None
+    columnar_dir = _pyramid_columnar_dir(subject_id, src_dir, source)
+    if columnar_dir is None:
+        return None
+    out_dir = os.path.join(src_dir, f'S{subject_id}' + PYRAMID_SUFFIX)
+    try:
+        return _PYRAMID_FLIGHT.do(out_dir, lambda: build_participant_pyramid(subject_id, columnar_dir, out_dir, source))
+    except (OSError, ValueError):
+        # np. katalog tylko do odczytu — decymacja zostanie policzona na bieżąco
+        return None
+
+
+def _pyramid_compose(raw, store, spec, unit, start, end, bucket):
+    """Agregaty min/max/mean kubełków [start + i*bucket, ...) ograniczonych do `end`.
+
+    Pełne kubełki poziomu (po `unit` próbek) leżące we wnętrzu kubełka odpowiedzi są czytane z piramidy,
+    a niewyrównane brzegi (< unit próbek z każdej strony) — z surowych próbek `raw`.
+    """
+    length = raw.shape[0]
+    m = -(-(end - start) // bucket)
+    idx_out = np.arange(m, dtype=np.int64)
+    s = start + idx_out * bucket
+    e = np.minimum(s + bucket, end)
+    j0 = -(-s // unit)
+    # ostatni kubełek poziomu może być krótszy — kończy się na `length`
+    j1 = np.where(e >= length, spec['buckets'], e // unit)
+    inner = j1 > j0
+    left_end = np.where(inner, np.minimum(j0 * unit, e), e)
+    right_start = np.where(inner, np.minimum(j1 * unit, e), e)
+
+    shape = (m,) + raw.shape[1:]
+    mins = np.full(shape, np.nan)
+    maxs = np.full(shape, np.nan)
+    sums = np.zeros(shape)
+    counts = np.zeros(shape)
+
+    seg_a = np.concatenate([s, right_start])
+    seg_b = np.concatenate([left_end, e])
+    owner = np.concatenate([idx_out, idx_out])
+    keep = seg_b > seg_a
+    seg_a, seg_b, owner = seg_a[keep], seg_b[keep], owner[keep]
+    if seg_a.size:
+        lens = seg_b - seg_a
+        offsets = np.cumsum(lens) - lens
+        gather = np.repeat(seg_a - offsets, lens) + np.arange(int(lens.sum()), dtype=np.int64)
+        vals = np.asarray(raw[gather], dtype=np.float64)
+        valid = ~np.isnan(vals)
+        np.fmin.at(mins, owner, np.fmin.reduceat(vals, offsets, axis=0))
+        np.fmax.at(maxs, owner, np.fmax.reduceat(vals, offsets, axis=0))
+        np.add.at(sums, owner, np.add.reduceat(np.where(valid, vals, 0.0), offsets, axis=0))
+        np.add.at(counts, owner, np.add.reduceat(valid, offsets, axis=0, dtype=np.float64))
+
+    if inner.any():
+        rows = np.nonzero(inner)[0]
+        jlo, jhi = int(j0[rows[0]]), int(j1[rows[-1]])
+        part = np.asarray(np.load(os.path.join(store, spec['file']), mmap_mode='r')[jlo:jhi])
+        # przedziały [j0, j1) kolejnych kubełków przeplecione z (ignorowanymi) przerwami między nimi
+        bounds = np.stack([j0[rows], j1[rows]], axis=1).ravel() - jlo
+        if bounds[-1] == part.shape[0]:
+            bounds = bounds[:-1]
+        mins[rows] = np.fmin(mins[rows], np.fmin.reduceat(part[:, 0], bounds, axis=0)[::2])
+        maxs[rows] = np.fmax(maxs[rows], np.fmax.reduceat(part[:, 1], bounds, axis=0)[::2])
+        sums[rows] += np.add.reduceat(part[:, 2], bounds, axis=0)[::2]
+        counts[rows] += np.add.reduceat(part[:, 3], bounds, axis=0)[::2]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return mins, maxs, means
+
+
+def _pyramid_channel(store, raw_dir, entry, range_slice, points):
+    """Kanał zdecymowany z piramidy — ten sam wynik co _decimated_channel na surowych danych.
+    None gdy plik kanału w magazynie kolumnowym nie pasuje do piramidy."""
+    length = entry['length']
+    start, end, _ = slice(*(range_slice or (None, None))).indices(length)
+    span = max(0, end - start)
+    raw = np.load(os.path.join(raw_dir, entry['raw']), mmap_mode='r')
+    if raw.ndim == 0 or raw.shape[0] != length:
+        return None
+    bucket = max(1, -(-span // points))
+    if bucket < 2 * 2 ** PYRAMID_BASE_LEVEL:
+        # krótkie kubełki: piramida nic nie oszczędza, decymacja wprost z mmapowanych próbek zakresu
+        bucket, starts, mins, maxs, means = _decimate_minmax(raw[start:end], points)
+    else:
+        # poziom ~sqrt(bucket/2) minimalizuje odczyt: bucket/2^L kubełków poziomu + do 2*2^L próbek brzegowych
+        level = int(round(math.log2(math.sqrt(bucket / 2))))
+        available = sorted(int(k) for k in entry['levels'])
+        level = min(max(level, PYRAMID_BASE_LEVEL), available[-1])
+        mins, maxs, means = _pyramid_compose(raw, store, entry['levels'][str(level)], 2 ** level, start, end, bucket)
+        starts = np.arange(mins.shape[0], dtype=np.int64) * bucket
+    return {
+        'length': span,
+        'bucket_size': int(bucket),
+        'index': (starts + start).tolist(),
+        'min': _nan_to_none(mins),
+        'max': _nan_to_none(maxs),
+        'mean': _nan_to_none(means),
+    }
+
+
+def _pyramid_resolution_response(subject_id, requested_params, range_slice, points, n):
+    """Odpowiedź resolution=<points> wyłącznie z piramidy (jak _resolution_participant_response);
+    None gdy piramidy brak albo nie obejmuje żądanych kanałów / etykiet."""
+    store, manifest = _open_pyramid(subject_id)
+    if store is None or manifest.get('layout') is None or n > PYRAMID_LABELS_HEAD:
+        return None
+    raw_dir = os.path.join(os.path.dirname(store), manifest['raw_store'])
+    if not os.path.isfile(os.path.join(raw_dir, COLUMNAR_MANIFEST)):
+        return None  # magazyn kolumnowy usunięty — surowych brzegów nie ma skąd wziąć
+    channels = manifest.get('channels', {})
+    signals = {}
+    try:
+        for loc, ch_names in manifest['layout']:
+            if ch_names is None:
+                if requested_params and loc.lower() not in requested_params:
+                    continue
+                entry = channels.get(loc)
+                if entry is None:
+                    return None  # kanał nienumeryczny — podsumowanie wymaga danych
+                signals[loc] = _pyramid_channel(store, raw_dir, entry, range_slice, points)
+                if signals[loc] is None:
+                    return None
+                continue
+            signals[loc] = {}
+            for ch_name in ch_names:
+                if requested_params and ch_name.lower() not in requested_params:
+                    continue
+                entry = channels.get(f'{loc}/{ch_name}')
+                if entry is None:
+                    return None
+                signals[loc][ch_name] = _pyramid_channel(store, raw_dir, entry, range_slice, points)
+                if signals[loc][ch_name] is None:
+                    return None
+    except (OSError, ValueError):
+        return None
+    resp = jsonify({
+        'subject': manifest.get('subject', f'S{subject_id}'),
+        'resolution': points,
+        'available_signals': signals,
+        'labels_sample': manifest.get('labels_head', [])[:n],
+        'metadata_preview': manifest.get('metadata_preview', {}),
+    })
+    resp.headers['X-Resolution-Source'] = 'pyramid'
+    return resp
+
+
+def _ingest_cli(args):
+    """`python app.py ingest [plik.pkl|katalog ...]` — bez argumentów konwertuje wszystkie .pkl z katalogu danych."""
+    targets = args or [get_data_dir()]
+    pkls = []
+    for t in targets:
+        if os.path.isdir(t):
+            pkls.extend(sorted(glob.glob(os.path.join(t, '*.pkl'))))
+        else:
+            pkls.append(t)
+    if not pkls:
+        print('Brak plików .pkl do konwersji.')
+        return 1
+    failed = 0
+    for p in pkls:
+        try:
+            out = ingest_pickle_to_columnar(p)
+            print(f'OK   {p} -> {out}')
+            # od razu zbuduj piramidę agregatów dla zapytań resolution= (surowe brzegi czyta z `out`)
+            src_dir = os.path.dirname(os.path.realpath(out))
+            with open(os.path.join(out, COLUMNAR_MANIFEST), 'r', encoding='utf-8') as f:
+                source = json.load(f)['source']
+            stem = os.path.basename(out)[:-len(COLUMNAR_SUFFIX)]
+            pyr = build_participant_pyramid(stem[1:], out, os.path.join(src_dir, stem + PYRAMID_SUFFIX), source)
+            print(f'OK   {p} -> {pyr}')
+        except Exception as e:
+            failed += 1
+            print(f'FAIL {p}: {e}')
+    return 1 if failed else 0
+
+
+# ===================== ETAGI I WARUNKOWE GET =====================
+# Silny ETag = skrót z tożsamości plików źródłowych (ścieżka, mtime, rozmiar), parametrów żądania
+# i wersji samego app.py. If-None-Match z pasującym ETagiem daje 304 przed jakimkolwiek unpicklingiem.
+try:
+    _ETAG_SALT = list(_file_identity(__file__))
+except OSError:
+    _ETAG_SALT = None
+
+
+def _etag_for(*parts):
+    raw = json.dumps([_ETAG_SALT, *parts], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _request_variant():
+    """Wszystko z żądania, od czego zależy treść odpowiedzi (także wynegocjowane kodowanie)."""
+    return sorted(request.args.items(multi=True)), request.headers.get('Accept', ''), _negotiate_encoding()
+
+
+def _skip_etag():
+    """Widok oznacza bieżącą odpowiedź jako niecache'owalną (np. zawiera błąd, który przy kolejnym
+    żądaniu może zniknąć, choć pliki źródłowe się nie zmieniły) — _conditional nie doda ETagu."""
+    g.skip_etag = True
+
+
+def _conditional(etag_fn, weak=False):
+    """Dekorator widoku: etag_fn(*args) zwraca ETag (albo None gdy nie da się go tanio wyznaczyć).
+    Pasujący If-None-Match -> 304 bez wywołania widoku; odpowiedzi 200 dostają nagłówek ETag.
+    weak=True: treść zmienia się między żądaniami przy tych samych danych (np. znacznik czasu),
+    więc walidator jest słaby (W/"...") — równoważność semantyczna, nie identyczność bajtów."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                etag = etag_fn(*args, **kwargs)
+            except OSError:
+                etag = None
+            if etag is not None:
+                matches = request.if_none_match.contains_weak if weak else request.if_none_match.contains
+                if matches(etag):
+                    resp = Response(status=304)
+                    resp.set_etag(etag, weak=weak)
+                    resp.headers['Cache-Control'] = 'no-cache'
+                    return resp
+            resp = make_response(view(*args, **kwargs))
+            if etag is not None and resp.status_code == 200 and not g.get('skip_etag'):
+                resp.set_etag(etag, weak=weak)
+                # przeglądarka zawsze rewaliduje, ale może użyć kopii po 304
+                resp.headers['Cache-Control'] = 'no-cache'
+            return resp
+        return wrapper
+    return decorator
+
+
+def _vary(*headers):
+    """Dekorator widoku: dopisuje nagłówki żądania, od których zależy treść, do Vary każdej odpowiedzi
+    (także 304 i błędów) — wspólny cache nie poda wariantu JSON klientowi, który prosił o inny format."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            resp = make_response(view(*args, **kwargs))
+            for h in headers:
+                resp.vary.add(h)
+            return resp
+        return wrapper
+    return decorator
+
+
+# ===================== KOMPRESJA ODPOWIEDZI =====================
+# gzip (i brotli, jeśli zainstalowany) wg Accept-Encoding dla odpowiedzi JSON/tekstowych powyżej
+# COMPRESS_MIN_BYTES. Odpowiedzi strumieniowe są kompresowane kawałek po kawałku (bez buforowania
+# całości); SSE i dane binarne zostają bez kompresji.
+COMPRESS_ENABLED = os.environ.get('COMPRESS', '1').lower() not in ('0', 'false')
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+COMPRESS_MIMETYPES = frozenset({'application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv'})
+
+
+def _negotiate_encoding():
+    """'br' | 'gzip' | None wg Accept-Encoding żądania (z wagami q)."""
+    if not COMPRESS_ENABLED:
+        return None
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+class _Compressor:
+    """Wspólny interfejs kompresji przyrostowej dla gzip i brotli."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._c = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._c.process(data) if self.encoding == 'br' else self._c.compress(data)
+
+    def flush(self):
+        """Wypycha wszystko, co kompresor zbuforował — odbiorca może od razu zdekodować dotychczasowe dane."""
+        return self._c.flush() if self.encoding == 'br' else self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._c.finish() if self.encoding == 'br' else self._c.flush()
+
+
+def _compressed_stream(chunks, encoding):
+    comp = _Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            # sync flush po każdym kawałku: bez niego zlib trzyma małe linie NDJSON do końca strumienia
+            yield comp.compress(chunk) + comp.flush()
+        yield comp.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+@app.after_request
+def _compress_response(resp):
+    if resp.status_code != 200 or resp.direct_passthrough or 'Content-Encoding' in resp.headers:
+        return resp
+    if resp.mimetype not in COMPRESS_MIMETYPES:
+        return resp
+    encoding = _negotiate_encoding()
+    resp.vary.add('Accept-Encoding')
+    if encoding is None:
+        return resp
+    if resp.is_streamed:
+        resp.response = _compressed_stream(resp.response, encoding)
+        resp.headers.pop('Content-Length', None)
+    else:
+        data = resp.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return resp
+        comp = _Compressor(encoding)
+        resp.set_data(comp.compress(data) + comp.finish())
+    resp.headers['Content-Encoding'] = encoding
+    return resp
+
+
+def _participant_etag(subject_id):
+    src_dir, source = _participant_source(subject_id)
+    if source is None:
+        return None
+    # odpowiedź z piramidy może różnić się od liczonej na bieżąco w ostatnich bitach średnich
+    pyramid = bool(request.args.get('resolution')) and _open_pyramid(subject_id)[0] is not None
+    return _etag_for('participant', str(subject_id), src_dir, source, pyramid, _request_variant())
+
+
+def _participants_etag():
+    if request.args.get('stream', '0').lower() in ('1', 'true'):
+        # błędy plików pojawiają się dopiero w trakcie strumienia — nie da się ich wykluczyć z góry
+        return None
+    if request.args.get('search_all', '0').lower() in ('1', 'true'):
+        dirs = [c if os.path.isabs(c) else os.path.join(BASE_DIR, c) for c in DATA_DIR_CANDIDATES]
+    else:
+        dirs = [get_data_dir()]
+    files = [list(_file_identity(p)) for d in dirs for p in sorted(glob.glob(os.path.join(d, '*.pkl')))]
+    return _etag_for('participants', dirs, files, _is_unpickle_allowed(), _request_variant())
+
+
+def _stress_state_etag():
+    subj = request.args.get('subject')
+    if not subj:
+        # autodetekcja uczestnika wymaga przejrzenia katalogu — bez ETagu
+        return None
+    subject_id = _normalize_subject_id(subj)
+    version = _stress_source_version(subject_id)
+    if version == (None, None):
+        return None
+    return _etag_for('stress_state', subject_id, get_data_dir(), version, _request_variant())
+
+
 @app.route('/')
 def home():
     return "WESAD Backend API działa"
@@ -522,6 +1986,39 @@ def data_dir_info():
         files = sorted(os.listdir(data_dir))
     return jsonify({'data_dir': data_dir, 'files': files})
 
+def _cache_stats_payload():
+    with _SUBJECT_INDEX_LOCK:
+        index_stats = dict(_SUBJECT_INDEX_STATS)
+    with _FEATURE_TABLES_LOCK:
+        feature_stats = dict(_FEATURE_TABLES_STATS, entries=len(_FEATURE_TABLES))
+    return {
+        'pickle_cache': _PICKLE_CACHE.stats(),
+        'single_flight': _LOAD_FLIGHT.stats(),
+        'subject_index': index_stats,
+        'feature_tables': feature_stats,
+        'chat_cache': _CHAT_CACHE.stats(),
+        'chat_gate': _CHAT_GATE.stats(),
+    }
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Zwraca statystyki cache (hit/miss/eviction, zajęte bajty). Tylko odczyt — czyszczenie: POST /cache_stats/clear."""
+    return jsonify(_cache_stats_payload())
+
+@app.route('/cache_stats/clear', methods=['POST'])
+def cache_stats_clear():
+    """Czyści cache odpicklowanych plików i odpowiedzi czatu; zwraca statystyki po wyczyszczeniu."""
+    _PICKLE_CACHE.clear()
+    _CHAT_CACHE.clear()
+    return jsonify(_cache_stats_payload())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metryki w formacie tekstowym Prometheusa: histogramy czasu i rozmiaru odpowiedzi per trasa,
+    żądania w toku, błędy, czas odpicklowania oraz statystyki cache (jak /cache_stats)."""
+    body = '\n'.join(_METRICS.render() + _stats_metrics()) + '\n'
+    return Response(body, content_type=METRICS_CONTENT_TYPE)
+
 def _summarize_object(obj, n=20, include_full=False, max_full=100000):
     """Zwraca bezpieczne podsumowanie obiektu (length, dtype, sample, opcjonalnie full)."""
     try:
@@ -568,12 +2065,13 @@ def _summarize_object(obj, n=20, include_full=False, max_full=100000):
         length = obj.size
         summary.update({'length': int(length), 'dtype': str(obj.dtype)})
         try:
-            summary['sample'] = obj.flatten()[:n].tolist()
+            # obj.flat[:n] kopiuje tylko n wartości — flatten() przeczytałby cały kanał (np.memmap z magazynu kolumnowego)
+            summary['sample'] = _np.asarray(obj.flat[:n]).tolist()
         except Exception:
             summary['sample'] = []
         if include_full and length <= max_full:
             try:
-                summary['full'] = obj.flatten().tolist()
+                summary['full'] = _np.asarray(obj.flat[:max_full]).tolist()
             except Exception:
                 pass
         return summary
@@ -634,7 +2132,372 @@ def _is_unpickle_allowed():
         q = False
     return env or q
 
+def _labels_sample(data, n):
+    """Próbka etykiet (pandas Series / numpy / list) — pusta lista gdy brak."""
+    try:
+        labels = data.get('label', [])
+        # pandas Series / numpy / list
+        return _summarize_object(labels, n=n, include_full=False).get('sample', [])
+    except Exception:
+        return []
+
+
+def _metadata_preview(data):
+    """Mały podgląd pozostałych kluczy obiektu uczestnika (bez 'subject', 'signal', 'label')."""
+    metadata = {}
+    try:
+        for k, v in getattr(data, 'items', lambda: {})():
+            if k in ('subject', 'signal', 'label'):
+                continue
+            # mały podgląd wartości/metadanych
+            try:
+                metadata[k] = {'type': type(v).__name__, 'preview': _summarize_object(v, n=5, include_full=False).get('sample')}
+            except Exception:
+                metadata[k] = {'type': type(v).__name__}
+    except Exception:
+        # jeśli data nie jest dict-like, pomiń
+        pass
+    return metadata
+
+
+# Liczba elementów serializowanych naraz w trybie strumieniowym (full=1&stream=1)
+STREAM_CHUNK_ITEMS = 65536
+
+
+def _slice_range(obj, range_slice):
+    """Przycina obiekt (Series/DataFrame/list/ndarray) do zakresu (start, end); inne typy bez zmian."""
+    if not range_slice:
+        return obj
+    sstart, send = range_slice
+    try:
+        if isinstance(obj, (pd.Series, pd.DataFrame)):
+            return obj.iloc[sstart:send]
+        if isinstance(obj, (list, tuple)):
+            return list(obj)[sstart:send]
+        if isinstance(obj, np.ndarray):
+            return obj[sstart:send]
+    except Exception:
+        pass
+    return obj
+
+
+def _iter_json_value(obj, limit=None):
+    """Serializuje wartość do JSON kawałkami — tablice/listy/DataFrame po STREAM_CHUNK_ITEMS elementów.
+
+    `limit` obcina sekwencję do pierwszych `limit` elementów bez materializowania reszty.
+    """
+    if isinstance(obj, dict):
+        yield '{'
+        for i, (k, v) in enumerate(obj.items()):
+            yield (', ' if i else '') + json.dumps(str(k)) + ': '
+            yield from _iter_json_value(v)
+        yield '}'
+        return
+    if isinstance(obj, (np.ndarray, pd.Series, pd.DataFrame, list, tuple)):
+        total = len(obj)
+        stop = total if limit is None else min(total, limit)
+        yield '['
+        first = True
+        for i in range(0, stop, STREAM_CHUNK_ITEMS):
+            j = min(i + STREAM_CHUNK_ITEMS, stop)
+            if isinstance(obj, pd.DataFrame):
+                part = obj.iloc[i:j].to_dict(orient='records')
+            elif isinstance(obj, pd.Series):
+                part = obj.iloc[i:j].tolist()
+            elif isinstance(obj, np.ndarray):
+                part = obj[i:j].tolist()
+            else:
+                part = list(obj[i:j])
+            if not part:
+                continue
+            yield ('' if first else ', ') + json.dumps(part, default=str)[1:-1]
+            first = False
+        yield ']'
+        return
+    yield json.dumps(obj if isinstance(obj, (int, float, str, bool, type(None))) else str(obj))
+
+
+def _iter_full_channel(obj, range_slice, truncated, name):
+    """Strumieniuje pełny kanał (jak w full=1): po przycięciu zakresu, z obcięciem do MAX_FULL_IN_SUMMARY."""
+    obj_use = _slice_range(obj, range_slice)
+    if isinstance(obj_use, (pd.Series, pd.DataFrame, list, tuple, np.ndarray)):
+        slen = len(obj_use)
+        if slen > MAX_FULL_IN_SUMMARY:
+            truncated.append(name)
+            yield '{"data": '
+            yield from _iter_json_value(obj_use, limit=MAX_FULL_IN_SUMMARY)
+            yield f', "truncated": true, "total_length": {slen}}}'
+            return
+    if isinstance(obj_use, dict):
+        yield '{'
+        for i, (k, v) in enumerate(obj_use.items()):
+            yield (', ' if i else '') + json.dumps(str(k)) + ': '
+            yield from _iter_full_channel(v, range_slice, [], name)
+        yield '}'
+        return
+    yield from _iter_json_value(obj_use)
+
+
+def _stream_participant_full(subject, data, raw_signals, requested_params, range_slice, n):
+    """Odpowiedź full=1 jako strumień JSON: każdy kanał jest pisany kawałkami prosto z tablicy,
+    więc szczytowe zużycie pamięci nie zależy od długości kanałów."""
+    head = {
+        'subject': subject,
+        'labels_sample': _labels_sample(data, n),
+        'metadata_preview': _metadata_preview(data),
+    }
+
+    def _wanted(name):
+        return not requested_params or str(name).lower() in requested_params
+
+    def generate():
+        truncated = []
+        yield json.dumps(head, default=str)[:-1] + ', "available_signals": {'
+        if isinstance(raw_signals, dict):
+            for i, (loc, loc_val) in enumerate((k, v) for k, v in raw_signals.items() if isinstance(v, dict) or _wanted(k)):
+                yield (', ' if i else '') + json.dumps(str(loc)) + ': {"full": '
+                if isinstance(loc_val, dict):
+                    yield '{'
+                    for j, (ch_name, ch_val) in enumerate((k, v) for k, v in loc_val.items() if _wanted(k)):
+                        yield (', ' if j else '') + json.dumps(str(ch_name)) + ': '
+                        yield from _iter_full_channel(ch_val, range_slice, truncated, f"{loc}/{ch_name}")
+                    yield '}'
+                else:
+                    yield from _iter_full_channel(loc_val, range_slice, truncated, str(loc))
+                yield '}'
+        else:
+            yield '"signal_container": {"full": '
+            yield from _iter_full_channel(raw_signals, range_slice, truncated, 'signal_container')
+            yield '}'
+        yield '}'
+
+        if requested_params:
+            # requested_params powiela wybrane kanały — strumieniujemy je ponownie zamiast trzymać kopię w pamięci
+            groups = {}
+            if isinstance(raw_signals, dict):
+                for loc, loc_val in raw_signals.items():
+                    if isinstance(loc_val, dict):
+                        for ch_name, ch_val in loc_val.items():
+                            if _wanted(ch_name):
+                                groups.setdefault(str(ch_name).lower(), []).append((loc, ch_val))
+                    elif _wanted(loc):
+                        groups.setdefault(str(loc).lower(), []).append((loc, loc_val))
+            if groups or not isinstance(raw_signals, dict):
+                yield ', "requested_params": {'
+                if isinstance(raw_signals, dict):
+                    for i, (key, items) in enumerate(groups.items()):
+                        yield (', ' if i else '') + json.dumps(key) + ': {'
+                        for j, (loc, val) in enumerate(items):
+                            yield (', ' if j else '') + json.dumps(str(loc)) + ': '
+                            yield from _iter_full_channel(val, range_slice, [], key)
+                        yield '}'
+                else:
+                    for i, key in enumerate(requested_params):
+                        yield (', ' if i else '') + json.dumps(key) + ': '
+                        yield from _iter_full_channel(raw_signals, range_slice, [], key)
+                yield '}'
+        if truncated:
+            yield ', "truncated_channels": ' + json.dumps(truncated)
+            yield ', "note": ' + json.dumps(f"Returned first {MAX_FULL_IN_SUMMARY} items for some channels — to nie wszystko.")
+        yield '}'
+
+    return Response(generate(), mimetype='application/json')
+
+
+# Binarny format sygnałów (format=bin / Accept: application/octet-stream):
+#   b'WSB1' | uint32 LE długość nagłówka | nagłówek JSON (UTF-8, dopełniony spacjami do 8 B) | bufory kanałów
+# Każdy bufor zaczyna się na offsecie podzielnym przez 8 (liczonym od początku ciała), jest little-endian
+# i C-contiguous, więc klient może od razu zbudować np. Float32Array(buffer, offset, length).
+BINARY_MAGIC = b'WSB1'
+BINARY_MIMETYPE = 'application/octet-stream'
+# Limit wierszy na kanał w odpowiedzi binarnej (dłuższe kanały są obcinane i oznaczane 'truncated')
+MAX_BINARY_ITEMS = 10_000_000
+
+
+def _wants_binary():
+    if request.args.get('format', '').lower() in ('bin', 'binary'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE])
+    return best == BINARY_MIMETYPE and request.accept_mimetypes[BINARY_MIMETYPE] > request.accept_mimetypes['application/json']
+
+
+def _binary_array(obj, dtype=None):
+    """Zamienia kanał na tablicę numeryczną little-endian (bez kopii, jeśli to możliwe). None gdy nie-numeryczny."""
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        obj = obj.to_numpy()
+    arr = np.asarray(obj)
+    if arr.dtype.kind not in 'biuf':
+        return None
+    target = np.dtype(dtype) if (dtype is not None and arr.dtype.kind == 'f') else arr.dtype
+    target = target.newbyteorder('<')
+    if arr.dtype != target:
+        return arr.astype(target)
+    return arr
+
+
+def _binary_participant_response(subject, data, raw_signals, requested_params, range_slice, dtype=None):
+    """Odpowiedź binarna: nagłówek JSON z nazwami, dtype, kształtami i offsetami + surowe bufory kanałów."""
+    channels = []
+
+    def _add(name, loc, ch_name, obj):
+        arr = _binary_array(_slice_range(obj, range_slice), dtype)
+        entry = {'name': name, 'location': str(loc), 'channel': None if ch_name is None else str(ch_name)}
+        if arr is None:
+            entry['error'] = 'kanał nie jest numeryczny'
+            channels.append((entry, None))
+            return
+        total = int(arr.shape[0]) if arr.ndim else 1
+        if arr.ndim and total > MAX_BINARY_ITEMS:
+            arr = arr[:MAX_BINARY_ITEMS]
+            entry.update({'truncated': True, 'total_length': total})
+        entry['fs'] = _sampling_rate(loc, ch_name)
+        channels.append((entry, np.ascontiguousarray(arr)))
+
+    if isinstance(raw_signals, dict):
+        for loc, loc_val in raw_signals.items():
+            if isinstance(loc_val, dict):
+                for ch_name, ch_val in loc_val.items():
+                    if requested_params and str(ch_name).lower() not in requested_params:
+                        continue
+                    _add(f"{loc}/{ch_name}", loc, ch_name, ch_val)
+            elif not requested_params or str(loc).lower() in requested_params:
+                _add(str(loc), loc, None, loc_val)
+    elif not requested_params:
+        _add('signal_container', 'signal_container', None, raw_signals)
+    labels = data.get('label') if isinstance(data, dict) else None
+    if labels is not None and not requested_params:
+        _add('label', 'label', None, labels)
+
+    offset = 0
+    for entry, arr in channels:
+        if arr is None:
+            continue
+        entry.update({'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset, 'nbytes': int(arr.nbytes)})
+        offset += (int(arr.nbytes) + 7) // 8 * 8
+    header = json.dumps({'subject': subject, 'byte_order': 'little', 'body_length': offset,
+                         'channels': [e for e, _ in channels]}).encode('utf-8')
+    pad = (-(8 + len(header))) % 8
+    header += b' ' * pad
+
+    def generate():
+        yield BINARY_MAGIC + len(header).to_bytes(4, 'little') + header
+        chunk_bytes = STREAM_CHUNK_ITEMS * 8
+        for entry, arr in channels:
+            if arr is None:
+                continue
+            view = memoryview(arr.reshape(-1)).cast('B')
+            for i in range(0, len(view), chunk_bytes):
+                yield bytes(view[i:i + chunk_bytes])
+            tail = (-int(arr.nbytes)) % 8
+            if tail:
+                yield b'\0' * tail
+
+    resp = Response(generate(), mimetype=BINARY_MIMETYPE)
+    resp.headers['Content-Length'] = str(8 + len(header) + offset)
+    resp.vary.add('Accept')
+    return resp
+
+
+# Górny limit liczby punktów (kubełków) w trybie resolution=<points>
+MAX_RESOLUTION_POINTS = 20000
+
+
+def _bucket_aggregate(arr, bucket):
+    """Agregaty min/max/mean w kubełkach po `bucket` wierszy (ostatni może być krótszy).
+
+    Zwraca (mins, maxs, means, counts); dla tablic (N, k) agregaty mają kształt (kubełki, k).
+    """
+    data = np.asarray(arr).astype(np.float64, copy=False)
+    n = int(data.shape[0])
+    n_full = (n // bucket) * bucket
+    aggs = []
+    with warnings.catch_warnings():
+        # kubełki złożone z samych NaN dają NaN bez ostrzeżeń
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if n_full:
+            p = data[:n_full].reshape((n_full // bucket, bucket) + data.shape[1:])
+            aggs.append((np.nanmin(p, axis=1), np.nanmax(p, axis=1), np.nanmean(p, axis=1)))
+        if n_full < n:
+            tail = data[n_full:]
+            aggs.append((np.nanmin(tail, axis=0)[None], np.nanmax(tail, axis=0)[None], np.nanmean(tail, axis=0)[None]))
+    if not aggs:
+        empty = np.empty((0,) + data.shape[1:])
+        return empty, empty, empty, np.empty(0, dtype=np.int64)
+    counts = np.full(sum(a[0].shape[0] for a in aggs), bucket, dtype=np.int64)
+    if n_full < n:
+        counts[-1] = n - n_full
+    return (np.concatenate([a[0] for a in aggs]), np.concatenate([a[1] for a in aggs]),
+            np.concatenate([a[2] for a in aggs]), counts)
+
+
+def _decimate_minmax(arr, points):
+    """Decymacja min/max po kubełkach (wektorowo): zachowuje obwiednię sygnału dla wykresu.
+
+    Zwraca (bucket_size, starts, mins, maxs, means); dla tablic (N, k) agregaty mają kształt (kubełki, k).
+    """
+    n = int(np.asarray(arr).shape[0])
+    bucket = max(1, -(-n // max(1, int(points))))
+    mins, maxs, means, _ = _bucket_aggregate(arr, bucket)
+    starts = np.arange(mins.shape[0], dtype=np.int64) * bucket
+    return bucket, starts, mins, maxs, means
+
+
+def _nan_to_none(values):
+    """ndarray -> lista z None w miejscu NaN (JSON nie ma NaN)."""
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+        obj = values.astype(object)
+        obj[np.isnan(values)] = None
+        return obj.tolist()
+    return values.tolist()
+
+
+def _decimated_channel(obj, range_slice, points):
+    """Zdecymowany kanał w formacie odpowiedzi: indeksy początków kubełków (bezwzględne) + min/max/mean."""
+    sliced = _slice_range(obj, range_slice)
+    arr = _binary_array(sliced)
+    if arr is None or arr.ndim == 0:
+        return _summarize_object(sliced, n=20)
+    offset = 0
+    if range_slice:
+        offset = slice(range_slice[0], range_slice[1]).indices(len(obj))[0]
+    bucket, starts, mins, maxs, means = _decimate_minmax(arr, points)
+    return {
+        'length': int(arr.shape[0]),
+        'bucket_size': int(bucket),
+        'index': (starts + offset).tolist(),
+        'min': _nan_to_none(mins),
+        'max': _nan_to_none(maxs),
+        'mean': _nan_to_none(means),
+    }
+
+
+def _resolution_participant_response(subject, data, raw_signals, requested_params, range_slice, points, n):
+    """Odpowiedź resolution=<points>: każdy kanał zdecymowany do ~points kubełków min/max/mean."""
+    signals = {}
+    if isinstance(raw_signals, dict):
+        for loc, loc_val in raw_signals.items():
+            if isinstance(loc_val, dict):
+                signals[loc] = {}
+                for ch_name, ch_val in loc_val.items():
+                    if requested_params and str(ch_name).lower() not in requested_params:
+                        continue
+                    signals[loc][ch_name] = _decimated_channel(ch_val, range_slice, points)
+            elif not requested_params or str(loc).lower() in requested_params:
+                signals[loc] = _decimated_channel(loc_val, range_slice, points)
+    elif not requested_params:
+        signals['signal_container'] = _decimated_channel(raw_signals, range_slice, points)
+    return jsonify({
+        'subject': subject,
+        'resolution': points,
+        'available_signals': signals,
+        'labels_sample': _labels_sample(data, n),
+        'metadata_preview': _metadata_preview(data),
+    })
+
+
 @app.route('/participant/<subject_id>', methods=['GET'])
+@_vary('Accept', 'Accept-Encoding')  # format wg Accept; ETag (także w 304) zależy też od kodowania
+@_conditional(_participant_etag)
 def get_participant_info(subject_id):
     """Zwraca rozszerzone informacje o uczestniku.
     Query params:
@@ -657,25 +2520,7 @@ def get_participant_info(subject_id):
                 end = int(parts[1]) if parts[1] != '' else None
                 range_slice = (start, end)
         except Exception:
-            range_slice = None
-
-    # bezpieczeństwo unpicklingu: wymagaj zgody przez env lub query param
-    if not _is_unpickle_allowed():
-        return jsonify({'error': 'Unpickling jest wyłączony. Ustaw zmienną środowiskową ALLOW_UNPICKLE=1 lub dodaj query param allow_unpickle=1.'}), 403
-
-    try:
-        data = load_participant_data(subject_id)
-    except FileNotFoundError as e:
-        return jsonify({'error': str(e)}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-    # subject
-    subject = None
-    try:
-        subject = data.get('subject', f'S{subject_id}')
-    except Exception:
-        subject = f'S{subject_id}'
+            range_slice = None
 
     # signals - staramy się obsłużyć różne formaty
     # Nowość: obsługa query param `params` w formatach:
@@ -698,6 +2543,42 @@ def get_participant_info(subject_id):
             else:
                 requested_params[part.strip().lower()] = None
 
+    points = None
+    resolution = request.args.get('resolution')
+    if resolution:
+        try:
+            points = int(resolution)
+            if not (1 <= points <= MAX_RESOLUTION_POINTS):
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': f'Niepoprawny resolution (1..{MAX_RESOLUTION_POINTS}): {resolution}'}), 400
+        # piramida agregatów: odpowiedź bez ładowania pickla (format=bin idzie zwykłą ścieżką binarną)
+        if not _wants_binary():
+            pyramid_resp = _pyramid_resolution_response(subject_id, requested_params, range_slice, points, n)
+            if pyramid_resp is not None:
+                return pyramid_resp
+
+    # magazyn kolumnowy (po `python app.py ingest`) nie wymaga unpicklingu — kanały są mmapowane
+    data = load_participant_columnar(subject_id)
+    if data is None:
+        # bezpieczeństwo unpicklingu: wymagaj zgody przez env lub query param
+        if not _is_unpickle_allowed():
+            return jsonify({'error': 'Unpickling jest wyłączony. Ustaw zmienną środowiskową ALLOW_UNPICKLE=1 lub dodaj query param allow_unpickle=1.'}), 403
+
+        try:
+            data = load_participant_data(subject_id)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    # subject
+    subject = None
+    try:
+        subject = data.get('subject', f'S{subject_id}')
+    except Exception:
+        subject = f'S{subject_id}'
+
     signals = {}
     truncated_channels = []
     try:
@@ -705,6 +2586,24 @@ def get_participant_info(subject_id):
     except Exception:
         raw_signals = data  # czasem cały obiekt to sygnały
 
+    # format=bin / Accept: application/octet-stream — surowe bufory zamiast liczb w JSON
+    if _wants_binary():
+        dtype = request.args.get('dtype')
+        if dtype not in (None, '', 'float32', 'float64'):
+            return jsonify({'error': f'Nieobsługiwany dtype: {dtype}', 'allowed_dtypes': ['float32', 'float64']}), 400
+        return _binary_participant_response(subject, data, raw_signals, requested_params, range_slice, dtype=dtype or None)
+
+    # resolution=<points>: decymacja min/max do rozmiaru wykresu zamiast surowych próbek
+    if points:
+        # przy pierwszym zapytaniu zbuduj piramidę agregatów, kolejne zoomy czytają tylko jej fragment
+        _ensure_participant_pyramid(subject_id)
+        return _resolution_participant_response(subject, data, raw_signals, requested_params, range_slice, points, n)
+
+    # full=1&stream=1: pisz kanały kawałkami prosto z tablic zamiast budować listy i jeden duży string
+    if include_full and request.args.get('stream', '0').lower() in ('1', 'true'):
+        return _stream_participant_full(subject, data, raw_signals, requested_params, range_slice, n)
+
+    signals_phase = _Phase('signals').start()
     found_params = set()
     # prepared JSON-return for requested params when include_full is True
     requested_params_json = None
@@ -1009,8 +2908,11 @@ def get_participant_info(subject_id):
         else:
             signals = {'signal_container': _summarize_object(raw_signals, n=n, include_full=include_full)}
 
+    signals_phase.stop()
     # If client requested full data, rebuild `signals` from raw_signals to avoid mixed summaries/full
+    convert_phase = _Phase('convert')
     if include_full:
+        convert_phase.start()
         def _convert_and_maybe_truncate(obj):
             try:
                 import numpy as _np
@@ -1109,38 +3011,16 @@ def get_participant_info(subject_id):
                 # if user requested the whole container as a param, include it
                 for p in requested_params.keys():
                     requested_params_json.setdefault(p, signals['signal_container'])
+    convert_phase.stop()
     missing_params = []
     if requested_params:
         for p in requested_params.keys():
             if p not in found_params:
                 missing_params.append(p)
 
-    # labels
-    labels_sample = []
-    try:
-        labels = data.get('label', [])
-        try:
-            # pandas Series / numpy / list
-            labels_sample = _summarize_object(labels, n=n, include_full=False).get('sample', [])
-        except Exception:
-            labels_sample = []
-    except Exception:
-        labels_sample = []
-
+    labels_sample = _labels_sample(data, n)
     # dodatkowe metadane (wyklucz podstawowe klucze)
-    metadata = {}
-    try:
-        for k, v in getattr(data, 'items', lambda: {})():
-            if k in ('subject', 'signal', 'label'):
-                continue
-            # mały podgląd wartości/metadanych
-            try:
-                metadata[k] = {'type': type(v).__name__, 'preview': _summarize_object(v, n=5, include_full=False).get('sample')}
-            except Exception:
-                metadata[k] = {'type': type(v).__name__}
-    except Exception:
-        # jeśli data nie jest dict-like, pomiń
-        pass
+    metadata = _metadata_preview(data)
 
     info = {
         'subject': subject,
@@ -1157,6 +3037,7 @@ def get_participant_info(subject_id):
     # Final sanitization: if client requested full data, ensure available_signals contains
     # only full JSON-friendly arrays/records or truncated objects (no 'sample'/'length' summaries).
     if include_full:
+        convert_phase.start()
         try:
             import numpy as _np
             import pandas as _pd
@@ -1266,7 +3147,9 @@ def get_participant_info(subject_id):
             info['available_signals'] = wrapped
         except Exception:
             pass
-    return jsonify(info)
+        convert_phase.stop()
+    with _Phase('serialize'):
+        return jsonify(info)
 
 def discover_subjects_in_file(pkl_path):
     """Zwraca listę subjectów obecnych w pliku .pkl.
@@ -1335,18 +3218,247 @@ def discover_subjects_in_file(pkl_path):
 
     return sorted(subjects)
 
+# Nazwa pliku indeksu subjectów trzymanego obok plików .pkl w katalogu danych
+SUBJECT_INDEX_FILENAME = '.subjects_index.json'
+_SUBJECT_INDEX_LOCK = threading.Lock()
+_SUBJECT_INDEXES = {}  # katalog -> {basename: {'mtime_ns', 'size', 'subjects'}}
+_SUBJECT_INDEX_STATS = {'hits': 0, 'misses': 0}
+
+
+def _subject_index_for_dir(dir_path):
+    """Zwraca (i w razie potrzeby wczytuje z dysku) indeks subjectów dla katalogu. Wołać pod _SUBJECT_INDEX_LOCK."""
+    dir_path = os.path.realpath(dir_path)
+    entries = _SUBJECT_INDEXES.get(dir_path)
+    if entries is None:
+        entries = {}
+        try:
+            with open(os.path.join(dir_path, SUBJECT_INDEX_FILENAME), 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict) and isinstance(loaded.get('files'), dict):
+                entries = loaded['files']
+        except (OSError, ValueError):
+            entries = {}
+        _SUBJECT_INDEXES[dir_path] = entries
+    return entries
+
+
+def _save_subject_index(dir_path, entries):
+    """Zapisuje indeks atomowo (tmp + replace). Katalog tylko do odczytu — indeks zostaje w pamięci."""
+    dir_path = os.path.realpath(dir_path)
+    target = os.path.join(dir_path, SUBJECT_INDEX_FILENAME)
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, target)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _index_lookup(pkl_path):
+    """Zwraca (tożsamość pliku, subjecty z indeksu albo None gdy wpis brakuje lub jest nieaktualny)."""
+    ident = _file_identity(pkl_path)
+    real, mtime_ns, size = ident
+    dir_path, name = os.path.split(real)
+    with _SUBJECT_INDEX_LOCK:
+        entry = _subject_index_for_dir(dir_path).get(name)
+        if entry and entry.get('mtime_ns') == mtime_ns and entry.get('size') == size:
+            _SUBJECT_INDEX_STATS['hits'] += 1
+            return ident, list(entry.get('subjects', []))
+        _SUBJECT_INDEX_STATS['misses'] += 1
+    return ident, None
+
+
+def _index_store(ident, subjects):
+    """Zapisuje wynik odkrywania dla pliku o podanej tożsamości w indeksie jego katalogu."""
+    real, mtime_ns, size = ident
+    dir_path, name = os.path.split(real)
+    with _SUBJECT_INDEX_LOCK:
+        entries = _subject_index_for_dir(dir_path)
+        entries[name] = {'mtime_ns': mtime_ns, 'size': size, 'subjects': list(subjects)}
+        # usuń wpisy dla plików, których już nie ma
+        for stale in [k for k in entries if not os.path.exists(os.path.join(dir_path, k))]:
+            entries.pop(stale, None)
+        _save_subject_index(dir_path, dict(entries))
+
+
+def discover_subjects_indexed(pkl_path):
+    """Jak discover_subjects_in_file, ale korzysta z indeksu (.subjects_index.json) w katalogu pliku.
+
+    Plik jest odpicklowywany tylko gdy brak wpisu albo zmienił się jego mtime/rozmiar.
+    Błędy ładowania nie są zapisywane w indeksie (kolejne wywołanie spróbuje ponownie).
+    """
+    ident, subjects = _index_lookup(pkl_path)
+    if subjects is not None:
+        return subjects
+    subjects = discover_subjects_in_file(pkl_path)
+    _index_store(ident, subjects)
+    return subjects
+
+
+# Odkrywanie subjectów w wielu plikach: trafienia w indeksie od razu, pozostałe pliki
+# odpicklowywane równolegle w osobnych procesach (unpickling trzyma GIL, a zawieszony proces można zabić).
+DISCOVERY_WORKERS = max(1, int(os.environ.get('DISCOVERY_WORKERS', str(min(4, os.cpu_count() or 1)))))
+DISCOVERY_FILE_TIMEOUT = float(os.environ.get('DISCOVERY_FILE_TIMEOUT', '300'))
+# limit na uruchomienie procesu (import app.py w procesie potomnym) zanim zacznie liczyć się DISCOVERY_FILE_TIMEOUT
+DISCOVERY_START_TIMEOUT = float(os.environ.get('DISCOVERY_START_TIMEOUT', '60'))
+# spawn, nie fork: procesy startują z wątków żądań Flaska, a fork wielowątkowego procesu może skopiować
+# zablokowane locki (cache, logging) i zawiesić potomka
+_DISCOVERY_MP = multiprocessing.get_context('spawn')
+
+
+def _discovery_worker(pkl_path, conn):
+    """Proces potomny: wysyła None (start pracy), potem (True, subjecty) albo (False, wyjątek) i kończy się."""
+    conn.send(None)
+    try:
+        result = (True, discover_subjects_in_file(pkl_path))
+    except Exception as e:
+        result = (False, e)
+    try:
+        conn.send(result)
+    except Exception as e:
+        # wyjątek, którego nie da się spicklować
+        conn.send((False, RuntimeError(str(result[1]) if not result[0] else str(e))))
+    finally:
+        conn.close()
+
+
+def _start_discovery_process(pkl_path):
+    """Startuje osobny proces dla jednego pliku; zwraca (proces, koniec potoku do odczytu)."""
+    reader, writer = _DISCOVERY_MP.Pipe(duplex=False)
+    proc = _DISCOVERY_MP.Process(target=_discovery_worker, args=(pkl_path, writer), daemon=True,
+                                   name=f'discovery-{os.path.basename(pkl_path)}')
+    proc.start()
+    writer.close()
+    return proc, reader
+
+
+def discover_subjects_parallel(pkl_paths, workers=None, timeout=None):
+    """Generator par (ścieżka, lista subjectów | Exception) w kolejności ukończenia.
+
+    Pliki z aktualnym wpisem w indeksie są zwracane od razu; pozostałe są odpicklowywane
+    w osobnych procesach (jeden proces na plik, najwyżej `workers` naraz), więc limit `timeout`
+    (sekundy) liczy się od faktycznego startu pracy nad plikiem — po imporcie modułu w procesie potomnym,
+    który ma osobny limit DISCOVERY_START_TIMEOUT. Proces, który przekroczył limit,
+    jest zabijany (razem z zajętą pamięcią), a jego miejsce dostaje kolejny plik.
+    """
+    workers = DISCOVERY_WORKERS if workers is None else max(1, int(workers))
+    timeout = DISCOVERY_FILE_TIMEOUT if timeout is None else float(timeout)
+    pending = []
+    for p in pkl_paths:
+        try:
+            ident, subjects = _index_lookup(p)
+        except OSError as e:
+            yield p, e
+            continue
+        if subjects is not None:
+            yield p, subjects
+        else:
+            pending.append((p, ident))
+
+    if len(pending) <= 1 or workers == 1:
+        for p, ident in pending:
+            try:
+                subjects = discover_subjects_in_file(p)
+            except Exception as e:
+                yield p, e
+                continue
+            _index_store(ident, subjects)
+            yield p, subjects
+        return
+
+    queue = list(reversed(pending))
+    running = {}  # potok -> (proces, ścieżka, tożsamość, deadline)
+    try:
+        while queue or running:
+            while queue and len(running) < workers:
+                p, ident = queue.pop()
+                proc, reader = _start_discovery_process(p)
+                running[reader] = (proc, p, ident, time.monotonic() + DISCOVERY_START_TIMEOUT + timeout)
+            next_deadline = min(d for _, _, _, d in running.values())
+            ready = _wait_connections(list(running), timeout=max(0.0, next_deadline - time.monotonic()))
+            for reader in ready:
+                proc, p, ident, _ = running.pop(reader)
+                try:
+                    msg = reader.recv()
+                except (EOFError, OSError):
+                    proc.join()
+                    msg = (False, RuntimeError(f'Proces odkrywania dla {os.path.basename(p)} zakończył się bez wyniku (kod {proc.exitcode})'))
+                if msg is None:
+                    # proces gotowy — od teraz liczy się limit na plik
+                    running[reader] = (proc, p, ident, time.monotonic() + timeout)
+                    continue
+                ok, res = msg
+                reader.close()
+                proc.join()
+                if not ok:
+                    yield p, res
+                    continue
+                _index_store(ident, res)
+                yield p, res
+            now = time.monotonic()
+            for reader in [r for r, (_, _, _, d) in running.items() if d <= now]:
+                proc, p, _, _ = running.pop(reader)
+                proc.kill()
+                proc.join()
+                reader.close()
+                yield p, TimeoutError(f'Przekroczono limit {timeout:g}s dla {os.path.basename(p)}')
+    finally:
+        # przerwany generator (np. klient rozłączył strumień) — nie zostawiaj procesów
+        for reader, (proc, _, _, _) in running.items():
+            proc.kill()
+            proc.join()
+            reader.close()
+
+
+def _discovery_ndjson(header, labelled_paths):
+    """Strumień NDJSON: linia nagłówka, jedna linia na plik w kolejności ukończenia, linia podsumowania."""
+    def generate():
+        yield json.dumps(header, ensure_ascii=False) + '\n'
+        labels = dict(labelled_paths)
+        ok = failed = 0
+        for p, res in discover_subjects_parallel([p for p, _ in labelled_paths]):
+            if isinstance(res, Exception):
+                failed += 1
+                line = {'file': labels[p], 'error': str(res)}
+            else:
+                ok += 1
+                line = {'file': labels[p], 'subjects': res}
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+        yield json.dumps({'done': True, 'ok': ok, 'failed': failed}) + '\n'
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+def _discover_by_label(labelled_paths):
+    """{etykieta pliku: subjecty | {'error': ...}} — pliki odkrywane równolegle (discover_subjects_parallel)."""
+    labels = dict(labelled_paths)
+    out = {}
+    for p, res in discover_subjects_parallel([p for p, _ in labelled_paths]):
+        out[labels[p]] = {'error': str(res)} if isinstance(res, Exception) else res
+    return {label: out[label] for _, label in labelled_paths}
+
+
+def _has_discovery_errors(subjects_by_file):
+    return any(isinstance(v, dict) and 'error' in v for v in subjects_by_file.values())
+
+
 @app.route('/participants', methods=['GET'])
+@_conditional(_participants_etag)
 def participants_list():
     """Zwraca listę dostępnych uczestników (przeszukuje .pkl w aktualnym katalogu danych).
     Opcjonalnie: ?file=<filename> aby sprawdzić tylko jeden plik.
+    ?stream=1 zwraca NDJSON: wynik dla każdego pliku zaraz po jego przetworzeniu.
     """
     # Allow searching across all DATA_DIR_CANDIDATES when requested
     search_all = request.args.get('search_all', '0').lower() in ('1', 'true')
     file_filter = request.args.get('file')
+    stream = request.args.get('stream', '0').lower() in ('1', 'true')
 
     if search_all:
-        subjects_by_file = {}
-        files_list = []
+        labelled = []
         for cand in DATA_DIR_CANDIDATES:
             cand_path = cand if os.path.isabs(cand) else os.path.join(BASE_DIR, cand)
             if not os.path.isdir(cand_path):
@@ -1355,13 +3467,8 @@ def participants_list():
             if file_filter:
                 pkls = [p for p in pkls if os.path.basename(p) == file_filter or p == file_filter]
             for p in sorted(pkls):
-                key = f"{os.path.basename(cand_path)}/{os.path.basename(p)}"
-                files_list.append(key)
-                try:
-                    subjects = discover_subjects_in_file(p)
-                    subjects_by_file[key] = subjects
-                except Exception as e:
-                    subjects_by_file[key] = {'error': str(e)}
+                labelled.append((p, f"{os.path.basename(cand_path)}/{os.path.basename(p)}"))
+        files_list = [label for _, label in labelled]
 
         if not files_list:
             return jsonify({'data_dir_candidates': DATA_DIR_CANDIDATES, 'files': [], 'subjects_by_file': {}, 'note': 'Brak plików .pkl w żadnym z katalogów'}), 200
@@ -1369,6 +3476,12 @@ def participants_list():
         if not _is_unpickle_allowed():
             return jsonify({'data_dir_candidates': DATA_DIR_CANDIDATES, 'files': files_list, 'subjects_by_file': {}, 'note': 'Unpickling jest wyłączony. Ustaw ALLOW_UNPICKLE=1 lub dodaj allow_unpickle=1 by zobaczyć subjecty.'})
 
+        if stream:
+            return _discovery_ndjson({'data_dir_candidates': DATA_DIR_CANDIDATES, 'files': files_list}, labelled)
+        subjects_by_file = _discover_by_label(labelled)
+        if _has_discovery_errors(subjects_by_file):
+            # błędy (timeout, nieudany unpickling) nie trafiają do indeksu i są ponawiane — nie mogą utknąć za 304
+            _skip_etag()
         return jsonify({'data_dir_candidates': DATA_DIR_CANDIDATES, 'files': files_list, 'subjects_by_file': subjects_by_file})
 
     # default: search only current data_dir
@@ -1394,14 +3507,12 @@ def participants_list():
             'note': 'Unpickling jest wyłączony. Ustaw ALLOW_UNPICKLE=1 lub dodaj allow_unpickle=1 by zobaczyć subjecty.'
         })
 
-    subjects_by_file = {}
-    for p in sorted(all_pkls):
-        try:
-            subjects = discover_subjects_in_file(p)
-            subjects_by_file[os.path.basename(p)] = subjects
-        except Exception as e:
-            subjects_by_file[os.path.basename(p)] = {'error': str(e)}
-
+    labelled = [(p, os.path.basename(p)) for p in sorted(all_pkls)]
+    if stream:
+        return _discovery_ndjson({'data_dir': data_dir, 'files': [label for _, label in labelled]}, labelled)
+    subjects_by_file = _discover_by_label(labelled)
+    if _has_discovery_errors(subjects_by_file):
+        _skip_etag()
     return jsonify({
         'data_dir': data_dir,
         'files': sorted([os.path.basename(p) for p in all_pkls]),
@@ -1421,10 +3532,8 @@ def _find_default_subject():
 
     subjects = set()
     subjects_by_file = {}
-    for p in pkls:
-        try:
-            subs = discover_subjects_in_file(p)
-        except Exception:
+    for p, subs in discover_subjects_parallel(pkls):
+        if isinstance(subs, Exception):
             subs = []
         subjects_by_file[os.path.basename(p)] = subs
         for s in subs:
@@ -1443,6 +3552,318 @@ def _find_default_subject():
     return None, {'note': 'wiele_subjectów', 'subjects_by_file': subjects_by_file}
 
 
+# ===================== KLIENT HTTP DLA API CZATU =====================
+# Współdzielona pula połączeń keep-alive (http.client) — kolejne wiadomości nie płacą za nowy
+# handshake TCP+TLS. CHAT_API_BASE_URL pozwala podmienić upstream (np. lokalny serwer do benchmarków).
+CHAT_API_BASE_URL = os.environ.get('CHAT_API_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+CHAT_POOL_SIZE = max(1, int(os.environ.get('CHAT_POOL_SIZE', '8')))
+CHAT_CONNECT_TIMEOUT = float(os.environ.get('CHAT_CONNECT_TIMEOUT', '5'))
+# jak przed pulą: 15 s dla chat/completions, 30 s dla wolniejszego Responses API (np. gpt-5-pro)
+CHAT_READ_TIMEOUT = float(os.environ.get('CHAT_READ_TIMEOUT', '15'))
+CHAT_RESPONSES_READ_TIMEOUT = float(os.environ.get('CHAT_RESPONSES_READ_TIMEOUT', '30'))
+CHAT_MAX_RETRIES = max(0, int(os.environ.get('CHAT_MAX_RETRIES', '2')))
+CHAT_RETRY_BACKOFF = float(os.environ.get('CHAT_RETRY_BACKOFF', '0.5'))
+CHAT_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+CHAT_RETRY_MAX_SLEEP = 8.0
+
+
+class _UpstreamResponse:
+    """Odpowiedź z puli. Po przeczytaniu całości połączenie wraca do puli; close() przed końcem je zamyka."""
+
+    def __init__(self, pool, key, conn, resp):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.status = resp.status
+        self.headers = resp.headers
+        self._body = None
+
+    def read(self):
+        if self._body is None:
+            try:
+                self._body = self._resp.read()
+            finally:
+                self.close()
+        return self._body
+
+    @property
+    def text(self):
+        return self.read().decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.read().decode('utf-8'))
+
+    def iter_lines(self):
+        """Linie body (bytes, bez końca linii) w miarę nadchodzenia — do strumieni SSE.
+        Przerywając iterację przed końcem body, wołający powinien wywołać close()."""
+        while True:
+            line = self._resp.readline()
+            if not line:
+                break
+            yield line.rstrip(b'\r\n')
+        self.close()
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._resp.isclosed() and not self._resp.will_close:
+            self._pool._release(self._key, conn)
+        else:
+            conn.close()
+
+
+class _HTTPPool:
+    """Thread-safe pula połączeń HTTP/1.1 keep-alive z ponawianiem przy 429/5xx i błędach połączenia."""
+
+    def __init__(self, max_idle_per_host=CHAT_POOL_SIZE, connect_timeout=CHAT_CONNECT_TIMEOUT,
+                 read_timeout=CHAT_READ_TIMEOUT, max_retries=CHAT_MAX_RETRIES, backoff=CHAT_RETRY_BACKOFF):
+        self.max_idle_per_host = max_idle_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._idle = {}  # (scheme, host, port) -> [HTTPConnection]
+        self.created = 0
+        self.reused = 0
+        self.retries = 0
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop(), True
+            self.created += 1
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = cls(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn, False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        delay = self.backoff * (2 ** attempt)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(min(delay, CHAT_RETRY_MAX_SLEEP))
+
+    def request(self, method, url, body=None, headers=None, read_timeout=None):
+        """Wysyła żądanie; zwraca _UpstreamResponse (body czytane leniwie — read()/json()/iter_lines()).
+
+        read_timeout nadpisuje domyślny timeout odczytu puli dla tego żądania.
+
+        Ponawia (z wykładniczym backoffem, z uwzględnieniem Retry-After) przy statusach 429/5xx
+        oraz przy zerwanym/odrzuconym połączeniu. Przekroczenie read timeoutu nie jest ponawiane.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        attempt = 0
+        while True:
+            try:
+                conn, reused = self._acquire(key)
+            except (ConnectionError, socket.gaierror):
+                if attempt >= self.max_retries:
+                    raise
+                self._count_retry()
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+            try:
+                if conn.sock is not None:
+                    conn.sock.settimeout(read_timeout or self.read_timeout)
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+            except (ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                # zamknięte przez serwer połączenie keep-alive — ponów od razu na nowym
+                if reused:
+                    continue
+                if attempt >= self.max_retries:
+                    raise
+                self._count_retry()
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+            except Exception:
+                conn.close()
+                raise
+            out = _UpstreamResponse(self, key, conn, resp)
+            if resp.status in CHAT_RETRY_STATUSES and attempt < self.max_retries:
+                out.read()
+                self._count_retry()
+                self._sleep_before_retry(attempt, resp.getheader('Retry-After'))
+                attempt += 1
+                continue
+            return out
+
+    def _count_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'retries': self.retries,
+                'idle': sum(len(v) for v in self._idle.values()),
+            }
+
+
+_CHAT_HTTP = _HTTPPool()
+
+
+# Cache odpowiedzi czatu dla powtarzalnych pytań (np. gotowe pytania opiekunów). Domyślnie wyłączony:
+# CHAT_CACHE_TTL > 0 włącza go; cache'owane są tylko zapytania z temperaturą <= CHAT_CACHE_MAX_TEMPERATURE.
+CHAT_CACHE_TTL = float(os.environ.get('CHAT_CACHE_TTL', '0'))
+CHAT_CACHE_MAX_ENTRIES = max(1, int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '256')))
+CHAT_CACHE_MAX_TEMPERATURE = float(os.environ.get('CHAT_CACHE_MAX_TEMPERATURE', '0.3'))
+
+
+class _TTLCache:
+    """Wątkowo-bezpieczny cache LRU z limitem wpisów i czasem życia wpisu (sekundy)."""
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] <= self._clock():
+                del self._items[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (self._clock() + self.ttl, value)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_CHAT_CACHE = _TTLCache(CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_TTL)
+
+
+# Ograniczenie równoległych wywołań upstreamu czatu: najwyżej CHAT_MAX_CONCURRENCY w locie,
+# CHAT_QUEUE_SIZE czekających (do CHAT_QUEUE_TIMEOUT s); reszta dostaje od razu 503 + Retry-After,
+# więc seria wiadomości nie zajmuje wszystkich wątków serwera potrzebnych endpointom danych.
+CHAT_MAX_CONCURRENCY = max(1, int(os.environ.get('CHAT_MAX_CONCURRENCY', '4')))
+CHAT_QUEUE_SIZE = max(0, int(os.environ.get('CHAT_QUEUE_SIZE', '8')))
+CHAT_QUEUE_TIMEOUT = float(os.environ.get('CHAT_QUEUE_TIMEOUT', '10'))
+CHAT_RETRY_AFTER = max(1, int(os.environ.get('CHAT_RETRY_AFTER', '2')))
+
+
+class _ConcurrencyGate:
+    """Semafor z ograniczoną kolejką oczekujących. acquire() zwraca jednorazowy release albo None (odmowa)."""
+
+    def __init__(self, max_concurrency, queue_size, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._sem = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        if not self._sem.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    return None
+                self.waiting += 1
+            try:
+                ok = self._sem.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not ok:
+                with self._lock:
+                    self.timeouts += 1
+                return None
+        with self._lock:
+            self.active += 1
+            self.admitted += 1
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self.active -= 1
+            self._sem.release()
+        return release
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'queue_size': self.queue_size,
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+
+
+_CHAT_GATE = _ConcurrencyGate(CHAT_MAX_CONCURRENCY, CHAT_QUEUE_SIZE, CHAT_QUEUE_TIMEOUT)
+
+
 def _get_chat_api_key():
     """Pobiera klucz API dla usługi czatu.
 
@@ -1467,11 +3888,117 @@ def _get_chat_api_key():
     return None
 
 
+def _sse_event(data, event=None):
+    """Jedno zdarzenie Server-Sent Events (dane jako JSON)."""
+    head = f'event: {event}\n' if event else ''
+    return f'{head}data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def _sse_response(gen):
+    """Response text/event-stream bez buforowania (także przez reverse proxy)."""
+    return Response(gen, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def _iter_sse_data(lines):
+    """Z linii strumienia SSE składa pola `data:` kolejnych zdarzeń (str)."""
+    buf = []
+    for raw in lines:
+        line = raw.decode('utf-8', errors='replace')
+        if not line:
+            if buf:
+                yield '\n'.join(buf)
+                buf = []
+            continue
+        if line.startswith('data:'):
+            buf.append(line[5:].lstrip(' '))
+    if buf:
+        yield '\n'.join(buf)
+
+
+def _stream_delta(obj):
+    """Fragment tekstu z jednego zdarzenia upstreamu: (delta | None, błąd | None).
+
+    Obsługuje chat completions (choices[0].delta.content) i Responses API
+    (response.output_text.delta / error / response.failed).
+    """
+    if not isinstance(obj, dict):
+        return None, None
+    kind = obj.get('type')
+    if kind == 'response.output_text.delta':
+        return obj.get('delta'), None
+    if kind in ('error', 'response.failed'):
+        err = obj.get('error') or (obj.get('response') or {}).get('error') or obj
+        return None, err.get('message') if isinstance(err, dict) else str(err)
+    if 'error' in obj:
+        err = obj['error']
+        return None, err.get('message') if isinstance(err, dict) else str(err)
+    choices = obj.get('choices')
+    if choices and isinstance(choices[0], dict):
+        delta = choices[0].get('delta') or {}
+        content = delta.get('content') if isinstance(delta, dict) else None
+        return (content if isinstance(content, str) else None), None
+    return None, None
+
+
+def _chat_sse_proxy(resp, on_done=None):
+    """Przekazuje strumień tokenów upstreamu do przeglądarki jako SSE, bez czekania na całą odpowiedź.
+    on_done(reply) jest wołane po poprawnym zakończeniu strumienia."""
+    parts = []
+    finished = False
+    try:
+        for data in _iter_sse_data(resp.iter_lines()):
+            if data == '[DONE]':
+                finished = True
+                break
+            try:
+                obj = json.loads(data)
+            except ValueError:
+                continue
+            delta, error = _stream_delta(obj)
+            if error:
+                yield _sse_event({'error': error}, event='error')
+                return
+            if delta:
+                parts.append(delta)
+                yield _sse_event({'delta': delta})
+            if obj.get('type') == 'response.completed':
+                finished = True
+                break
+        else:
+            finished = True
+    except Exception as e:
+        yield _sse_event({'error': f'Przerwany strumień z API czatu: {e}'}, event='error')
+        return
+    finally:
+        if finished:
+            # doczytaj koniec body, żeby połączenie wróciło do puli
+            try:
+                resp.read()
+            except Exception:
+                pass
+        resp.close()
+    reply = ''.join(parts)
+    if on_done is not None and reply:
+        on_done(reply)
+    yield _sse_event({'reply': reply}, event='done')
+
+
+def _cached_chat_sse(reply):
+    """Odpowiedź z cache w tym samym formacie SSE co strumień z upstreamu."""
+    yield _sse_event({'delta': reply})
+    yield _sse_event({'reply': reply}, event='done')
+
+
 @app.route('/api/chat', methods=['POST'])
 def api_chat():
     """Prosty proxy do OpenAI (chat completions). Oczekuje JSON { message: str }.
 
     Zwraca JSON { reply: str } lub odpowiedni kod błędu.
+    Z { stream: true } zwraca text/event-stream: zdarzenia `data: {"delta": "..."}` w miarę
+    generowania, na końcu `event: done` z pełną odpowiedzią (albo `event: error`).
     Uwaga: trzymanie klucza po stronie serwera jest bezpieczniejsze niż w front-endzie.
     """
     try:
@@ -1493,6 +4020,8 @@ def api_chat():
     # opcjonalna rola/system prompt
     assistant_role = payload.get('assistant_role')
     custom_system = payload.get('system')
+    # stream=true: odpowiedź jako Server-Sent Events, token po tokenie
+    stream = str(payload.get('stream', '')).lower() in ('1', 'true')
 
     api_key = _get_chat_api_key()
     if not api_key:
@@ -1576,6 +4105,16 @@ def api_chat():
         messages.append({'role': 'system', 'content': system_message})
     messages.append({'role': 'user', 'content': user_message})
 
+    # cache tylko dla niskiej temperatury (odpowiedzi prawie deterministyczne); 'cache': false pomija go
+    cache_key = None
+    if CHAT_CACHE_TTL > 0 and temperature <= CHAT_CACHE_MAX_TEMPERATURE and payload.get('cache', True) is not False:
+        cache_key = (model, system_message, user_message, temperature, max_tokens)
+        cached = _CHAT_CACHE.get(cache_key)
+        if cached is not None:
+            resp = _sse_response(_cached_chat_sse(cached)) if stream else jsonify({'reply': cached})
+            resp.headers['X-Chat-Cache'] = 'hit'
+            return resp
+
     body = {
         'model': model,
         'messages': messages,
@@ -1595,37 +4134,37 @@ def api_chat():
                 'input': (system_message + "\n\n" + user_message) if system_message else user_message,
                 'max_output_tokens': max_tokens,
             }
-            if requests is not None:
-                resp = requests.post('https://api.openai.com/v1/responses', headers=headers, json=body_resp, timeout=30)
-                if resp.status_code != 200:
-                    try:
-                        return jsonify({'error': 'Błąd od OpenAI', 'details': resp.text}), resp.status_code
-                    except Exception:
-                        return jsonify({'error': 'Błąd od OpenAI', 'status': resp.status_code}), resp.status_code
-                data = resp.json()
-            else:
-                import urllib.request as _ur
-                req = _ur.Request('https://api.openai.com/v1/responses', data=json.dumps(body_resp).encode('utf-8'), headers=headers)
-                with _ur.urlopen(req, timeout=30) as r:
-                    raw = r.read().decode('utf-8')
-                data = json.loads(raw)
+            url, upstream_body = f'{CHAT_API_BASE_URL}/responses', body_resp
+            read_timeout = CHAT_RESPONSES_READ_TIMEOUT
         else:
             # Chat completions endpoint for chat-style models
-            if requests is not None:
-                resp = requests.post('https://api.openai.com/v1/chat/completions', headers=headers, json=body, timeout=15)
-                if resp.status_code != 200:
-                    try:
-                        return jsonify({'error': 'Błąd od OpenAI', 'details': resp.text}), resp.status_code
-                    except Exception:
-                        return jsonify({'error': 'Błąd od OpenAI', 'status': resp.status_code}), resp.status_code
-                data = resp.json()
-            else:
-                # fallback na urllib jeśli requests nie jest zainstalowany
-                import urllib.request as _ur
-                req = _ur.Request('https://api.openai.com/v1/chat/completions', data=json.dumps(body).encode('utf-8'), headers=headers)
-                with _ur.urlopen(req, timeout=15) as r:
-                    raw = r.read().decode('utf-8')
-                data = json.loads(raw)
+            url, upstream_body = f'{CHAT_API_BASE_URL}/chat/completions', body
+            read_timeout = CHAT_READ_TIMEOUT
+
+        if stream:
+            upstream_body = dict(upstream_body, stream=True)
+            headers = dict(headers, Accept='text/event-stream')
+        release = _CHAT_GATE.acquire()
+        if release is None:
+            busy = jsonify({'error': 'Za dużo równoległych zapytań do czatu. Spróbuj ponownie za chwilę.'})
+            busy.headers['Retry-After'] = str(CHAT_RETRY_AFTER)
+            return busy, 503
+        try:
+            resp = _CHAT_HTTP.request('POST', url, body=json.dumps(upstream_body).encode('utf-8'), headers=headers,
+                                      read_timeout=read_timeout)
+            if resp.status != 200:
+                return jsonify({'error': 'Błąd od OpenAI', 'details': resp.text}), resp.status
+            if stream:
+                on_done = (lambda reply: _CHAT_CACHE.put(cache_key, reply)) if cache_key else None
+                out = _sse_response(_chat_sse_proxy(resp, on_done))
+                # slot zwalniany dopiero po zakończeniu (lub zerwaniu) strumienia
+                out.call_on_close(release)
+                release = None
+                return out
+            data = resp.json()
+        finally:
+            if release is not None:
+                release()
 
         # parsuj odpowiedź — obsłuż zarówno chat/completions jak i responses API
         reply = None
@@ -1688,6 +4227,8 @@ def api_chat():
                 reply = json.dumps(data)[:2000]
             except Exception:
                 reply = str(data)[:2000]
+        elif cache_key:
+            _CHAT_CACHE.put(cache_key, reply)
 
         return jsonify({'reply': reply})
     except Exception as e:
@@ -1716,26 +4257,14 @@ def participant_auto():
     return get_participant_info(str(subject_id))
 
 
-@app.route('/api/stress_state', methods=['GET'])
-def api_stress_state():
-    """Zwraca stan stresu dla wybranego uczestnika oraz (opcjonalnie) prostą historię.
-
-    Query params:
-      - subject: np. S2 lub 2 (opcjonalne; gdy brak spróbujemy autodetekcji)
-      - range: "start:end" (indeksy próbek, opcjonalne) – dotyczy wszystkich kanałów
-      - windows: liczba okien do historii (np. 20). Jeśli >0, policzymy historię.
-      - window_size: rozmiar okna w próbkach (np. 500). Domyślnie 300.
-      - allow_unpickle=1: wymagane jeśli unpickling nie włączony env-em
-    """
-    # bezpieczeństwo unpicklingu jak w innych endpointach
-    if not _is_unpickle_allowed():
-        return jsonify({'error': 'Unpickling jest wyłączony. Ustaw ALLOW_UNPICKLE=1 lub dodaj allow_unpickle=1.'}), 403
-
+def _stress_state_params():
+    """Parametry /api/stress_state z query: ((subject_id, start, end, windows, window_size), None)
+    albo (None, odpowiedź błędu)."""
     subj = request.args.get('subject')
     if not subj:
         subj, info = _find_default_subject()
         if not subj:
-            return jsonify({'error': 'Nie można automatycznie wykryć uczestnika', 'info': info}), 400
+            return None, (jsonify({'error': 'Nie można automatycznie wykryć uczestnika', 'info': info}), 400)
 
     # normalizuj subject (S2 -> 2)
     if isinstance(subj, str) and subj.upper().startswith('S') and subj[1:].isdigit():
@@ -1755,52 +4284,70 @@ def api_stress_state():
         except Exception:
             sstart = send = None
 
-    def _slice_seq(obj, start=None, end=None):
-        try:
-            import numpy as _np
-            import pandas as _pd
-        except Exception:
-            _np = None
-            _pd = None
-        try:
-            if start is None and end is None:
-                return obj
-            if _pd is not None and (isinstance(obj, _pd.Series) or isinstance(obj, _pd.DataFrame)):
-                return obj.iloc[start:end]
-            if isinstance(obj, (list, tuple)):
-                return list(obj)[start:end]
-            if _np is not None and isinstance(obj, _np.ndarray):
-                return obj[start:end]
-            return obj
-        except Exception:
-            return obj
+    try:
+        windows = max(0, min(int(request.args.get('windows', 0)), STRESS_MAX_WINDOWS))
+    except Exception:
+        windows = 0
+    try:
+        window_size = int(request.args.get('window_size', 300))
+    except Exception:
+        window_size = 300
+
+    return (subject_id, sstart, send, windows, window_size), None
+
 
+def _compute_stress_state(subject_id, sstart, send, windows, window_size):
+    """Stan stresu i historia okien dla uczestnika: (wynik, None) albo (None, komunikat błędu 404)."""
+    # Precomputed features from CSV (jeśli brak — policzymy z sygnałów)
+    feats = None
+    csv_error = None
     try:
-    # Load precomputed features from CSV
-        data = load_participant_features(subject_id)  # your CSV loader
-    except FileNotFoundError as e:
-        return jsonify({'error': str(e)}), 404
+        feats = load_participant_features(subject_id)
+    except (FileNotFoundError, ValueError) as e:
+        csv_error = e
 
-    # Use the loaded features directly
-    feats = data  # already dict with mean_eda, hr, hrv, temp, emg, acc_rms
+    raw_signals = None
+    if windows > 0 or feats is None:
+        raw_signals = _load_raw_signals(subject_id)
+
+    if feats is None:
+        whole = _windowed_features(raw_signals, 1, None, sstart, send) if raw_signals is not None else []
+        if not whole:
+            return None, str(csv_error)
+        feats = whole[0]['features']
 
     # Determine state
     state = classify(feats)
+    # Compute simple score (0-100)
+    score = _stress_score(feats)
 
-    # Compute simple score (0-100) like before
-    stress_conditions = [
-        feats.get('mean_eda') is not None and feats['mean_eda'] > 0.761343,
-        feats.get('hr') is not None and feats['hr'] > 66.870546,
-        feats.get('hrv') is not None and feats['hrv'] < 325.906461,
-        feats.get('temp') is not None and feats['temp'] < 31.217497,
-        feats.get('acc_rms') is not None and feats['acc_rms'] > 1.015106,
-    ]
-    known = [c for c in stress_conditions if c is True or c is False]
-    score = int(round(100 * (sum(1 for c in known if c) / len(known)))) if known else None
-
-    # History and trend: can be kept empty or derived from multiple rows if you like
+    # History: okna z surowych sygnałów (jedno wektorowe przejście), a gdy ich brak — wiersze CSV
     history = []
-    trend = 'stabilny'
+    history_source = None
+    if windows > 0:
+        if raw_signals is not None:
+            history = _windowed_features(raw_signals, windows, window_size, sstart, send)
+            history_source = 'signals'
+        if not history:
+            try:
+                rows = load_participant_feature_rows(subject_id).tail(windows)
+            except (FileNotFoundError, ValueError):
+                rows = None
+            if rows is not None:
+                for _, row in rows.iterrows():
+                    wf = {k: (None if pd.isna(row.get(k)) else float(row.get(k))) for k in CLASSIFY_FEATURES}
+                    history.append({
+                        'start_s': None if pd.isna(row.get('t_start_s')) else float(row.get('t_start_s')),
+                        'end_s': None if pd.isna(row.get('t_end_s')) else float(row.get('t_end_s')),
+                        'features': wf,
+                    })
+                history_source = 'csv'
+        # stan i wynik wszystkich okien w jednym przejściu
+        batch = classify_batch([h['features'] for h in history])
+        for h, st, sc in zip(history, batch['state'].tolist(), batch['score'].tolist()):
+            h['state'] = st
+            h['score'] = None if math.isnan(sc) else int(sc)
+    trend = _stress_trend([h['score'] for h in history])
 
     result = {
         'subject': f"S{subject_id}",
@@ -1811,10 +4358,566 @@ def api_stress_state():
         'history': history,
         'generated_at': datetime.utcnow().isoformat() + 'Z'
     }
+    if history_source:
+        result['history_source'] = history_source
     make_json_safe(result)
+    return result, None
+
+
+@app.route('/api/stress_state', methods=['GET'])
+@_conditional(_stress_state_etag, weak=True)  # treść zawiera generated_at
+def api_stress_state():
+    """Zwraca stan stresu dla wybranego uczestnika oraz (opcjonalnie) prostą historię.
+
+    Query params:
+      - subject: np. S2 lub 2 (opcjonalne; gdy brak spróbujemy autodetekcji)
+      - range: "start:end" (indeksy próbek, opcjonalne) – dotyczy wszystkich kanałów
+      - windows: liczba okien do historii (np. 20). Jeśli >0, policzymy historię.
+      - window_size: rozmiar okna w próbkach (np. 500). Domyślnie 300.
+      - allow_unpickle=1: wymagane jeśli unpickling nie włączony env-em
+
+    Granice okien w `history` zależą od źródła (pole `history_source`):
+      - 'signals': start_sample / end_sample — indeksy próbek kanału referencyjnego (jak w `range`),
+      - 'csv': start_s / end_s — sekundy z kolumn t_start_s / t_end_s pliku cech.
+    """
+    # bezpieczeństwo unpicklingu jak w innych endpointach
+    if not _is_unpickle_allowed():
+        return jsonify({'error': 'Unpickling jest wyłączony. Ustaw ALLOW_UNPICKLE=1 lub dodaj allow_unpickle=1.'}), 403
+
+    params, err = _stress_state_params()
+    if err is not None:
+        return err
+    result, error = _compute_stress_state(*params)
+    if error is not None:
+        return jsonify({'error': error}), 404
     return jsonify(result)
 
 
+# Kanał push dla stanu stresu: jedno obliczenie na (uczestnik, parametry) rozsyłane do wszystkich
+# subskrybentów. Co STRESS_STREAM_POLL s sprawdzana jest tożsamość plików źródłowych (pickle/magazyn
+# kolumnowy i CSV cech); nowy stan liczony i wysyłany jest tylko po ich zmianie.
+STRESS_STREAM_POLL = float(os.environ.get('STRESS_STREAM_POLL', '2'))
+STRESS_STREAM_HEARTBEAT = float(os.environ.get('STRESS_STREAM_HEARTBEAT', '15'))
+_STRESS_CHANNELS = {}  # parametry -> _StressChannel
+_STRESS_CHANNELS_LOCK = threading.Lock()
+
+
+def _stress_source_version(subject_id):
+    """Tożsamość danych, z których liczony jest stan (bez ich ładowania)."""
+    _, source = _participant_source(subject_id)
+    try:
+        csv_ident = _file_identity(_features_csv_path(subject_id))
+    except OSError:
+        csv_ident = None
+    return (json.dumps(source, sort_keys=True) if source else None, csv_ident)
+
+
+class _StressChannel:
+    """Ostatni stan dla jednego zestawu parametrów + numer wersji; subskrybenci czekają na Condition."""
+
+    def __init__(self, params):
+        self.params = params
+        self.subscribers = 0
+        self.seq = 0
+        self.event = None  # gotowe zdarzenie SSE dla bieżącej wersji
+        self.computations = 0
+        self._version = object()
+        self._last_check = 0.0
+        self._cond = threading.Condition()
+        self._compute_lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Sprawdza źródła (najwyżej raz na STRESS_STREAM_POLL s) i przelicza stan po zmianie.
+        Liczy tylko jeden wątek; pozostali subskrybenci czekają na wynik."""
+        if not force and time.monotonic() - self._last_check < STRESS_STREAM_POLL:
+            return
+        if not self._compute_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            version = _stress_source_version(self.params[0])
+            if version == self._version:
+                return
+            result, error = _compute_stress_state(*self.params)
+            self.computations += 1
+            event = _sse_event({'error': error}, event='error') if error else _sse_event(result, event='state')
+            with self._cond:
+                self._version = version
+                self.seq += 1
+                self.event = f'id: {self.seq}\n' + event
+                self._cond.notify_all()
+        finally:
+            self._compute_lock.release()
+
+    def wait(self, last_seq, timeout):
+        """Czeka aż seq > last_seq (albo timeout). Zwraca (seq, zdarzenie | None)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > last_seq, timeout=timeout)
+            if self.seq > last_seq:
+                return self.seq, self.event
+            return last_seq, None
+
+
+def _stress_channel(params, delta):
+    """Pobiera (tworzy) kanał i zmienia liczbę subskrybentów; pusty kanał jest usuwany."""
+    with _STRESS_CHANNELS_LOCK:
+        ch = _STRESS_CHANNELS.get(params)
+        if ch is None:
+            ch = _STRESS_CHANNELS[params] = _StressChannel(params)
+        ch.subscribers += delta
+        if ch.subscribers <= 0:
+            _STRESS_CHANNELS.pop(params, None)
+        return ch
+
+
+def _stress_stream(params):
+    ch = _stress_channel(params, +1)
+    try:
+        ch.refresh(force=ch.seq == 0)
+        seq = 0
+        last_sent = time.monotonic()
+        while True:
+            seq, event = ch.wait(seq, timeout=min(STRESS_STREAM_POLL, STRESS_STREAM_HEARTBEAT))
+            if event is not None:
+                last_sent = time.monotonic()
+                yield event
+                continue
+            if time.monotonic() - last_sent >= STRESS_STREAM_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+            ch.refresh()
+    finally:
+        _stress_channel(params, -1)
+
+
+@app.route('/api/stress_state/stream', methods=['GET'])
+def api_stress_state_stream():
+    """Server-Sent Events ze stanem stresu (te same parametry co /api/stress_state).
+
+    Zdarzenie `state` (JSON jak w /api/stress_state) jest wysyłane od razu, a potem tylko gdy zmienią się
+    dane źródłowe; `error` gdy danych brak. Wszyscy klienci tego samego uczestnika i parametrów
+    współdzielą jedno obliczenie.
+    """
+    if not _is_unpickle_allowed():
+        return jsonify({'error': 'Unpickling jest wyłączony. Ustaw ALLOW_UNPICKLE=1 lub dodaj allow_unpickle=1.'}), 403
+    params, err = _stress_state_params()
+    if err is not None:
+        return err
+    return _sse_response(_stress_stream(params))
+
+
+CLASSIFY_BATCH_MAX_ROWS = int(os.environ.get('CLASSIFY_BATCH_MAX_ROWS', '100000'))
+
+
+@app.route('/api/classify/batch', methods=['POST'])
+def api_classify_batch():
+    """Klasyfikuje wiele okien naraz.
+
+    Body JSON: lista słowników z cechami, {"rows": [...]} albo kolumnowo {"columns": {"hr": [...], ...}}.
+    Zwraca stany i wyniki 0-100 w kolejności wierszy oraz liczność każdego stanu.
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and isinstance(body.get('columns'), dict):
+        features = body['columns']
+    elif isinstance(body, dict) and isinstance(body.get('rows'), list):
+        features = body['rows']
+    elif isinstance(body, list):
+        features = body
+    else:
+        return jsonify({'error': 'Oczekiwano JSON: lista wierszy, {"rows": [...]} lub {"columns": {...}}'}), 400
+    try:
+        n_rows = len(next(iter(features.values()), [])) if isinstance(features, dict) else len(features)
+        if n_rows > CLASSIFY_BATCH_MAX_ROWS:
+            return jsonify({'error': f'Za dużo wierszy ({n_rows} > {CLASSIFY_BATCH_MAX_ROWS})'}), 413
+        result = classify_batch(features)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Niepoprawne cechy: {e}'}), 400
+
+    states = result['state'].tolist()
+    labels, counts = np.unique(result['state'], return_counts=True)
+    return jsonify({
+        'count': len(states),
+        'state': states,
+        'score': [None if math.isnan(sc) else int(sc) for sc in result['score'].tolist()],
+        'summary': {str(k): int(v) for k, v in zip(labels, counts)},
+    })
+
+
+def _load_raw_signals(subject_id):
+    """Zwraca drzewo sygnałów uczestnika (magazyn kolumnowy albo pickle z cache) lub None gdy niedostępne."""
+    data = load_participant_columnar(subject_id)
+    if data is None:
+        try:
+            data = load_participant_data(subject_id)
+        except Exception:
+            return None
+    if isinstance(data, dict):
+        return data.get('signal', data)
+    return data
+
+
+# ===================== ROZGRZEWANIE CACHE PRZY STARCIE =====================
+# PRELOAD_SUBJECTS="2,3" (lub "auto" = wszystkie subjecty z katalogów danych) ładuje dane,
+# piramidę i tabelę cech w tle, gdy serwer już przyjmuje żądania. Postęp: GET /ready.
+PRELOAD_SUBJECTS = os.environ.get('PRELOAD_SUBJECTS', '')
+PRELOAD_WORKERS = max(1, int(os.environ.get('PRELOAD_WORKERS', '2')))
+_WARMUP_LOCK = threading.Lock()
+_WARMUP = {'state': 'idle', 'total': 0, 'done': 0, 'failed': 0, 'subjects': {}, 'started_at': None, 'finished_at': None}
+
+
+def _normalize_subject_id(subj):
+    """'S2' -> '2'; inne wartości bez zmian."""
+    subj = str(subj).strip()
+    if subj.upper().startswith('S') and subj[1:].isdigit():
+        return subj[1:]
+    return subj
+
+
+def _preload_targets(spec):
+    """Lista subject_id z PRELOAD_SUBJECTS; 'auto' rozwija się do subjectów wykrytych w katalogach danych."""
+    out = []
+    for part in (p.strip() for p in (spec or '').split(',')):
+        if not part:
+            continue
+        if part.lower() != 'auto':
+            out.append(_normalize_subject_id(part))
+            continue
+        for d in _data_dirs():
+            if not os.path.isdir(d):
+                continue
+            for store in sorted(glob.glob(os.path.join(d, '*' + COLUMNAR_SUFFIX))):
+                out.append(_normalize_subject_id(os.path.basename(store)[:-len(COLUMNAR_SUFFIX)]))
+            if not _is_unpickle_allowed():
+                continue
+            for _, subjects in discover_subjects_parallel(sorted(glob.glob(os.path.join(d, '*.pkl')))):
+                if not isinstance(subjects, Exception):
+                    out.extend(_normalize_subject_id(s) for s in subjects)
+    return list(dict.fromkeys(out))
+
+
+def _warm_subject(subject_id):
+    """Ładuje dane uczestnika do cache, buduje piramidę i parsuje tabelę cech. Zwraca listę wykonanych kroków."""
+    steps = []
+    data = load_participant_columnar(subject_id)
+    if data is not None:
+        steps.append('columnar')
+    elif _find_participant_pkl(subject_id) is not None and _is_unpickle_allowed():
+        data = load_participant_data(subject_id)
+        steps.append('pickle')
+    if data is not None:
+        if _ensure_participant_pyramid(subject_id) is not None:
+            steps.append('pyramid')
+    try:
+        _feature_table_entry(subject_id)
+        steps.append('features')
+    except (FileNotFoundError, ValueError):
+        pass
+    if not steps:
+        raise FileNotFoundError(f'Brak danych do rozgrzania dla S{subject_id}')
+    return steps
+
+
+def _run_warmup(targets, workers):
+    def one(subject_id):
+        t0 = time.perf_counter()
+        try:
+            steps = _warm_subject(subject_id)
+            entry = {'state': 'done', 'steps': steps}
+        except Exception as e:
+            entry = {'state': 'failed', 'error': str(e)}
+        entry['seconds'] = round(time.perf_counter() - t0, 3)
+        with _WARMUP_LOCK:
+            _WARMUP['subjects'][subject_id] = entry
+            _WARMUP['done' if entry['state'] == 'done' else 'failed'] += 1
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup') as pool:
+        list(pool.map(one, targets))
+    with _WARMUP_LOCK:
+        _WARMUP['state'] = 'done'
+        _WARMUP['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+
+
+def start_warmup(spec=None, workers=None):
+    """Startuje rozgrzewanie w wątku w tle (nie blokuje startu serwera). Zwraca wątek albo None gdy nic do zrobienia."""
+    spec = PRELOAD_SUBJECTS if spec is None else spec
+    workers = PRELOAD_WORKERS if workers is None else max(1, int(workers))
+    if not (spec or '').strip():
+        return None
+    with _WARMUP_LOCK:
+        if _WARMUP['state'] == 'running':
+            return None
+        _WARMUP.update(state='running', total=0, done=0, failed=0, subjects={},
+                       started_at=datetime.utcnow().isoformat() + 'Z', finished_at=None)
+
+    def run():
+        try:
+            targets = _preload_targets(spec)
+        except Exception:
+            targets = []
+        with _WARMUP_LOCK:
+            _WARMUP['total'] = len(targets)
+            _WARMUP['subjects'] = {t: {'state': 'pending'} for t in targets}
+        _run_warmup(targets, workers)
+
+    t = threading.Thread(target=run, name='warmup', daemon=True)
+    t.start()
+    return t
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Postęp rozgrzewania cache. 200 gdy zakończone (lub nieskonfigurowane), 503 w trakcie."""
+    with _WARMUP_LOCK:
+        status = dict(_WARMUP, subjects={k: dict(v) for k, v in _WARMUP['subjects'].items()})
+    status['ready'] = status['state'] != 'running'
+    return jsonify(status), (200 if status['ready'] else 503)
+
+
+# ===================== PROFILOWANIE NA ŻĄDANIE (?profile=1) =====================
+# Dowolne żądanie z `profile=1` (lub nagłówkiem `X-Profile: 1`) i poprawnym nagłówkiem `X-Profile-Token`
+# jest wykonywane pod cProfile (łącznie z wygenerowaniem całej treści odpowiedzi), a zamiast zwykłej
+# odpowiedzi wraca raport: top-N funkcji jako JSON albo stosy w formacie "collapsed" dla flamegraph.pl /
+# speedscope. Bez ustawionego PROFILE_TOKEN profilowanie jest wyłączone.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '30'))
+PROFILE_MAX_TOP_N = 500
+PROFILE_SORT_KEYS = {'cumulative': 'cumtime', 'tottime': 'tottime', 'calls': 'ncalls'}
+# ile miejsc alokacji zwracać przy profile_memory=1
+PROFILE_MEMORY_TOP_N = 20
+PROFILE_COLLAPSED_MAX_DEPTH = 64
+_PROFILE_LOCK = threading.Lock()  # tracemalloc jest globalny dla procesu — jedno profilowanie naraz
+
+
+def _short_path(filename):
+    """Ścieżka względem projektu, a dla bibliotek dwa ostatnie człony (flask/app.py zamiast app.py)."""
+    if filename.startswith(BASE_DIR + os.sep):
+        return os.path.relpath(filename, BASE_DIR)
+    parts = os.path.normpath(filename).split(os.sep)
+    return '/'.join(parts[-2:])
+
+
+def _func_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # funkcje wbudowane, np. <built-in method builtins.len>
+    return f'{_short_path(filename)}:{line}({name})'
+
+
+def _profile_hotspots(stats, sort, top):
+    """Top-N funkcji z pstats.Stats jako lista słowników (czasy w ms)."""
+    rows = []
+    for func, (cc, nc, tt, ct, _callers) in stats.stats.items():
+        rows.append({
+            'function': _func_label(func),
+            'file': func[0],
+            'line': func[1],
+            'name': func[2],
+            'ncalls': nc,
+            'primitive_calls': cc,
+            'tottime_ms': round(tt * 1000, 3),
+            'cumtime_ms': round(ct * 1000, 3),
+            'percall_cum_ms': round(ct * 1000 / nc, 4) if nc else None,
+        })
+    key = PROFILE_SORT_KEYS[sort]
+    field = {'cumtime': 'cumtime_ms', 'tottime': 'tottime_ms', 'ncalls': 'ncalls'}[key]
+    rows.sort(key=lambda r: r[field], reverse=True)
+    return rows[:top]
+
+
+def _profile_collapsed(stats):
+    """Stosy w formacie collapsed ("a;b;c <µs>") odtworzone z par wywołujący -> wywoływany.
+
+    cProfile nie zapisuje pełnych stosów, więc czas funkcji wywoływanej z kilku miejsc jest dzielony
+    proporcjonalnie do czasu skumulowanego na każdej krawędzi — wystarcza do flamegraphu hotspotów.
+    """
+    callees = {}
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [f for f, v in stats.stats.items() if not any(c in stats.stats for c in v[4])]
+    lines = {}
+
+    def walk(func, budget, path):
+        cc, nc, tt, ct, _callers = stats.stats[func]
+        scale = budget / ct if ct > 0 else 0.0
+        stack = path + (_func_label(func),)
+        self_us = int(round(tt * scale * 1e6))
+        if self_us > 0:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + self_us
+        if len(stack) >= PROFILE_COLLAPSED_MAX_DEPTH:
+            return
+        for child, edge_ct in callees.get(func, ()):
+            if child in seen or edge_ct * scale < 1e-6:
+                continue
+            seen.add(child)
+            walk(child, edge_ct * scale, stack)
+            seen.discard(child)
+
+    for root in roots:
+        seen = {root}
+        walk(root, stats.stats[root][3], ())
+    return ''.join(f'{k} {v}\n' for k, v in sorted(lines.items()))
+
+
+def _profile_memory_report(snapshot, peak, current):
+    top = snapshot.statistics('lineno')[:PROFILE_MEMORY_TOP_N]
+    return {
+        'peak_bytes': peak,
+        'current_bytes': current,
+        'top_allocations': [{
+            'location': f'{_short_path(s.traceback[0].filename)}:{s.traceback[0].lineno}',
+            'file': s.traceback[0].filename,
+            'size_bytes': s.size,
+            'count': s.count,
+        } for s in top],
+    }
+
+
+class _ProfilerMiddleware:
+    """Middleware WSGI: żądania z profile=1 wykonuje pod cProfile i zwraca raport zamiast odpowiedzi."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wrappers import Request as _WRequest, Response as _WResponse
+        req = _WRequest(environ)
+        mode = (req.args.get('profile') or req.headers.get('X-Profile') or '').lower()
+        if mode in ('', '0', 'false'):
+            return self.wsgi_app(environ, start_response)
+
+        def error(message, status):
+            resp = _WResponse(json.dumps({'error': message}, ensure_ascii=False), status=status, mimetype='application/json')
+            return resp(environ, start_response)
+
+        token = req.headers.get('X-Profile-Token', '')
+        if not PROFILE_TOKEN or not hmac.compare_digest(token.encode('utf-8'), PROFILE_TOKEN.encode('utf-8')):
+            return error('Profilowanie wymaga nagłówka X-Profile-Token zgodnego z PROFILE_TOKEN.', 403)
+        fmt = 'collapsed' if mode == 'collapsed' else (req.args.get('profile_format') or 'json').lower()
+        sort = (req.args.get('profile_sort') or 'cumulative').lower()
+        if fmt not in ('json', 'collapsed') or sort not in PROFILE_SORT_KEYS:
+            return error(f'Nieobsługiwany profile_format/profile_sort (json|collapsed, {"|".join(PROFILE_SORT_KEYS)}).', 400)
+        try:
+            top = max(1, min(int(req.args.get('profile_top', PROFILE_TOP_N)), PROFILE_MAX_TOP_N))
+        except ValueError:
+            return error('Niepoprawny profile_top.', 400)
+        memory = (req.args.get('profile_memory') or req.headers.get('X-Profile-Memory') or '0').lower() in ('1', 'true')
+        if not _PROFILE_LOCK.acquire(blocking=False):
+            return error('Inne żądanie jest właśnie profilowane. Spróbuj ponownie za chwilę.', 409)
+        try:
+            report, collapsed = self._profile(environ, fmt, sort, top, memory)
+        finally:
+            _PROFILE_LOCK.release()
+        if fmt == 'collapsed':
+            resp = _WResponse(collapsed, mimetype='text/plain')
+        else:
+            resp = _WResponse(json.dumps(report, ensure_ascii=False, default=str), mimetype='application/json')
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp(environ, start_response)
+
+    def _profile(self, environ, fmt, sort, top, memory):
+        captured = {}
+
+        def inner_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            return lambda data: None
+
+        started_tracemalloc = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        if memory:
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        nbytes = 0
+        t0 = time.perf_counter()
+        profiler.enable()
+        try:
+            body = self.wsgi_app(environ, inner_start_response)
+            try:
+                sse = any(k.lower() == 'content-type' and v.startswith('text/event-stream')
+                          for k, v in captured.get('headers', ()))
+                for chunk in body:
+                    nbytes += len(chunk)
+                    if sse:
+                        break  # strumień SSE nie kończy się sam — profilujemy do pierwszego zdarzenia
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - t0
+            mem = None
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+                mem = _profile_memory_report(tracemalloc.take_snapshot(), peak, current)
+                if started_tracemalloc:
+                    tracemalloc.stop()
+        stats = pstats.Stats(profiler)
+        headers = dict(captured.get('headers', ()))
+        report = {
+            'profile': {
+                'method': environ.get('REQUEST_METHOD'),
+                'path': environ.get('PATH_INFO'),
+                'status': captured.get('status'),
+                'wall_ms': round(wall * 1000, 3),
+                'response_bytes': nbytes,
+                'server_timing': headers.get('Server-Timing'),
+                'sort': sort,
+                'total_calls': stats.total_calls,
+                'primitive_calls': stats.prim_calls,
+                'total_tt_ms': round(stats.total_tt * 1000, 3),
+            },
+            'hotspots': _profile_hotspots(stats, sort, top),
+        }
+        if mem is not None:
+            report['memory'] = mem
+        return report, (_profile_collapsed(stats) if fmt == 'collapsed' else None)
+
+
+app.wsgi_app = _ProfilerMiddleware(app.wsgi_app)
+
+
+def _reloader_supervisor():
+    """True w procesie nadzorującym reloadera (`flask run --debug` / `--reload`): on tylko pilnuje plików
+    i uruchamia proces potomny (WERKZEUG_RUN_MAIN=true), który faktycznie obsługuje żądania."""
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        return False
+    argv = sys.argv
+    prog = os.path.basename(argv[0]) if argv else ''
+    is_flask_run = (prog.split('.')[0] == 'flask' or argv[0].endswith(os.path.join('flask', '__main__.py'))) \
+        and 'run' in argv[1:]
+    if not is_flask_run or '--no-reload' in argv:
+        return False
+    if '--reload' in argv:
+        return True
+    reload_env = os.environ.get('FLASK_RUN_RELOAD')
+    if reload_env is not None:
+        return reload_env.lower() not in ('', '0', 'false')
+    return '--debug' in argv or os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true')
+
+
+def _autostart_warmup():
+    """Rozgrzewanie przy imporcie (flask run, gunicorn, waitress...) — raz, w procesie obsługującym żądania."""
+    # procesy odkrywania (spawn) importują app.py — one niczego nie rozgrzewają
+    if multiprocessing.parent_process() is not None or _reloader_supervisor():
+        return None
+    return start_warmup()
+
+
+if __name__ != '__main__':
+    _autostart_warmup()
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    if len(sys.argv) > 1 and sys.argv[1] == 'ingest':
+        sys.exit(_ingest_cli(sys.argv[2:]))
+    # FLASK_RUN_RELOAD=0 wyłącza reloader (jak `flask run --no-reload`); z reloaderem proces nadzorujący
+    # tylko uruchamia potomka — rozgrzewa proces, który obsługuje żądania
+    use_reloader = os.environ.get('FLASK_RUN_RELOAD', '1').lower() not in ('0', 'false')
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
+    app.run(debug=True, use_reloader=use_reloader)
 # uruchom serwer Flask
\ No newline at end of file
@@ -0,0 +1 @@
+"""Generator syntetycznych danych WESAD i benchmarki backendu (`python -m bench.run`)."""
@@ -0,0 +1,289 @@
+"""Benchmarki backendu na syntetycznych danych WESAD.
+
+Każdy benchmark działa w osobnym procesie (dzięki temu szczytowe RSS dotyczy tylko jego),
+mierzy czas pojedynczych wywołań i zapisuje przepustowość, p50/p99 i szczytowe RSS do pliku JSON:
+
+    python -m bench.run --duration 1800 --repeat 20
+    python -m bench.run --only endpoint.participant_full --compare bench/results/poprzedni.json
+
+Bez --data dane są generowane do katalogu tymczasowego (bench.synth_wesad).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS_DIR = os.path.join(HERE, 'results')
+SUBJECT = '2'           # pickle
+COLUMNAR_SUBJECT = '3'  # ten sam kształt danych, ale przekonwertowany `ingest`
+
+
+def _peak_rss_mb():
+    """Szczytowe RSS bieżącego procesu w MiB (None gdy platforma go nie udostępnia)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux podaje KiB, macOS bajty
+        return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil  # type: ignore
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 1024 ** 2, 1)
+    except Exception:
+        return None
+
+
+def _configure_app(data_dir):
+    os.environ['ALLOW_UNPICKLE'] = '1'
+    sys.path.insert(0, ROOT)
+    import app
+    app.CURRENT_DATA_DIR = data_dir
+    app.DATA_DIR_CANDIDATES = [data_dir]
+    app.FEATURES_DIR = os.path.join(data_dir, 'features')
+    app.app.config['TESTING'] = True
+    return app
+
+
+def _get(client, url):
+    def call():
+        resp = client.get(url)
+        assert resp.status_code == 200, (url, resp.status_code, resp.get_data()[:200])
+        return resp.get_data()
+    return call
+
+
+def _post(client, url, payload):
+    def call():
+        resp = client.post(url, json=payload)
+        assert resp.status_code == 200, (url, resp.status_code)
+        return resp.get_data()
+    return call
+
+
+# nazwa -> funkcja(app, data_dir) zwracająca wywołanie do zmierzenia
+def _bench_safe_pickle_load(app, data_dir):
+    path = os.path.join(data_dir, f'S{SUBJECT}.pkl')
+
+    def call():
+        with open(path, 'rb') as f:
+            return app._safe_pickle_load(f)
+    return call
+
+
+def _bench_load_cold(app, data_dir):
+    def call():
+        app._PICKLE_CACHE.clear()
+        return app.load_participant_data(SUBJECT)
+    return call
+
+
+def _bench_load_warm(app, data_dir):
+    app.load_participant_data(SUBJECT)
+    return lambda: app.load_participant_data(SUBJECT)
+
+
+def _bench_extract_features(app, data_dir):
+    signal = app.load_participant_data(SUBJECT)['signal']
+    return lambda: app._extract_features_from_signals(signal)
+
+
+def _bench_windowed_features(app, data_dir):
+    signal = app.load_participant_data(SUBJECT)['signal']
+    return lambda: app._windowed_features(signal, 50, 7000)
+
+
+def _bench_summarize_full(app, data_dir):
+    eda = app.load_participant_data(SUBJECT)['signal']['chest']['EDA']
+    return lambda: app._summarize_object(eda, include_full=True, max_full=app.MAX_FULL_IN_SUMMARY)
+
+
+def _bench_classify_batch(app, data_dir):
+    import pandas as pd
+    rows = pd.read_csv(os.path.join(data_dir, 'features', f'S{SUBJECT}.csv'))
+    rows = pd.concat([rows] * (10000 // len(rows) + 1), ignore_index=True).head(10000)
+    return lambda: app.classify_batch(rows)
+
+
+def _bench_columnar(app, data_dir):
+    if app.load_participant_columnar(COLUMNAR_SUBJECT) is None:
+        app.ingest_pickle_to_columnar(os.path.join(data_dir, f'S{COLUMNAR_SUBJECT}.pkl'))
+    return _get(app.app.test_client(), f'/participant/{COLUMNAR_SUBJECT}?n=20')
+
+
+def _endpoint(url):
+    return lambda app, data_dir: _get(app.app.test_client(), url)
+
+
+def _bench_classify_endpoint(app, data_dir):
+    import pandas as pd
+    rows = pd.read_csv(os.path.join(data_dir, 'features', f'S{SUBJECT}.csv'))
+    rows = rows[list(app.CLASSIFY_FEATURES)].to_dict(orient='records')
+    payload = {'rows': (rows * (1000 // len(rows) + 1))[:1000]}
+    return _post(app.app.test_client(), '/api/classify/batch', payload)
+
+
+_P = f'/participant/{SUBJECT}?allow_unpickle=1'
+BENCHMARKS = {
+    'fn.safe_pickle_load': _bench_safe_pickle_load,
+    'fn.load_participant_data.cold': _bench_load_cold,
+    'fn.load_participant_data.warm': _bench_load_warm,
+    'fn.extract_features_from_signals': _bench_extract_features,
+    'fn.windowed_features': _bench_windowed_features,
+    'fn.summarize_object_full': _bench_summarize_full,
+    'fn.classify_batch_10k': _bench_classify_batch,
+    'endpoint.participant_summary': _endpoint(_P + '&n=20'),
+    'endpoint.participant_full': _endpoint(_P + '&full=1'),
+    'endpoint.participant_full_stream': _endpoint(_P + '&full=1&stream=1'),
+    'endpoint.participant_binary': _endpoint(_P + '&format=bin&dtype=float32'),
+    'endpoint.participant_resolution': _endpoint(_P + '&resolution=2000'),
+    'endpoint.participant_columnar': _bench_columnar,
+    'endpoint.participants': _endpoint('/participants?allow_unpickle=1'),
+    'endpoint.stress_state': _endpoint(f'/api/stress_state?subject=S{SUBJECT}&windows=20&window_size=7000&allow_unpickle=1'),
+    'endpoint.classify_batch': _bench_classify_endpoint,
+    'endpoint.cache_stats': _endpoint('/cache_stats'),
+    'endpoint.metrics': _endpoint('/metrics'),
+}
+
+
+def run_benchmark(name, data_dir, repeat, warmup=1):
+    """Uruchamia jeden benchmark w bieżącym procesie i zwraca słownik wyników."""
+    app = _configure_app(data_dir)
+    call = BENCHMARKS[name](app, data_dir)
+    for _ in range(warmup):
+        call()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t0)
+    arr = np.array(times)
+    return {
+        'n': repeat,
+        'total_s': round(float(arr.sum()), 6),
+        'throughput_per_s': round(repeat / float(arr.sum()), 3) if arr.sum() > 0 else None,
+        'mean_ms': round(float(arr.mean()) * 1e3, 3),
+        'p50_ms': round(float(np.percentile(arr, 50)) * 1e3, 3),
+        'p99_ms': round(float(np.percentile(arr, 99)) * 1e3, 3),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _run_isolated(name, data_dir, repeat):
+    cmd = [sys.executable, '-m', 'bench.run', '--worker', name, '--data', data_dir, '--repeat', str(repeat)]
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'error': (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _print_table(results, previous=None):
+    head = f"{'benchmark':42} {'p50 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'RSS MiB':>9}"
+    if previous:
+        head += f" {'p50 vs poprz.':>14}"
+    print(head)
+    for name, r in results.items():
+        if 'error' in r:
+            print(f'{name:42} BŁĄD: {r["error"]}')
+            continue
+        line = f"{name:42} {r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['throughput_per_s'] or 0:>10.1f} {r['peak_rss_mb'] or 0:>9.1f}"
+        prev = (previous or {}).get(name)
+        if prev and prev.get('p50_ms'):
+            line += f" {r['p50_ms'] / prev['p50_ms']:>13.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmarki backendu WESAD')
+    ap.add_argument('--data', help='katalog z S2.pkl, S3.pkl i features/ (domyślnie: wygeneruj)')
+    ap.add_argument('--duration', type=float, default=600, help='długość generowanej sesji w sekundach')
+    ap.add_argument('--repeat', type=int, default=10, help='liczba mierzonych wywołań na benchmark')
+    ap.add_argument('--only', help='lista nazw (przecinki) lub prefiksów, np. fn. albo endpoint.participant')
+    ap.add_argument('--output', help='plik wynikowy JSON (domyślnie bench/results/<czas>-<commit>.json)')
+    ap.add_argument('--compare', help='poprzedni plik wyników do porównania p50')
+    ap.add_argument('--no-isolate', action='store_true', help='wszystkie benchmarki w jednym procesie')
+    ap.add_argument('--worker', help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_benchmark(args.worker, args.data, args.repeat)))
+        return 0
+
+    names = list(BENCHMARKS)
+    if args.only:
+        wanted = [w.strip() for w in args.only.split(',') if w.strip()]
+        names = [n for n in names if any(n == w or n.startswith(w) for w in wanted)]
+        if not names:
+            ap.error(f'Brak benchmarków pasujących do {args.only}')
+
+    tmp = None
+    data_dir = args.data
+    if not data_dir:
+        from bench.synth_wesad import write_dataset
+        tmp = data_dir = tempfile.mkdtemp(prefix='wesad-bench-')
+        print(f'Generuję dane ({args.duration:g} s na uczestnika) w {data_dir} ...')
+        write_dataset(data_dir, [SUBJECT, COLUMNAR_SUBJECT], args.duration, seed=0,
+                      features_dir=os.path.join(data_dir, 'features'))
+
+    try:
+        results = {}
+        for name in names:
+            if args.no_isolate:
+                results[name] = run_benchmark(name, data_dir, args.repeat)
+            else:
+                results[name] = _run_isolated(name, data_dir, args.repeat)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    commit = _git_commit()
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    report = {
+        'meta': {
+            'timestamp': stamp,
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'duration_s': args.duration if not args.data else None,
+            'data_dir': args.data,
+            'repeat': args.repeat,
+            'isolated': not args.no_isolate,
+        },
+        'results': results,
+    }
+    out = args.output or os.path.join(RESULTS_DIR, f'{stamp}-{commit or "nogit"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f).get('results')
+    _print_table(results, previous)
+    print(f'Wyniki: {out}')
+    return 1 if any('error' in r for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
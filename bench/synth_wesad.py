@@ -0,0 +1,141 @@
+"""Generator syntetycznych plików S{n}.pkl o strukturze WESAD.
+
+Struktura jak w oryginalnym zbiorze:
+  - signal.chest (RespiBAN, 700 Hz): ACC (n, 3), ECG, EMG, EDA, Temp, Resp (n, 1)
+  - signal.wrist (Empatica E4): ACC (32 Hz, 3 osie), BVP (64 Hz), EDA i TEMP (4 Hz)
+  - label (700 Hz): 0 = przejście, 1 = baseline, 2 = stres, 3 = rozrywka, 4 = medytacja
+
+Sygnały są przybliżone (sinusoidy + szum + wolny dryf, wyższe EDA/HR i niższa temperatura w fazie
+stresu), ale mają realne rozmiary, dtype i częstotliwości — do pomiarów wydajności, nie do analiz.
+
+    python -m bench.synth_wesad --out ./synth --subjects 2,3 --duration 600
+"""
+import argparse
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+CHEST_FS = 700
+WRIST_FS = {'ACC': 32, 'BVP': 64, 'EDA': 4, 'TEMP': 4}
+# kolejność i udział faz protokołu (przejścia 0 między fazami)
+PROTOCOL = ((1, 0.30), (0, 0.03), (2, 0.15), (0, 0.03), (3, 0.10), (0, 0.03), (4, 0.10), (0, 0.03), (1, 0.23))
+STRESS_LABEL = 2
+
+
+def _labels(n):
+    bounds = np.cumsum([0] + [int(round(frac * n)) for _, frac in PROTOCOL])
+    bounds[-1] = n
+    labels = np.zeros(n, dtype=np.int32)
+    for (label, _), a, b in zip(PROTOCOL, bounds[:-1], bounds[1:]):
+        labels[a:b] = label
+    return labels
+
+
+def _stress_mask(labels, fs):
+    """Maska fazy stresu przeskalowana z 700 Hz na częstotliwość `fs`."""
+    idx = (np.arange(int(len(labels) * fs / CHEST_FS)) * (CHEST_FS / fs)).astype(np.int64)
+    return labels[np.minimum(idx, len(labels) - 1)] == STRESS_LABEL
+
+
+def make_subject(subject_id, duration_s, seed=None):
+    """Słownik uczestnika w formacie WESAD dla sesji trwającej `duration_s` sekund."""
+    rng = np.random.default_rng(seed if seed is not None else int(subject_id))
+    n = int(duration_s * CHEST_FS)
+    t = np.arange(n) / CHEST_FS
+    labels = _labels(n)
+    stress = (labels == STRESS_LABEL).astype(np.float64)
+
+    hr = 65 + 12 * stress + rng.normal(0, 1, n).cumsum() / np.sqrt(n)  # bpm
+    phase = 2 * np.pi * np.cumsum(hr / 60.0) / CHEST_FS
+    chest = {
+        'ACC': np.column_stack([
+            0.9 + 0.02 * rng.standard_normal(n),
+            -0.05 + 0.02 * rng.standard_normal(n),
+            0.3 + 0.02 * rng.standard_normal(n),
+        ]),
+        'ECG': (np.sin(phase) ** 15 * 1.2 - 0.1 + 0.03 * rng.standard_normal(n)).reshape(-1, 1),
+        'EMG': (0.01 * rng.standard_normal(n) * (1 + stress)).reshape(-1, 1),
+        'EDA': (2.0 + 0.5 * np.sin(2 * np.pi * t / 300) + 3.0 * stress + 0.01 * rng.standard_normal(n)).reshape(-1, 1),
+        'Temp': (34.0 - 0.6 * stress + 0.01 * rng.standard_normal(n)).astype(np.float32).reshape(-1, 1),
+        'Resp': (np.sin(2 * np.pi * t * (0.25 + 0.1 * stress)) + 0.05 * rng.standard_normal(n)).reshape(-1, 1),
+    }
+
+    wrist = {}
+    for name, fs in WRIST_FS.items():
+        m = int(duration_s * fs)
+        s = _stress_mask(labels, fs)[:m].astype(np.float64)
+        tw = np.arange(m) / fs
+        if name == 'ACC':
+            wrist[name] = np.column_stack([
+                rng.normal(-60, 4, m), rng.normal(-15, 4, m), rng.normal(25, 4, m),
+            ]).round()
+        elif name == 'BVP':
+            wrist[name] = (60 * np.sin(2 * np.pi * tw * (1.1 + 0.2 * s)) + 5 * rng.standard_normal(m)).reshape(-1, 1)
+        elif name == 'EDA':
+            wrist[name] = (0.4 + 0.8 * s + 0.01 * rng.standard_normal(m)).reshape(-1, 1)
+        else:
+            wrist[name] = (32.5 - 1.5 * s + 0.02 * rng.standard_normal(m)).reshape(-1, 1)
+
+    return {'subject': f'S{subject_id}', 'signal': {'chest': chest, 'wrist': wrist}, 'label': labels}
+
+
+def feature_rows(data, window_s=60):
+    """Tabela cech w formacie data/S{n}.csv (jeden wiersz na okno `window_s` sekund)."""
+    chest, wrist = data['signal']['chest'], data['signal']['wrist']
+    n = len(data['label'])
+    win = window_s * CHEST_FS
+    rows = []
+    for i, a in enumerate(range(0, n - win + 1, win)):
+        b = a + win
+        acc = chest['ACC'][a:b]
+        wa, wb = a * 4 // CHEST_FS, b * 4 // CHEST_FS
+        stress = np.mean(data['label'][a:b] == STRESS_LABEL) > 0.5
+        rows.append({
+            'subject': data['subject'],
+            't_start_s': float(i * window_s),
+            't_end_s': float((i + 1) * window_s),
+            'mean_eda': float(wrist['EDA'][wa:wb].mean()),
+            'temp': float(wrist['TEMP'][wa:wb].mean()),
+            'emg': float(np.abs(chest['EMG'][a:b]).mean()),
+            'acc_rms': float(np.sqrt((acc ** 2).sum(axis=1)).mean()),
+            'hr': 78.0 if stress else 62.0,
+            'hrv': 300.0 if stress else 360.0,
+            'state': 'stres' if stress else 'neutralny',
+        })
+    return pd.DataFrame(rows)
+
+
+def write_dataset(out_dir, subjects=(2,), duration_s=600, seed=None, features_dir=None):
+    """Zapisuje S{n}.pkl (i opcjonalnie S{n}.csv w `features_dir`). Zwraca listę ścieżek pickli."""
+    os.makedirs(out_dir, exist_ok=True)
+    if features_dir:
+        os.makedirs(features_dir, exist_ok=True)
+    paths = []
+    for sid in subjects:
+        data = make_subject(sid, duration_s, seed=None if seed is None else seed + int(sid))
+        path = os.path.join(out_dir, f'S{sid}.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        paths.append(path)
+        if features_dir:
+            feature_rows(data).to_csv(os.path.join(features_dir, f'S{sid}.csv'), index=False)
+    return paths
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--out', required=True, help='katalog docelowy na S{n}.pkl')
+    ap.add_argument('--subjects', default='2', help='lista numerów, np. 2,3,4')
+    ap.add_argument('--duration', type=float, default=600, help='długość sesji w sekundach')
+    ap.add_argument('--seed', type=int, default=None)
+    ap.add_argument('--features-dir', default=None, help='gdzie zapisać tabele cech S{n}.csv')
+    args = ap.parse_args(argv)
+    subjects = [s.strip().lstrip('sS') for s in args.subjects.split(',') if s.strip()]
+    for p in write_dataset(args.out, subjects, args.duration, args.seed, args.features_dir):
+        print(f'{p}  {os.path.getsize(p) / 1024 ** 2:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
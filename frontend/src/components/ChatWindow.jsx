@@ -63,6 +63,30 @@ const styles = {
   },
 };
 
+// czyta odpowiedź text/event-stream i woła onEvent(nazwa, dane) dla każdego zdarzenia
+const readSse = async (res, onEvent) => {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let name = "message";
+      const data = [];
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) name = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+      }
+      if (data.length) onEvent(name, JSON.parse(data.join("\n")));
+    }
+  }
+};
+
 const ChatWindow = () => {
   const [messages, setMessages] = useState([
     { role: "assistant", text: "Cześć! Jak mogę pomóc?" },
@@ -98,7 +122,8 @@ const ChatWindow = () => {
     setLoading(true);
 
     try {
-      const payload = { message: userText };
+      // odpowiedź strumieniowa (SSE) — tokeny pojawiają się w miarę generowania
+      const payload = { message: userText, stream: true };
       // dołącz parametry modelu/roli tylko jeśli Advanced jest widoczne
       if (showAdvanced) {
         if (model) payload.model = model;
@@ -125,6 +150,34 @@ const ChatWindow = () => {
         throw new Error(`Serwer zwrócił błąd: ${res.status} — ${t}`);
       }
 
+      const contentType = res.headers.get("content-type") || "";
+      if (res.body && contentType.includes("text/event-stream")) {
+        // dopisuj tokeny do ostatniej wiadomości asystenta
+        const setLast = (fn) =>
+          setMessages((m) => {
+            const copy = [...m];
+            copy[copy.length - 1] = fn(copy[copy.length - 1]);
+            return copy;
+          });
+        let started = false;
+        let streamError = null;
+        await readSse(res, (event, data) => {
+          if (!started) {
+            started = true;
+            setLoading(false);
+            setMessages((m) => [...m, { role: "assistant", text: "" }]);
+          }
+          if (event === "error") streamError = data.error;
+          else if (event === "done")
+            setLast((msg) => ({ ...msg, text: data.reply || msg.text || "(Brak odpowiedzi)" }));
+          else if (data.delta)
+            setLast((msg) => ({ ...msg, text: msg.text + data.delta }));
+        });
+        if (streamError) throw new Error(streamError);
+        if (!started) throw new Error("Pusta odpowiedź strumieniowa");
+        return;
+      }
+
       const data = await res.json();
 
       // Zakładamy że backend zwraca { reply: "..." }
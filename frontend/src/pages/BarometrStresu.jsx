@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useRef } from "react";
+import React, { useEffect, useState } from "react";
 import Screen from "../components/Screen";
 import Header from "../components/Header";
 import HeaderActionButton from "../components/HeaderActionButton";
@@ -11,39 +11,13 @@ const BarometrStresu = () => {
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(false);
   const [history, setHistory] = useState([]); // lokalna historia punktów score
-  const pollRef = useRef(null);
-  const fullDataRef = useRef(null); // cache for the large full response
 
-const fetchData = async () => {
-  try {
-    if (window.__baro_running) {
-      console.warn("Barometr: fetchData skipped because previous run still in progress");
-      return;
-    }
-    window.__baro_running = (window.__baro_running || 0) + 1;
-    console.debug("Barometr: fetchData start, runCount=", window.__baro_running);
-    setLoading(true);
-
-    const subject = "S2";
-    const windows = 20;
-    const window_size = 300;
-    const apiUrl = `http://127.0.0.1:5000/api/stress_state?subject=${encodeURIComponent(subject)}&windows=${windows}&window_size=${window_size}&allow_unpickle=1`;
-
-    const res = await fetch(apiUrl);
-    if (!res.ok) throw new Error(`Błąd HTTP ${res.status} przy pobieraniu ${apiUrl}`);
-    const j = await res.json();
-
-    // --- DEBUG: inspect the full data ---
-    console.log("Full API response:", j);
-
-    // If j contains a 'data' or similar array of objects
-    if (Array.isArray(j.data) && j.data.length > 0) {
-      const firstRow = j.data[0];
-      console.log("Columns:", Object.keys(firstRow));
-      console.log("First 5 rows:");
-      j.data.slice(0, 5).forEach((row, i) => console.log(i + 1, row));
-    }
+  const subject = "S2";
+  const windows = 20;
+  const window_size = 300;
+  const query = `subject=${encodeURIComponent(subject)}&windows=${windows}&window_size=${window_size}&allow_unpickle=1`;
 
+  const applyState = (j) => {
     setData({ state: j.state, trend: j.trend, score: j.score });
 
     if (Array.isArray(j.history) && j.history.length) {
@@ -55,83 +29,40 @@ const fetchData = async () => {
     } else {
       setHistory([]);
     }
-
     setError(null);
-  } catch (e) {
-    setError(e.message || String(e));
-  } finally {
-    setLoading(false);
-    try {
-      window.__baro_running = Math.max(0, (window.__baro_running || 1) - 1);
-    } catch (e) {}
-    console.debug("Barometr: fetchData end, runCount=", window.__baro_running);
-  }
-};
-
-  useEffect(() => {
-    const instanceId = `${Date.now()}-${Math.floor(Math.random() * 100000)}`;
-    window.__baro_instances = (window.__baro_instances || 0) + 1;
-    console.debug(
-      `Barometr[${instanceId}]: mount, instances=`,
-      window.__baro_instances
-    );
+  };
 
-    // Jeżeli globalny scheduler już działa pod innym ownerem, nie uruchamiamy kolejnego.
-    if (
-      window.__baro_global_owner &&
-      window.__baro_global_owner !== instanceId
-    ) {
-      console.debug(
-        `Barometr[${instanceId}]: detected existing global owner=`,
-        window.__baro_global_owner,
-        " — skipping scheduler start"
-      );
-      return () => {
-        window.__baro_instances = Math.max(
-          0,
-          (window.__baro_instances || 1) - 1
-        );
-        console.debug(
-          `Barometr[${instanceId}]: unmount, instances=`,
-          window.__baro_instances
-        );
-      };
+  // jednorazowe pobranie (ręczne odświeżenie po kliknięciu karty)
+  const fetchData = async () => {
+    const apiUrl = `http://127.0.0.1:5000/api/stress_state?${query}`;
+    try {
+      setLoading(true);
+      const res = await fetch(apiUrl);
+      if (!res.ok) throw new Error(`Błąd HTTP ${res.status} przy pobieraniu ${apiUrl}`);
+      applyState(await res.json());
+    } catch (e) {
+      setError(e.message || String(e));
+    } finally {
+      setLoading(false);
     }
+  };
 
-    // ustawiamy właściciela globalnego scheduler'a
-    window.__baro_global_owner = instanceId;
-
-    let isMounted = true;
-    // zamiast setInterval używamy rekurencyjnego setTimeout — bezpieczniejsze jeśli fetch trwa dłużej
-    const run = async () => {
-      if (!isMounted) return;
-      try {
-        await fetchData();
-      } catch (err) {
-        console.error(`Barometr[${instanceId}] run error:`, err);
-      }
-      if (!isMounted) return;
-      // zaplanuj kolejne uruchomienie tylko jeśli nadal jesteśmy właścicielem
-      if (window.__baro_global_owner === instanceId) {
-        pollRef.current = setTimeout(run, 5000);
-      }
-    };
-    // start
-    run();
-
-    return () => {
-      isMounted = false;
-      // jeśli jesteśmy właścicielem globalnym, zdejmij ownera i wyczyść timer
-      if (window.__baro_global_owner === instanceId) {
-        window.__baro_global_owner = null;
-      }
-      if (pollRef.current) clearTimeout(pollRef.current);
-      window.__baro_instances = Math.max(0, (window.__baro_instances || 1) - 1);
-      console.debug(
-        `Barometr[${instanceId}]: unmount, instances=`,
-        window.__baro_instances
-      );
-    };
+  useEffect(() => {
+    // serwer wypycha nowy stan tylko gdy zmienią się dane — zamiast odpytywania co 5 s.
+    // EventSource sam wznawia połączenie po zerwaniu.
+    setLoading(true);
+    const source = new EventSource(`http://127.0.0.1:5000/api/stress_state/stream?${query}`);
+    source.addEventListener("state", (e) => {
+      setLoading(false);
+      applyState(JSON.parse(e.data));
+    });
+    source.addEventListener("error", (e) => {
+      setLoading(false);
+      // zdarzenie "error" z serwera niesie dane; błąd połączenia — nie
+      if (e.data) setError(JSON.parse(e.data).error);
+      else if (source.readyState !== EventSource.OPEN) setError("Utracono połączenie z serwerem, ponawiam...");
+    });
+    return () => source.close();
   }, []);
 
   // prosty komponent wskaźnika (gauge) bazujący na score 0-100
@@ -302,7 +233,7 @@ const fetchData = async () => {
               </div>
             )}
             <div style={{ fontSize: 11, color: "#555" }}>
-              Dane odświeżane co 5s • źródło: /api/stress_state
+              Dane na żywo • źródło: /api/stress_state/stream
             </div>
           </div>
         </div>
@@ -0,0 +1,42 @@
+import numpy as np
+
+import app
+from bench import run as bench_run
+from bench import synth_wesad
+
+
+def test_synthetic_subject_has_wesad_layout():
+    data = synth_wesad.make_subject(2, duration_s=20, seed=1)
+    chest, wrist = data['signal']['chest'], data['signal']['wrist']
+    assert data['subject'] == 'S2'
+    assert chest['ACC'].shape == (20 * 700, 3)
+    for key in ('ECG', 'EMG', 'EDA', 'Temp', 'Resp'):
+        assert chest[key].shape == (20 * 700, 1)
+    for key, fs in synth_wesad.WRIST_FS.items():
+        assert len(wrist[key]) == 20 * fs
+    assert len(data['label']) == 20 * 700
+    assert set(np.unique(data['label'])) <= {0, 1, 2, 3, 4}
+
+
+def test_synthetic_features_match_classifier_columns(tmp_path):
+    synth_wesad.write_dataset(str(tmp_path), [2], duration_s=180, seed=0, features_dir=str(tmp_path / 'features'))
+    assert (tmp_path / 'S2.pkl').exists()
+    import pandas as pd
+    rows = pd.read_csv(tmp_path / 'features' / 'S2.csv')
+    assert len(rows) == 3
+    assert set(app.CLASSIFY_FEATURES) <= set(rows.columns)
+    out = app.classify_batch(rows)
+    assert len(out['state']) == 3
+
+
+def test_harness_runs_benchmark_in_process(tmp_path, monkeypatch):
+    for name in ('CURRENT_DATA_DIR', 'DATA_DIR_CANDIDATES', 'FEATURES_DIR'):
+        monkeypatch.setattr(app, name, getattr(app, name))
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(64 * 1024 ** 2))
+    monkeypatch.setattr(app, '_SUBJECT_INDEXES', {})
+    monkeypatch.setenv('ALLOW_UNPICKLE', '1')
+    synth_wesad.write_dataset(str(tmp_path), [2], duration_s=30, seed=0, features_dir=str(tmp_path / 'features'))
+    result = bench_run.run_benchmark('endpoint.participant_summary', str(tmp_path), repeat=3)
+    assert result['n'] == 3
+    assert 0 < result['p50_ms'] <= result['p99_ms']
+    assert result['throughput_per_s'] > 0
@@ -0,0 +1,268 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import app
+
+
+def _write_pkl(path, obj):
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f)
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = app._LRUCache(10 * 1024 ** 2)
+    monkeypatch.setattr(app, '_PICKLE_CACHE', cache)
+    return cache
+
+
+def test_pickle_cache_hit_after_first_load(tmp_path, fresh_cache):
+    p = tmp_path / 'S2.pkl'
+    _write_pkl(p, {'subject': 'S2', 'signal': {'chest': {'EDA': np.arange(10.0)}}})
+
+    first = app._load_pickle_cached(str(p))
+    second = app._load_pickle_cached(str(p))
+    assert first is second
+    stats = fresh_cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['entries'] == 1
+
+
+def test_pickle_cache_invalidated_when_file_changes(tmp_path, fresh_cache):
+    p = tmp_path / 'S2.pkl'
+    _write_pkl(p, {'subject': 'S2', 'v': 1})
+    assert app._load_pickle_cached(str(p))['v'] == 1
+
+    _write_pkl(p, {'subject': 'S2', 'v': 2, 'extra': list(range(10))})
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert app._load_pickle_cached(str(p))['v'] == 2
+    stats = fresh_cache.stats()
+    assert stats['entries'] == 1
+    assert stats['invalidations'] == 1
+
+
+
+def test_cache_stats_clear_requires_post(tmp_path, fresh_cache):
+    p = tmp_path / 'S2.pkl'
+    _write_pkl(p, {'subject': 'S2'})
+    app._load_pickle_cached(str(p))
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        # GET nie zmienia stanu, nawet ze starym parametrem clear=1
+        assert c.get('/cache_stats?clear=1').get_json()['pickle_cache']['entries'] == 1
+        assert c.get('/cache_stats/clear').status_code == 405
+        resp = c.post('/cache_stats/clear')
+        assert resp.status_code == 200
+        assert resp.get_json()['pickle_cache']['entries'] == 0
+    assert fresh_cache.stats()['entries'] == 0
+
+
+def test_feature_values_match_raw_csv(tmp_path, monkeypatch):
+    import csv as _csv
+    monkeypatch.setattr(app, 'FEATURES_DIR', str(tmp_path))
+    monkeypatch.setattr(app, '_FEATURE_TABLES', {})
+    p = tmp_path / 'S5.csv'
+    # 0.5562007 w float32 to 0.5562006831169128; hr tuż pod progiem klasyfikacji
+    p.write_text('subject,t_start_s,t_end_s,mean_eda,temp,emg,acc_rms,hr,hrv,state\n'
+                 'S5,0,60,0.5562007,40.91316666666667,,1.0078439087190543,75.29411764705883,360.4372494018072,a\n')
+    with open(p, newline='') as f:
+        raw = next(_csv.DictReader(f))
+    feats = app.load_participant_features('5')
+    for k in ('mean_eda', 'temp', 'acc_rms', 'hr', 'hrv'):
+        assert feats[k] == float(raw[k]), k
+    rows = app.load_participant_feature_rows('5')
+    assert rows['mean_eda'].tolist() == [0.5562007]
+
+def test_lru_cache_evicts_by_byte_budget():
+    cache = app._LRUCache(max_bytes=2000)
+    cache.put(('a', 0, 0), np.zeros(100))  # 800 B
+    cache.put(('b', 0, 0), np.zeros(100))
+    assert cache.get(('a', 0, 0)) is not None  # 'a' staje się najświeższy
+    cache.put(('c', 0, 0), np.zeros(100))
+    assert cache.get(('b', 0, 0)) is None
+    assert cache.get(('a', 0, 0)) is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] <= 2000
+
+
+def test_load_participant_data_uses_cache(tmp_path, monkeypatch, fresh_cache):
+    s2 = tmp_path / 'S2'
+    s2.mkdir()
+    _write_pkl(s2 / 'S2.pkl', {'subject': 'S2', 'signal': {}})
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(s2))
+
+    assert app.load_participant_data('2')['subject'] == 'S2'
+    assert app.load_participant_data('2')['subject'] == 'S2'
+    assert fresh_cache.stats()['hits'] == 1
+
+
+def test_load_participant_data_picks_same_file_as_etag_source(tmp_path, monkeypatch, fresh_cache):
+    d = tmp_path / 'S2'
+    d.mkdir()
+    # kolejność tworzenia != kolejność alfabetyczna; glob bez sortowania mógłby zwrócić dowolny
+    for name in ('S7_c.pkl', 'S7_a.pkl', 'S7_b.pkl'):
+        _write_pkl(d / name, {'subject': 'S7', 'file': name})
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', [str(d)])
+    assert os.path.basename(app._find_participant_pkl('7')) == 'S7_a.pkl'
+    assert app.load_participant_data('7')['file'] == 'S7_a.pkl'
+
+
+def test_subject_index_skips_unpickling_for_unchanged_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, '_SUBJECT_INDEXES', {})
+    p = tmp_path / 'S3.pkl'
+    _write_pkl(p, {'subject': 'S3'})
+
+    calls = []
+    real_discover = app.discover_subjects_in_file
+    monkeypatch.setattr(app, 'discover_subjects_in_file', lambda path: calls.append(path) or real_discover(path))
+
+    assert app.discover_subjects_indexed(str(p)) == ['S3']
+    assert (tmp_path / app.SUBJECT_INDEX_FILENAME).exists()
+    # świeży proces: indeks wczytany z dysku, bez ponownego unpicklingu
+    monkeypatch.setattr(app, '_SUBJECT_INDEXES', {})
+    assert app.discover_subjects_indexed(str(p)) == ['S3']
+    assert len(calls) == 1
+
+    _write_pkl(p, {'subject': 'S4', 'pad': list(range(5))})
+    assert app.discover_subjects_indexed(str(p)) == ['S4']
+    assert len(calls) == 2
+
+
+def test_feature_csv_parsed_once_and_reloaded_on_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'FEATURES_DIR', str(tmp_path))
+    monkeypatch.setattr(app, '_FEATURE_TABLES', {})
+    csv = tmp_path / 'S5.csv'
+    header = 'subject,t_start_s,t_end_s,mean_eda,temp,emg,acc_rms,hr,hrv,state\n'
+    csv.write_text(header + 'S5,0,60,0.5,31.0,,1.0,70.0,300.0,a\nS5,30,90,0.9,30.0,,1.1,80.0,280.0,b\n')
+
+    parses = []
+    real_read_csv = app.pd.read_csv
+    monkeypatch.setattr(app.pd, 'read_csv', lambda *a, **k: parses.append(a) or real_read_csv(*a, **k))
+
+    f1 = app.load_participant_features('5')
+    f1['mean_eda'] = None  # zwracana jest kopia — cache nie może się zmienić
+    f2 = app.load_participant_features('5')
+    assert f2['mean_eda'] == pytest.approx(0.5)
+    assert len(parses) == 1
+    rows = app.load_participant_feature_rows('5')
+    assert len(rows) == 2
+    assert rows['hr'].dtype == np.float64
+
+    csv.write_text(header + 'S5,0,60,0.7,31.0,,1.0,70.0,300.0,a\n')
+    st = os.stat(csv)
+    os.utime(csv, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert app.load_participant_features('5')['mean_eda'] == pytest.approx(0.7)
+    assert len(parses) == 2
+
+    # plik istnieje, ale nie ma wierszy dla tego subjectu
+    (tmp_path / 'S6.csv').write_text(header + 'S5,0,60,1,1,,1,1,1,a\n')
+    with pytest.raises(ValueError):
+        app.load_participant_features('6')
+
+
+def test_concurrent_loads_of_same_file_are_coalesced(tmp_path, monkeypatch, fresh_cache):
+    import threading
+    import time
+
+    p = tmp_path / 'S2.pkl'
+    _write_pkl(p, {'subject': 'S2'})
+    flight = app._SingleFlight()
+    monkeypatch.setattr(app, '_LOAD_FLIGHT', flight)
+
+    real_load = app._safe_pickle_load
+    loads = []
+
+    def slow_load(f, allow_unpickle=True):
+        loads.append(1)
+        time.sleep(0.2)
+        return real_load(f, allow_unpickle)
+    monkeypatch.setattr(app, '_safe_pickle_load', slow_load)
+
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(app._load_pickle_cached(str(p)))
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(loads) == 1
+    assert len(results) == 8 and all(r is results[0] for r in results)
+    assert flight.stats()['executed'] == 1
+    assert flight.stats()['coalesced'] + fresh_cache.stats()['hits'] == 7
+
+
+def test_leader_rechecks_cache_before_unpickling(tmp_path, monkeypatch, fresh_cache):
+    # poprzedni lider wstawił obiekt już po tym, jak to żądanie sprawdziło cache
+    p = tmp_path / 'S2.pkl'
+    _write_pkl(p, {'subject': 'S2'})
+    obj = {'subject': 'S2', 'from': 'cache'}
+    real_get = fresh_cache.get
+
+    def racing_get(key, count_miss=True):
+        if count_miss:
+            fresh_cache.put(key, obj)
+            return None
+        return real_get(key, count_miss)
+    monkeypatch.setattr(fresh_cache, 'get', racing_get)
+    monkeypatch.setattr(app, '_safe_pickle_load', lambda *a, **k: pytest.fail('unpickled twice'))
+    assert app._load_pickle_cached(str(p)) is obj
+
+
+def test_single_flight_propagates_errors_to_waiters():
+    import threading
+    flight = app._SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(2)
+        raise RuntimeError('boom')
+
+    def leader():
+        try:
+            flight.do('k', failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    follower_in = threading.Event()
+
+    def follower():
+        follower_in.set()
+        try:
+            flight.do('k', lambda: 'never')
+        except RuntimeError as e:
+            errors.append(e)
+
+    t1 = threading.Thread(target=leader, daemon=True)
+    t1.start()
+    assert started.wait(2)
+    t2 = threading.Thread(target=follower, daemon=True)
+    t2.start()
+    assert follower_in.wait(2)
+    # follower dołącza do lotu tuż po ustawieniu zdarzenia; czekamy z limitem zamiast kręcić się w pętli
+    joined = threading.Event()
+    for _ in range(200):
+        if flight.stats()['coalesced']:
+            joined.set()
+            break
+        joined.wait(0.01)
+    assert joined.is_set()
+    release.set()
+    t1.join(2)
+    t2.join(2)
+    assert not t1.is_alive() and not t2.is_alive()
+    assert len(errors) == 2
+    assert flight.stats()['in_flight'] == 0
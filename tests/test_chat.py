@@ -0,0 +1,327 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+
+class _FakeUpstream(BaseHTTPRequestHandler):
+    """Lokalny zamiennik API czatu (HTTP/1.1 keep-alive). Zachowanie sterowane przez server.script."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with srv.lock:
+            srv.requests.append((self.client_address, self.path, body))
+            status = srv.script.pop(0) if srv.script else 200
+            srv.in_flight += 1
+            srv.max_in_flight = max(srv.max_in_flight, srv.in_flight)
+        try:
+            if srv.delay:
+                time.sleep(srv.delay)
+            self._respond(status, body)
+        finally:
+            with srv.lock:
+                srv.in_flight -= 1
+
+    def _respond(self, status, body):
+        if status == 200 and body.get('stream'):
+            return self._stream(body)
+        if status != 200:
+            payload = b'{"error": "busy"}'
+            self.send_response(status)
+            self.send_header('Retry-After', '0')
+        else:
+            if self.path.endswith('/responses'):
+                payload = json.dumps({'output': [{'content': [{'type': 'output_text', 'text': 'odp: ' + body['input']}]}]}).encode()
+            else:
+                payload = json.dumps({'choices': [{'message': {'content': 'odp: ' + body['messages'][-1]['content']}}]}).encode()
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+    def _chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, body):
+        """SSE token po tokenie (chunked); przed ostatnim tokenem czeka na server.release."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        tokens = ['Od', 'po', 'wiedź']
+        responses_api = self.path.endswith('/responses')
+        for i, tok in enumerate(tokens):
+            if i == len(tokens) - 1:
+                self.server.release.wait(5)
+            if responses_api:
+                event = {'type': 'response.output_text.delta', 'delta': tok}
+                self._chunk(f'event: response.output_text.delta\ndata: {json.dumps(event)}\n\n')
+            else:
+                event = {'choices': [{'delta': {'content': tok}}]}
+                self._chunk(f'data: {json.dumps(event)}\n\n')
+        if responses_api:
+            self._chunk('event: response.completed\ndata: {"type": "response.completed"}\n\n')
+        else:
+            self._chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _FakeUpstream)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.requests = []
+    srv.script = []
+    srv.release = threading.Event()
+    srv.delay = 0
+    srv.in_flight = srv.max_in_flight = 0
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    monkeypatch.setattr(app, 'CHAT_API_BASE_URL', f'http://127.0.0.1:{srv.server_address[1]}/v1')
+    monkeypatch.setattr(app, '_CHAT_HTTP', app._HTTPPool(max_retries=2, backoff=0.01))
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def test_chat_reuses_one_keepalive_connection(upstream, client):
+    for i in range(3):
+        resp = client.post('/api/chat', json={'message': f'hej {i}'})
+        assert resp.status_code == 200
+        assert resp.get_json()['reply'] == f'odp: hej {i}'
+    ports = {addr[1] for addr, _, _ in upstream.requests}
+    assert len(ports) == 1
+    assert app._CHAT_HTTP.stats()['created'] == 1
+    assert app._CHAT_HTTP.stats()['reused'] == 2
+
+
+def test_chat_responses_api_uses_base_url(upstream, client):
+    resp = client.post('/api/chat', json={'message': 'hej', 'model': 'gpt-5-pro'})
+    assert resp.get_json()['reply'] == 'odp: hej'
+    assert upstream.requests[0][1] == '/v1/responses'
+
+
+def test_chat_retries_on_429_and_5xx(upstream, client):
+    upstream.script = [429, 503]
+    resp = client.post('/api/chat', json={'message': 'hej'})
+    assert resp.status_code == 200
+    assert len(upstream.requests) == 3
+    assert app._CHAT_HTTP.stats()['retries'] == 2
+
+
+def test_chat_gives_up_after_max_retries(upstream, client):
+    upstream.script = [502, 502, 502, 502]
+    resp = client.post('/api/chat', json={'message': 'hej'})
+    assert resp.status_code == 502
+    assert len(upstream.requests) == 3
+
+
+def test_chat_connection_refused_is_reported(monkeypatch, client):
+    monkeypatch.setattr(app, 'CHAT_API_BASE_URL', 'http://127.0.0.1:9/v1')
+    monkeypatch.setattr(app, '_CHAT_HTTP', app._HTTPPool(max_retries=1, backoff=0.01))
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    resp = client.post('/api/chat', json={'message': 'hej'})
+    assert resp.status_code == 500
+    assert app._CHAT_HTTP.stats()['retries'] == 1
+
+
+
+def test_chat_read_timeout_depends_on_api(upstream, client, monkeypatch):
+    monkeypatch.setattr(app, 'CHAT_READ_TIMEOUT', 0.1)
+    monkeypatch.setattr(app, 'CHAT_RESPONSES_READ_TIMEOUT', 2.0)
+    upstream.delay = 0.3
+    # chat/completions: limit odczytu przekroczony, bez ponawiania
+    resp = client.post('/api/chat', json={'message': 'hej'})
+    assert resp.status_code == 500 and 'timed out' in resp.get_json()['details']
+    # Responses API ma własny, dłuższy limit
+    resp = client.post('/api/chat', json={'message': 'hej', 'model': 'gpt-5-pro'})
+    assert resp.get_json() == {'reply': 'odp: hej'}
+
+def _sse_events(chunks):
+    events = []
+    for block in b''.join(chunks).decode().split('\n\n'):
+        if not block.strip():
+            continue
+        name, data = 'message', None
+        for line in block.split('\n'):
+            if line.startswith('event: '):
+                name = line[7:]
+            elif line.startswith('data: '):
+                data = json.loads(line[6:])
+        events.append((name, data))
+    return events
+
+
+@pytest.mark.parametrize('model', ['gpt-3.5-turbo', 'gpt-5-pro'])
+def test_chat_stream_forwards_tokens_before_upstream_finishes(upstream, client, model):
+    resp = client.post('/api/chat', json={'message': 'hej', 'model': model, 'stream': True}, buffered=False)
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/event-stream'
+    it = iter(resp.response)
+    # upstream wstrzymuje ostatni token — pierwsze zdarzenie musi już dotrzeć
+    first = next(it)
+    assert _sse_events([first]) == [('message', {'delta': 'Od'})]
+    upstream.release.set()
+    events = _sse_events([first] + list(it))
+    resp.close()
+    assert [d['delta'] for n, d in events if n == 'message'] == ['Od', 'po', 'wiedź']
+    assert events[-1] == ('done', {'reply': 'Odpowiedź'})
+    assert upstream.requests[0][2]['stream'] is True
+
+
+def test_chat_stream_connection_returns_to_pool(upstream, client):
+    upstream.release.set()
+    for _ in range(2):
+        resp = client.post('/api/chat', json={'message': 'hej', 'stream': True})
+        assert _sse_events([resp.get_data()])[-1][0] == 'done'
+    assert app._CHAT_HTTP.stats()['created'] == 1
+
+
+def test_chat_stream_upstream_error_is_json(upstream, client):
+    upstream.script = [400]
+    resp = client.post('/api/chat', json={'message': 'hej', 'stream': True})
+    assert resp.status_code == 400
+    assert resp.get_json()['error']
+
+
+@pytest.fixture
+def chat_cache(monkeypatch):
+    cache = app._TTLCache(2, 60)
+    monkeypatch.setattr(app, '_CHAT_CACHE', cache)
+    monkeypatch.setattr(app, 'CHAT_CACHE_TTL', 60)
+    return cache
+
+
+def test_chat_cache_serves_repeated_low_temperature_questions(upstream, client, chat_cache):
+    q = {'message': 'Jak uspokoić dziecko?', 'assistant_role': 'care_assistant', 'temperature': 0.0}
+    first = client.post('/api/chat', json=q)
+    second = client.post('/api/chat', json=q)
+    assert first.get_json() == second.get_json()
+    assert second.headers['X-Chat-Cache'] == 'hit'
+    assert len(upstream.requests) == 1
+
+    # inna rola/system prompt to inny klucz
+    client.post('/api/chat', json=dict(q, assistant_role='default'))
+    assert len(upstream.requests) == 2
+
+    stream = client.post('/api/chat', json=dict(q, stream=True))
+    assert _sse_events([stream.get_data()])[-1] == ('done', first.get_json())
+    assert len(upstream.requests) == 2
+    assert chat_cache.stats()['hits'] == 2
+    assert chat_cache.stats()['hit_rate'] == 0.5
+
+
+def test_chat_cache_skips_high_temperature_and_opt_out(upstream, client, chat_cache):
+    client.post('/api/chat', json={'message': 'hej', 'temperature': 1.0})
+    client.post('/api/chat', json={'message': 'hej', 'temperature': 1.0})
+    client.post('/api/chat', json={'message': 'hej', 'temperature': 0.1, 'cache': False})
+    client.post('/api/chat', json={'message': 'hej', 'temperature': 0.1, 'cache': False})
+    assert len(upstream.requests) == 4
+    assert chat_cache.stats()['entries'] == 0
+
+
+def test_chat_cache_stores_streamed_reply(upstream, client, chat_cache):
+    upstream.release.set()
+    q = {'message': 'hej', 'temperature': 0.2, 'stream': True}
+    client.post('/api/chat', json=q).get_data()
+    resp = client.post('/api/chat', json=dict(q, stream=False))
+    assert resp.get_json() == {'reply': 'Odpowiedź'}
+    assert len(upstream.requests) == 1
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    now = [0.0]
+    cache = app._TTLCache(2, 10, clock=lambda: now[0])
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # wypiera 'b' (najdawniej używany)
+    assert cache.get('b') is None
+    now[0] = 11
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['expired'] == 1
+
+
+def test_chat_burst_is_gated_and_data_endpoints_stay_fast(upstream, monkeypatch):
+    """Test obciążeniowy: seria 12 wiadomości przy wolnym upstreamie (0.5 s) na prawdziwym serwerze
+    wielowątkowym. Upstream widzi najwyżej 2 równoległe wywołania, nadmiar dostaje szybkie 503,
+    a w tym czasie /api/stress_state (z historią okien liczoną z sygnałów) odpowiada bez opóźnień."""
+    import urllib.error
+    import urllib.request
+    from werkzeug.serving import make_server
+
+    import numpy as np
+
+    upstream.delay = 0.5
+    monkeypatch.setattr(app, '_CHAT_GATE', app._ConcurrencyGate(2, 2, 5))
+    signal = {'chest': {'EDA': np.linspace(0.2, 1.2, 7000).reshape(-1, 1),
+                        'ACC': np.tile([[0.5, 0.5, 0.5]], (7000, 1))}}
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: {'subject': 'S2', 'signal': signal})
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    def chat(i, out):
+        req = urllib.request.Request(f'{base}/api/chat', data=json.dumps({'message': f'q{i}'}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=10) as r:
+                out.append((r.status, None, time.perf_counter() - t0))
+        except urllib.error.HTTPError as e:
+            out.append((e.code, e.headers.get('Retry-After'), time.perf_counter() - t0))
+
+    results = []
+    threads = [threading.Thread(target=chat, args=(i, results)) for i in range(12)]
+    try:
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        data_latencies = []
+        state_url = f'{base}/api/stress_state?subject=S2&windows=10&window_size=500&allow_unpickle=1'
+        while any(t.is_alive() for t in threads):
+            t0 = time.perf_counter()
+            with urllib.request.urlopen(state_url, timeout=5) as r:
+                assert r.status == 200
+                assert json.loads(r.read())['history_source'] == 'signals'
+            data_latencies.append(time.perf_counter() - t0)
+            time.sleep(0.02)
+        for t in threads:
+            t.join()
+    finally:
+        server.shutdown()
+
+    ok = [r for r in results if r[0] == 200]
+    busy = [r for r in results if r[0] == 503]
+    assert len(ok) == 4 and len(busy) == 8
+    assert all(r[1] == str(app.CHAT_RETRY_AFTER) for r in busy)
+    assert max(r[2] for r in busy) < 0.4  # odmowa natychmiast, bez czekania na upstream
+    assert upstream.max_in_flight <= 2
+    assert data_latencies and max(data_latencies) < 0.3
+    stats = app._CHAT_GATE.stats()
+    assert stats['rejected'] == 8 and stats['active'] == 0
@@ -52,3 +52,77 @@ def test_extract_dataframe_features(tmp_path, monkeypatch):
     assert feats['hrv'] is not None
     assert feats['temp'] is not None
     assert feats['acc_rms'] is not None
+
+
+def _cases():
+    return [
+        {'mean_eda': 0.9, 'hr': 70.0, 'hrv': 300.0, 'temp': 30.9, 'acc_rms': 1.02},
+        {'mean_eda': 0.4, 'hr': 55.0, 'hrv': 380.0, 'temp': 31.3, 'acc_rms': 1.0},
+        {'mean_eda': 0.65, 'hr': 63.0, 'hrv': 350.0, 'temp': 31.225, 'acc_rms': 1.013},
+        {'mean_eda': 0.65, 'hr': None, 'hrv': 350.0, 'temp': 31.225, 'acc_rms': 1.013},
+        {'hr': 70.0},
+        {},
+    ]
+
+
+def test_classify_batch_parity_with_scalar():
+    import numpy as np
+    rng = np.random.default_rng(0)
+    rows = _cases()
+    lo = {k: v[0] for k, v in app.NEUTRAL_RANGES.items()}
+    hi = {k: v[1] for k, v in app.NEUTRAL_RANGES.items()}
+    for _ in range(2000):
+        row = {}
+        for k in app.CLASSIFY_FEATURES:
+            r = rng.random()
+            if r < 0.1:
+                continue  # brak cechy
+            if r < 0.2:
+                row[k] = float('nan')  # NaN liczy się jak brak cechy
+                continue
+            span = hi[k] - lo[k]
+            row[k] = float(rng.uniform(lo[k] - 2 * span, hi[k] + 2 * span))
+        rows.append(row)
+
+    out = app.classify_batch(rows)
+    assert out['state'].tolist() == [app.classify(r) for r in rows]
+    scores = [None if np.isnan(s) else int(s) for s in out['score'].tolist()]
+    assert scores == [app._stress_score(r) for r in rows]
+
+
+def test_nan_features_count_as_missing():
+    import numpy as np
+    nan_row = {k: float('nan') for k in app.CLASSIFY_FEATURES}
+    assert app._stress_score(nan_row) is None
+    assert app.classify(nan_row) == 'nieokreślony'
+    out = app.classify_batch([nan_row, {'hr': np.float32('nan'), 'mean_eda': 0.9}])
+    assert np.isnan(out['score'][0])
+    assert out['score'][1] == app._stress_score({'hr': np.float32('nan'), 'mean_eda': 0.9}) == 100
+
+
+def test_classify_batch_accepts_dataframe_and_structured_array():
+    import numpy as np
+    import pandas as pd
+    df = pd.DataFrame(_cases()[:3])
+    expected = ['stres', 'zadowolenie', 'neutralny']
+    assert app.classify_batch(df)['state'].tolist() == expected
+    rec = df.to_records(index=False)
+    assert app.classify_batch(np.asarray(rec))['state'].tolist() == expected
+
+
+def test_classify_batch_endpoint():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        resp = c.post('/api/classify/batch', json={'rows': _cases()})
+        assert resp.status_code == 200
+        body = resp.get_json()
+        assert body['count'] == 6
+        assert body['state'][:3] == ['stres', 'zadowolenie', 'neutralny']
+        assert body['score'][0] == 100 and body['score'][-1] is None
+        assert body['summary']['stres'] == 2
+
+        cols = c.post('/api/classify/batch', json={'columns': {'hr': [70.0, 55.0], 'mean_eda': [0.1, None]}}).get_json()
+        assert cols['state'] == ['stres', 'nieokreślony']
+
+        assert c.post('/api/classify/batch', json={'rows': [{'hr': 'abc'}]}).status_code == 400
+        assert c.post('/api/classify/batch', data='x').status_code == 400
@@ -0,0 +1,94 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import app
+
+
+def _fake_wesad(n=1400):
+    return {
+        'subject': 'S7',
+        'signal': {
+            'chest': {'ACC': np.random.rand(n, 3), 'EDA': np.random.rand(n, 1), 'Temp': np.full((n, 1), 33.0)},
+            'wrist': {'BVP': np.random.rand(n // 10, 1), 'TEMP': np.random.rand(n // 175, 1)},
+        },
+        'label': np.zeros(n, dtype=np.int32),
+    }
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    d = tmp_path / 'S2'
+    d.mkdir()
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', ['S2'])
+    monkeypatch.setattr(app, '_COLUMNAR_CACHE', {})
+    return d
+
+
+def test_ingest_roundtrip_is_memory_mapped(data_dir):
+    src = _fake_wesad()
+    p = data_dir / 'S7.pkl'
+    with open(p, 'wb') as f:
+        pickle.dump(src, f)
+
+    out = app.ingest_pickle_to_columnar(str(p))
+    assert os.path.isfile(os.path.join(out, app.COLUMNAR_MANIFEST))
+
+    data = app.load_participant_columnar('7')
+    assert data['subject'] == 'S7'
+    acc = data['signal']['chest']['ACC']
+    assert isinstance(acc, np.memmap)
+    np.testing.assert_array_equal(acc, src['signal']['chest']['ACC'])
+    np.testing.assert_array_equal(data['label'], src['label'])
+
+
+def test_participant_endpoint_reads_columnar_without_unpickle(data_dir, monkeypatch):
+    p = data_dir / 'S7.pkl'
+    with open(p, 'wb') as f:
+        pickle.dump(_fake_wesad(), f)
+    app.ingest_pickle_to_columnar(str(p))
+    monkeypatch.delenv('ALLOW_UNPICKLE', raising=False)
+
+    def _no_unpickle(*a, **k):
+        raise AssertionError('unpickling should not happen')
+    monkeypatch.setattr(app, 'load_participant_data', _no_unpickle)
+
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        res = c.get('/participant/7?params=TEMP:5')
+    assert res.status_code == 200
+    j = res.get_json()
+    assert len(j['available_signals']['chest']['Temp']['sample']) == 5
+
+
+def test_stale_columnar_store_is_ignored(data_dir):
+    p = data_dir / 'S7.pkl'
+    with open(p, 'wb') as f:
+        pickle.dump(_fake_wesad(), f)
+    app.ingest_pickle_to_columnar(str(p))
+    with open(p, 'wb') as f:
+        pickle.dump(_fake_wesad(700), f)
+    assert app.load_participant_columnar('7') is None
+
+
+def test_summary_of_large_memmap_reads_only_the_sample(tmp_path):
+    import tracemalloc
+    path = tmp_path / 'EDA.npy'
+    np.lib.format.open_memmap(str(path), mode='w+', dtype=np.float64, shape=(2_000_000, 1))[:] = 1.0
+    mm = np.load(str(path), mmap_mode='r')
+    data = {'signal': {'chest': {'EDA': mm}}, 'label': np.load(str(path), mmap_mode='r')}
+
+    tracemalloc.start()
+    try:
+        summary = app._summarize_object(mm, n=5, include_full=True, max_full=100)
+        labels = app._labels_sample(data, 5)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert summary['sample'] == [1.0] * 5 and labels == [1.0] * 5
+    assert 'full' not in summary  # kanał dłuższy niż max_full
+    assert peak < 1024 * 1024  # kanał ma 16 MB — kopia całości przekroczyłaby limit
@@ -0,0 +1,124 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def big_data(monkeypatch):
+    data = {
+        'subject': 'S99',
+        'signal': {'chest': {'EDA': np.linspace(0, 1, 20000), 'Temp': np.full(20000, 33.5)}},
+        'label': np.zeros(20000, dtype=int),
+    }
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: data)
+    return data
+
+
+def test_large_json_is_gzipped(client, big_data):
+    url = '/participant/99?allow_unpickle=1&full=1'
+    plain = client.get(url)
+    gz = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert 'Content-Encoding' not in plain.headers
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in gz.headers['Vary']
+    body = gz.get_data()
+    assert len(body) < len(plain.get_data()) / 3
+    assert json.loads(gzip.decompress(body)) == plain.get_json()
+
+
+def test_small_responses_and_sse_stay_uncompressed(client, monkeypatch):
+    small = client.get('/ready', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+    monkeypatch.setattr(app, '_stress_source_version', lambda sid: 'v')
+    monkeypatch.setattr(app, '_compute_stress_state', lambda *a: ({'state': 'x' * 5000}, None))
+    sse = client.get('/api/stress_state/stream?subject=S2&allow_unpickle=1',
+                     headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert 'Content-Encoding' not in sse.headers
+    sse.close()
+
+
+def test_stream_is_compressed_incrementally(client, big_data, monkeypatch):
+    monkeypatch.setattr(app, 'STREAM_CHUNK_ITEMS', 1000)
+    url = '/participant/99?allow_unpickle=1&full=1'
+    plain = client.get(url).get_json()
+    resp = client.get(url + '&stream=1', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+    chunks = list(resp.response)
+    resp.close()
+    assert len(chunks) > 2  # wysyłane kawałkami, nie jednym buforem
+    assert json.loads(gzip.decompress(b''.join(chunks))) == plain
+
+
+def test_q_zero_and_disabled_compression(client, big_data, monkeypatch):
+    url = '/participant/99?allow_unpickle=1&full=1'
+    assert 'Content-Encoding' not in client.get(url, headers={'Accept-Encoding': 'gzip;q=0'}).headers
+    monkeypatch.setattr(app, 'COMPRESS_ENABLED', False)
+    assert 'Content-Encoding' not in client.get(url, headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_etag_depends_on_encoding(client, tmp_path, monkeypatch):
+    import pickle
+    d = tmp_path / 'S2'
+    d.mkdir()
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', ['S2'])
+    monkeypatch.setattr(app, 'BASE_DIR', str(tmp_path))
+    with open(d / 'S4.pkl', 'wb') as f:
+        pickle.dump({'subject': 'S4', 'signal': {'chest': {'EDA': np.arange(5000.0)}}}, f)
+    url = '/participant/4?allow_unpickle=1&full=1'
+    plain = client.get(url)
+    gz = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert plain.headers['ETag'] != gz.headers['ETag']
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': gz.headers['ETag']}).status_code == 304
+    assert client.get(url, headers={'If-None-Match': gz.headers['ETag']}).status_code == 200
+
+
+@pytest.mark.skipif(app.brotli is None, reason='brotli nie jest zainstalowany')
+def test_brotli_preferred_when_available(client, big_data):
+    resp = client.get('/participant/99?allow_unpickle=1&full=1', headers={'Accept-Encoding': 'gzip, br'})
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert json.loads(app.brotli.decompress(resp.get_data()))['subject'] == 'S99'
+
+
+def test_ndjson_lines_decode_before_stream_ends(client, tmp_path, monkeypatch):
+    import pickle
+    import zlib
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', [str(tmp_path)])
+    for sid in (2, 3):
+        with open(tmp_path / f'S{sid}.pkl', 'wb') as f:
+            pickle.dump({'subject': f'S{sid}'}, f)
+    progress = []
+
+    def fake_discovery(paths):
+        for p in paths:
+            progress.append(p)
+            yield p, ['S?']
+
+    monkeypatch.setattr(app, 'discover_subjects_parallel', fake_discovery)
+    resp = client.get('/participants?allow_unpickle=1&stream=1', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    dec = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    it = iter(resp.response)
+    first = dec.decompress(next(it))
+    # nagłówek NDJSON jest do zdekodowania, zanim generator zacznie odkrywać pliki
+    assert json.loads(first.decode('utf-8').splitlines()[0])['files'] == ['S2.pkl', 'S3.pkl']
+    assert progress == []
+    line = dec.decompress(next(it))
+    assert json.loads(line) == {'file': 'S2.pkl', 'subjects': ['S?']}
+    assert len(progress) == 1
+    resp.close()
@@ -0,0 +1,92 @@
+import json
+import pickle
+import time
+
+import pytest
+
+import app
+
+
+class _SlowToUnpickle:
+    """Odpicklowanie wywołuje time.sleep — symuluje ogromny plik."""
+
+    def __reduce__(self):
+        return (time.sleep, (30,))
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    d = tmp_path / 'S2'
+    d.mkdir()
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', ['S2'])
+    monkeypatch.setattr(app, '_SUBJECT_INDEXES', {})
+    for sid in (2, 3, 4):
+        with open(d / f'S{sid}.pkl', 'wb') as f:
+            pickle.dump({'subject': f'S{sid}'}, f)
+    return d
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def test_parallel_discovery_matches_serial_and_fills_index(data_dir):
+    paths = sorted(str(p) for p in data_dir.glob('*.pkl'))
+    results = dict(app.discover_subjects_parallel(paths, workers=2))
+    assert results == {p: app.discover_subjects_in_file(p) for p in paths}
+
+    # drugi przebieg: wszystko z indeksu, bez puli procesów
+    before = dict(app._SUBJECT_INDEX_STATS)
+    again = dict(app.discover_subjects_parallel(paths, workers=2))
+    assert again == results
+    assert app._SUBJECT_INDEX_STATS['hits'] - before['hits'] == len(paths)
+
+
+def test_parallel_discovery_times_out_slow_file(data_dir, monkeypatch):
+    slow = data_dir / 'S9.pkl'
+    with open(slow, 'wb') as f:
+        pickle.dump(_SlowToUnpickle(), f)
+    paths = sorted(str(p) for p in data_dir.glob('*.pkl'))
+    started = {}
+    real_start = app._start_discovery_process
+
+    def recording_start(path):
+        proc, reader = real_start(path)
+        started[path] = proc
+        return proc, reader
+
+    monkeypatch.setattr(app, '_start_discovery_process', recording_start)
+    t0 = time.monotonic()
+    results = dict(app.discover_subjects_parallel(paths, workers=2, timeout=0.5))
+    # odpicklowanie trwałoby 30 s; start procesów (spawn) nie wlicza się do limitu na plik
+    assert time.monotonic() - t0 < 15
+    assert isinstance(results[str(slow)], TimeoutError)
+    assert results[str(data_dir / 'S3.pkl')] == ['S3']
+    # proces zablokowany na pliku po limicie został zabity, a nie zostawiony w tle
+    slow_proc = started[str(slow)]
+    assert not slow_proc.is_alive()
+    assert slow_proc.exitcode not in (None, 0)
+    assert not any(p.is_alive() for p in started.values())
+
+
+def test_participants_stream_ndjson(data_dir, client):
+    resp = client.get('/participants?allow_unpickle=1&stream=1')
+    assert resp.mimetype == 'application/x-ndjson'
+    lines = [json.loads(l) for l in resp.get_data(as_text=True).splitlines()]
+    assert lines[0]['files'] == ['S2.pkl', 'S3.pkl', 'S4.pkl']
+    per_file = {l['file']: l['subjects'] for l in lines[1:-1]}
+    assert per_file == {'S2.pkl': ['S2'], 'S3.pkl': ['S3'], 'S4.pkl': ['S4']}
+    assert lines[-1] == {'done': True, 'ok': 3, 'failed': 0}
+
+    plain = client.get('/participants?allow_unpickle=1&search_all=1').get_json()
+    assert plain['subjects_by_file'] == {'S2/S2.pkl': ['S2'], 'S2/S3.pkl': ['S3'], 'S2/S4.pkl': ['S4']}
+
+
+def test_discovery_processes_are_spawned_not_forked():
+    # fork z wątku żądania mógłby skopiować zablokowane locki innych wątków
+    assert app._DISCOVERY_MP.get_start_method() == 'spawn'
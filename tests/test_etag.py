@@ -0,0 +1,117 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    d = tmp_path / 'S2'
+    d.mkdir()
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', ['S2'])
+    monkeypatch.setattr(app, 'FEATURES_DIR', str(tmp_path))
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 * 1024 ** 2))
+    monkeypatch.setattr(app, '_SUBJECT_INDEXES', {})
+    with open(d / 'S4.pkl', 'wb') as f:
+        pickle.dump({'subject': 'S4', 'signal': {'chest': {'EDA': np.arange(100.0)}}, 'label': np.zeros(100)}, f)
+    return d
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def _forbid_loading(monkeypatch):
+    def fail(*a, **k):
+        pytest.fail('dane nie powinny być ładowane przy 304')
+    monkeypatch.setattr(app, '_load_pickle_cached', fail)
+    monkeypatch.setattr(app, 'load_participant_columnar', fail)
+
+
+def test_participant_conditional_get(data_dir, client, monkeypatch):
+    url = '/participant/4?allow_unpickle=1&n=5'
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    with monkeypatch.context() as m:
+        _forbid_loading(m)
+        again = client.get(url, headers={'If-None-Match': etag})
+        assert again.status_code == 304
+        assert again.headers['ETag'] == etag
+        assert again.get_data() == b''
+
+    # inne parametry -> inny ETag
+    other = client.get('/participant/4?allow_unpickle=1&n=6', headers={'If-None-Match': etag})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+
+    # zmiana pliku -> stary ETag nieaktualny
+    p = data_dir / 'S4.pkl'
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_participants_list_conditional_get(data_dir, client):
+    first = client.get('/participants?allow_unpickle=1')
+    etag = first.headers['ETag']
+    assert client.get('/participants?allow_unpickle=1', headers={'If-None-Match': etag}).status_code == 304
+    with open(data_dir / 'S5.pkl', 'wb') as f:
+        pickle.dump({'subject': 'S5'}, f)
+    assert client.get('/participants?allow_unpickle=1', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_stress_state_conditional_get(data_dir, client, monkeypatch, tmp_path):
+    (tmp_path / 'S4.csv').write_text('subject,mean_eda,temp,emg,acc_rms,hr,hrv,state\nS4,0.9,30.9,0.1,1.02,70,300,stres\n')
+    url = '/api/stress_state?subject=S4&allow_unpickle=1'
+    first = client.get(url)
+    assert first.status_code == 200
+    with monkeypatch.context() as m:
+        m.setattr(app, '_compute_stress_state', lambda *a: pytest.fail('stan nie powinien być liczony przy 304'))
+        assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    # generated_at zmienia się przy każdym żądaniu, więc walidator jest słaby
+    assert first.headers['ETag'].startswith('W/"')
+    second = client.get(url)
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_no_etag_on_errors(data_dir, client):
+    resp = client.get('/participant/99?allow_unpickle=1')
+    assert 'ETag' not in resp.headers
+
+
+def test_participants_with_discovery_errors_get_no_etag(data_dir, client):
+    (data_dir / 'S5.pkl').write_bytes(b'to nie jest pickle')
+    resp = client.get('/participants?allow_unpickle=1')
+    assert resp.status_code == 200
+    assert 'error' in resp.get_json()['subjects_by_file']['S5.pkl']
+    assert 'ETag' not in resp.headers
+    # bez walidatora klient nie może utrwalić błędu przez 304 — kolejne żądanie ponawia plik
+    assert client.get('/participants?allow_unpickle=1&search_all=1').headers.get('ETag') is None
+    assert 'ETag' not in client.get('/participants?allow_unpickle=1&stream=1').headers
+
+
+def test_participant_responses_vary_on_accept(data_dir, client):
+    def vary(resp):
+        return {v.strip() for v in resp.headers.get('Vary', '').split(',')}
+
+    url = '/participant/4?allow_unpickle=1&n=500'
+    plain = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert plain.mimetype == 'application/json'
+    assert {'Accept', 'Accept-Encoding'} <= vary(plain)
+    not_modified = client.get(url, headers={'If-None-Match': plain.headers['ETag'], 'Accept-Encoding': 'gzip'})
+    assert not_modified.status_code == 304 and {'Accept', 'Accept-Encoding'} <= vary(not_modified)
+    binary = client.get(url, headers={'Accept': 'application/octet-stream'})
+    assert binary.mimetype == 'application/octet-stream' and 'Accept' in vary(binary)
+    assert 'Accept' in vary(client.get('/participant?subject=S4&allow_unpickle=1'))
+    assert 'Accept' in vary(client.get('/participant/99?allow_unpickle=1'))
@@ -0,0 +1,318 @@
+"""Parytet wektorowej ekstrakcji cech (NumPy) z poprzednią implementacją w czystym Pythonie.
+
+Funkcje _ref_* to kopia wcześniejszej implementacji z app.py — służą wyłącznie jako wzorzec.
+"""
+import math
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def _ref_safe_mean(seq):
+    try:
+        if seq is None:
+            return None
+        if hasattr(seq, 'tolist'):
+            seq = seq.tolist()
+        seq = [float(x) for x in seq if x is not None]
+        if not seq:
+            return None
+        return sum(seq) / len(seq)
+    except Exception:
+        return None
+
+def _ref_rms(seq):
+    try:
+        if seq is None:
+            return None
+        if hasattr(seq, 'tolist'):
+            seq = seq.tolist()
+        vals = [float(x) for x in seq if x is not None]
+        if not vals:
+            return None
+        return math.sqrt(sum(x*x for x in vals) / len(vals))
+    except Exception:
+        return None
+
+def _ref_extract_features(raw_signals):
+    """Próbuje wydobyć metryki: mean_eda, hr, hrv, temp, acc_rms.
+
+    Obsługuje strukturę jak w participant['signal']:
+      {'chest': {'EDA': [...], 'TEMP': [...], 'HR': [...], 'HRV': [...]}, 'wrist': {...}}
+    Szuka nazw kanałów (case-insensitive) zawierających odpowiednie fragmenty.
+    Jeśli brak – zwraca None dla danej cechy.
+    """
+    features = {
+        'mean_eda': None,
+        'hr': None,
+        'hrv': None,
+        'temp': None,
+        'acc_rms': None,
+    }
+    # Jeśli surowe sygnały są DataFrame'em z kolumnami typu EDA/HR/TEMP itp.
+    try:
+        import pandas as _pd
+        if isinstance(raw_signals, _pd.DataFrame):
+            cols_lower = {c.lower(): c for c in raw_signals.columns}
+            # proste dopasowania nazw kolumn
+            if 'eda' in cols_lower:
+                features['mean_eda'] = _ref_safe_mean(raw_signals[cols_lower['eda']])
+            if 'hr' in cols_lower:
+                features['hr'] = _ref_safe_mean(raw_signals[cols_lower['hr']])
+            if 'hrv' in cols_lower:
+                features['hrv'] = _ref_safe_mean(raw_signals[cols_lower['hrv']])
+            elif 'rr' in cols_lower:  # przybliżenie HRV ze zmienności RR
+                try:
+                    seq = [float(x) for x in list(raw_signals[cols_lower['rr']]) if x is not None]
+                    if len(seq) > 1:
+                        m = sum(seq)/len(seq)
+                        var = sum((x-m)**2 for x in seq)/(len(seq)-1)
+                        features['hrv'] = math.sqrt(var)
+                except Exception:
+                    pass
+            if 'temp' in cols_lower:
+                features['temp'] = _ref_safe_mean(raw_signals[cols_lower['temp']])
+            # akcelerometr może mieć wiele osi; spróbuj ACC_X, ACC_Y, ACC_Z lub ACC
+            acc_candidates = [c for c in raw_signals.columns if c.lower().startswith('acc')]
+            if acc_candidates:
+                try:
+                    # jeśli wiele osi: RMS po wszystkich; jeśli jedna: RMS po niej
+                    if len(acc_candidates) > 1:
+                        # zbuduj listę RMS per wiersz, potem średnia RMS (globalna)
+                        sq_sum = None
+                        count_cols = 0
+                        for c in acc_candidates:
+                            try:
+                                vals = [float(v) for v in raw_signals[c].tolist() if v is not None]
+                            except Exception:
+                                vals = []
+                            if not vals:
+                                continue
+                            if sq_sum is None:
+                                sq_sum = [0.0]*len(vals)
+                            # Dopasuj długość jeśli różna — pomiń
+                            if len(vals) != len(sq_sum):
+                                continue
+                            for i, v in enumerate(vals):
+                                sq_sum[i] += v*v
+                            count_cols += 1
+                        if sq_sum and count_cols:
+                            rms_seq = [math.sqrt(x/count_cols) for x in sq_sum]
+                            features['acc_rms'] = _ref_safe_mean(rms_seq)
+                    else:
+                        features['acc_rms'] = _ref_rms(raw_signals[acc_candidates[0]])
+                except Exception:
+                    pass
+            return features
+    except Exception:
+        pass
+    # Jeżeli to nie jest dict, spróbujemy potraktować jako pojedynczy kontener sygnałów
+    # i zeskalować przez iterację po sub-kanałach (DataFrame/Series/list/ndarray)
+    if not isinstance(raw_signals, dict):
+        # potraktuj jak jedną lokację bez nazw kanałów – jeśli DataFrame, obsłużymy kolumny
+        try:
+            import pandas as _pd
+            if isinstance(raw_signals, _pd.DataFrame):
+                # już obsłużone na początku – zwróć wynik
+                return features
+        except Exception:
+            pass
+        # nie wiemy jak nazwać kanał – spróbuj użyć RMS/mean tam gdzie ma sens
+        maybe = _ref_safe_mean(raw_signals)
+        if maybe is not None and features['mean_eda'] is None:
+            features['mean_eda'] = maybe
+        return features
+
+    # uniwersalny, rekurencyjny iterator po drzewie sygnałów
+    def _iter_channels(obj, path=""):
+        try:
+            import numpy as _np
+            import pandas as _pd
+        except Exception:
+            _np = None
+            _pd = None
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                new_path = f"{path}/{k}" if path else str(k)
+                yield from _iter_channels(v, new_path)
+        else:
+            # liść: DataFrame/Series/list/tuple/ndarray lub pojedyncza wartość
+            try:
+                if _pd is not None and isinstance(obj, _pd.DataFrame):
+                    for col in obj.columns:
+                        yield (f"{path}:{col}", obj[col])
+                    return
+                if _pd is not None and isinstance(obj, _pd.Series):
+                    yield (path, obj)
+                    return
+            except Exception:
+                pass
+            try:
+                if isinstance(obj, (list, tuple)):
+                    yield (path, obj)
+                    return
+            except Exception:
+                pass
+            try:
+                if _np is not None and isinstance(obj, _np.ndarray):
+                    yield (path, obj)
+                    return
+            except Exception:
+                pass
+            # fallback – pojedyncza wartość
+            yield (path, [obj])
+
+    # Zbieraj kandydatów i specjalnie potraktuj ACC (może mieć wiele osi)
+    acc_axes = {}
+    for name, values in _iter_channels(raw_signals):
+        lname = (name or "").lower()
+        # heurystyki dopasowania nazw
+        if 'eda' in lname and features['mean_eda'] is None:
+            features['mean_eda'] = _ref_safe_mean(values)
+            continue
+        if (lname == 'hr') or ('/hr' in lname) or (':hr' in lname) or (' heartrate' in lname) or lname.endswith('/hr'):
+            if features['hr'] is None:
+                features['hr'] = _ref_safe_mean(values)
+            continue
+        if 'hrv' in lname and features['hrv'] is None:
+            features['hrv'] = _ref_safe_mean(values)
+            continue
+        if re.search(r'(^|[/:_\-])rr($|[/:_\-])', lname) and features['hrv'] is None:
+            # przybliż HRV z RR jako odchylenie standardowe
+            try:
+                seq = list(values) if not hasattr(values, 'tolist') else values.tolist()
+                seq = [float(x) for x in seq if x is not None]
+                if len(seq) > 1:
+                    m = sum(seq)/len(seq)
+                    var = sum((x-m)**2 for x in seq)/(len(seq)-1)
+                    features['hrv'] = math.sqrt(var)
+            except Exception:
+                pass
+            continue
+        if 'temp' in lname and features['temp'] is None:
+            features['temp'] = _ref_safe_mean(values)
+            continue
+        if 'acc' in lname:
+            # spróbuj zebrać osie (x/y/z) do wspólnego RMS
+            axis = None
+            m = re.search(r'acc[^a-z0-9]?([xyz])', lname)
+            if m:
+                axis = m.group(1)
+            try:
+                seq = list(values) if not hasattr(values, 'tolist') else values.tolist()
+                seq = [float(x) for x in seq if x is not None]
+                if axis:
+                    acc_axes[axis] = seq
+                else:
+                    # pojedynczy kanał acc — policz rms bez osi
+                    if features['acc_rms'] is None:
+                        features['acc_rms'] = _ref_rms(seq)
+            except Exception:
+                pass
+
+    # jeśli mamy wiele osi akcelerometru i jeszcze nie policzono acc_rms
+    if features['acc_rms'] is None and len(acc_axes) >= 2:
+        # znajdź minimalną wspólną długość i policz RMS po osiach dla każdej próbki
+        try:
+            L = min(len(v) for v in acc_axes.values() if isinstance(v, list) and v)
+            if L and L > 0:
+                axes = [acc_axes.get('x'), acc_axes.get('y'), acc_axes.get('z')]
+                axes = [a for a in axes if isinstance(a, list) and a]
+                if axes:
+                    rms_seq = []
+                    for i in range(L):
+                        s = 0.0
+                        c = 0
+                        for a in axes:
+                            try:
+                                v = float(a[i])
+                                s += v*v
+                                c += 1
+                            except Exception:
+                                pass
+                        if c:
+                            rms_seq.append(math.sqrt(s / c))
+                    if rms_seq:
+                        features['acc_rms'] = _ref_safe_mean(rms_seq)
+        except Exception:
+            pass
+
+    return features
+
+
+def _assert_features_close(new, ref):
+    assert set(new) == set(ref)
+    for k in ref:
+        if ref[k] is None:
+            assert new[k] is None, k
+        else:
+            assert new[k] == pytest.approx(ref[k], rel=1e-9), k
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(42)
+
+
+def test_parity_nested_dict_of_arrays(rng):
+    n = 5000
+    signals = {
+        'chest': {'EDA': rng.random(n), 'Temp': 30 + rng.random(n), 'ACC_X': rng.normal(size=n),
+                  'ACC_Y': rng.normal(size=n), 'ACC_Z': rng.normal(size=n)},
+        'wrist': {'HR': 60 + 10 * rng.random(n // 10), 'RR': 800 + 50 * rng.normal(size=n // 10)},
+    }
+    _assert_features_close(app._extract_features_from_signals(signals), _ref_extract_features(signals))
+
+
+def test_parity_lists_and_hrv_channel(rng):
+    signals = {'wrist': {'eda': list(rng.random(300)), 'hrv': list(300 + rng.random(30)),
+                         'acc': list(rng.normal(size=300)), 'TEMP': [31.2] * 40}}
+    _assert_features_close(app._extract_features_from_signals(signals), _ref_extract_features(signals))
+
+
+def test_parity_dataframe(rng):
+    n = 2000
+    df = pd.DataFrame({'EDA': rng.random(n), 'HR': 60 + rng.random(n), 'RR': 800 + rng.normal(size=n),
+                       'TEMP': 31 + rng.random(n), 'ACC_X': rng.normal(size=n), 'ACC_Y': rng.normal(size=n)})
+    _assert_features_close(app._extract_features_from_signals(df), _ref_extract_features(df))
+
+    # kolumny o etykietach nie-napisowych są pomijane przy dopasowaniu, a nie przerywają ekstrakcji
+    mixed = df.assign(**{'ACC_Z': rng.normal(size=n)})
+    mixed[0] = rng.random(n)
+    _assert_features_close(app._extract_features_from_signals(mixed),
+                           _ref_extract_features(mixed.drop(columns=[0])))
+
+
+def test_helpers_skip_none_and_nan():
+    assert app._safe_mean([1.0, None, 3.0]) == pytest.approx(2.0)
+    assert app._safe_mean(np.array([1.0, np.nan, 3.0])) == pytest.approx(2.0)
+    assert app._safe_mean([None, None]) is None
+    assert app._rms(np.array([3.0, -3.0])) == pytest.approx(3.0)
+
+
+def test_wesad_shaped_acc_uses_per_sample_magnitude():
+    # WESAD trzyma ACC jako (N, 3) — poprzednia implementacja zwracała tu None
+    acc = np.tile([[1.0, 2.0, 2.0]], (100, 1))
+    feats = app._extract_features_from_signals({'chest': {'ACC': acc, 'EDA': np.ones((100, 1))}})
+    assert feats['acc_rms'] == pytest.approx(math.sqrt(9.0 / 3))
+    assert feats['mean_eda'] == pytest.approx(1.0)
+
+
+def test_vectorized_is_much_faster(rng):
+    n = 200_000
+    signals = {'chest': {'EDA': rng.random(n), 'Temp': rng.random(n), 'ACC_X': rng.normal(size=n),
+                         'ACC_Y': rng.normal(size=n), 'ACC_Z': rng.normal(size=n)}}
+    t0 = time.perf_counter()
+    ref = _ref_extract_features(signals)
+    t_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = app._extract_features_from_signals(signals)
+    t_new = time.perf_counter() - t0
+    _assert_features_close(new, ref)
+    # luźny próg, żeby test nie był niestabilny na wolnych maszynach CI
+    assert t_new * 10 < t_ref
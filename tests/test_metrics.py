@@ -0,0 +1,95 @@
+import pickle
+import re
+
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    m = app._Metrics()
+    monkeypatch.setattr(app, '_METRICS', m)
+    monkeypatch.setattr(app, 'METRICS_ENABLED', True)
+    return m
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def fake_data(monkeypatch):
+    data = {'subject': 'S99', 'signal': {'chest': {'EDA': np.linspace(0, 1, 5000)}}, 'label': np.zeros(5000, dtype=int)}
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: data)
+    monkeypatch.setattr(app, 'STREAM_CHUNK_ITEMS', 256)
+    return data
+
+
+_SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[^}]*\})? -?[0-9.e+\-]+$')
+
+
+def test_requests_are_counted_per_route_template(client, metrics, fake_data):
+    for sid in ('1', '2'):
+        client.get(f'/participant/{sid}?allow_unpickle=1&n=5', buffered=True)
+    client.get('/no/such/route', buffered=True)
+
+    route = '/participant/<subject_id>'
+    assert metrics.requests[(route, 'GET', 200)] == 2
+    assert metrics.latency[(route, 'GET')].count == 2
+    assert metrics.in_flight[route] == 0
+    assert metrics.requests[('<unmatched>', 'GET', 404)] == 1
+    assert metrics.errors[('<unmatched>', 'GET', '4xx')] == 1
+
+
+def test_response_size_is_measured_after_compression(client, metrics, fake_data):
+    resp = client.get('/participant/9?allow_unpickle=1&full=1', headers={'Accept-Encoding': 'gzip'}, buffered=True)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    sizes = metrics.sizes[('/participant/<subject_id>', 'GET')]
+    assert sizes.count == 1
+    assert sizes.sum == len(resp.get_data())
+
+
+def test_streamed_response_stays_in_flight_until_closed(client, metrics, fake_data):
+    resp = client.get('/participant/9?allow_unpickle=1&full=1&stream=1', headers={'Accept-Encoding': 'identity'})
+    route = '/participant/<subject_id>'
+    assert resp.is_streamed
+    assert metrics.in_flight[route] == 1
+    body = resp.get_data()
+    resp.close()
+    assert metrics.in_flight[route] == 0
+    assert metrics.sizes[(route, 'GET')].sum == len(body)
+
+
+def test_pickle_loads_are_timed(tmp_path, metrics, monkeypatch):
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 * 1024 ** 2))
+    p = tmp_path / 'S5.pkl'
+    with open(p, 'wb') as f:
+        pickle.dump({'signal': {'chest': {'EDA': np.arange(100.0)}}}, f)
+    app._load_pickle_cached(str(p))
+    app._load_pickle_cached(str(p))  # trafienie w cache — bez pomiaru
+    assert metrics.loads.count == 1
+
+
+def test_metrics_endpoint_exposes_prometheus_text(client, metrics, fake_data):
+    client.get('/participant/1?allow_unpickle=1&n=5', buffered=True)
+    resp = client.get('/metrics', headers={'Accept-Encoding': 'identity'}, buffered=True)
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = resp.get_data(as_text=True)
+    for line in text.splitlines():
+        assert line.startswith('#') or _SAMPLE.match(line), line
+    assert 'wesad_http_request_duration_seconds_bucket{route="/participant/<subject_id>",method="GET",le="+Inf"} 1' in text
+    assert 'wesad_pickle_cache_hits_total' in text
+    assert '# TYPE wesad_chat_gate_active gauge' in text
+
+
+def test_metrics_can_be_disabled(client, metrics, monkeypatch):
+    monkeypatch.setattr(app, 'METRICS_ENABLED', False)
+    client.get('/', buffered=True)
+    assert metrics.requests == {}
@@ -0,0 +1,72 @@
+import re
+import tracemalloc
+
+import pytest
+
+import app
+
+HEADERS = {'X-Profile-Token': 'sekret'}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, 'PROFILE_TOKEN', 'sekret')
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def test_requests_without_profile_flag_are_untouched(client):
+    resp = client.get('/cache_stats')
+    assert 'pickle_cache' in resp.get_json()
+
+
+@pytest.mark.parametrize('token, configured', [(None, 'sekret'), ('zły', 'sekret'), ('sekret', '')])
+def test_profiling_requires_matching_token(client, monkeypatch, token, configured):
+    monkeypatch.setattr(app, 'PROFILE_TOKEN', configured)
+    headers = {'X-Profile-Token': token} if token else {}
+    resp = client.get('/cache_stats?profile=1', headers=headers)
+    assert resp.status_code == 403
+
+
+def test_json_report_lists_top_hotspots(client):
+    resp = client.get('/cache_stats?profile=1&profile_top=5', headers=HEADERS)
+    assert resp.status_code == 200
+    report = resp.get_json()
+    assert report['profile']['path'] == '/cache_stats'
+    assert report['profile']['status'].startswith('200')
+    assert report['profile']['response_bytes'] > 0
+    hotspots = report['hotspots']
+    assert 1 <= len(hotspots) <= 5
+    cum = [h['cumtime_ms'] for h in hotspots]
+    assert cum == sorted(cum, reverse=True)
+    assert 'memory' not in report
+
+    full = client.get('/cache_stats?profile=1&profile_top=500', headers=HEADERS).get_json()
+    assert any(h['name'] == 'cache_stats' and h['file'].endswith('app.py') for h in full['hotspots'])
+
+
+def test_collapsed_stacks_for_flamegraph(client):
+    resp = client.get('/cache_stats', headers=dict(HEADERS, **{'X-Profile': 'collapsed'}))
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    lines = resp.get_data(as_text=True).splitlines()
+    assert lines
+    for line in lines:
+        assert re.fullmatch(r'\S.* \d+', line), line
+    assert any('(cache_stats)' in line for line in lines)
+
+
+def test_memory_peaks_are_optional(client):
+    was_tracing = tracemalloc.is_tracing()
+    report = client.get('/cache_stats?profile=1&profile_memory=1', headers=HEADERS).get_json()
+    assert report['memory']['peak_bytes'] > 0
+    assert isinstance(report['memory']['top_allocations'], list)
+    assert tracemalloc.is_tracing() == was_tracing
+
+
+def test_invalid_options_and_concurrent_profiles(client):
+    assert client.get('/?profile=1&profile_sort=nope', headers=HEADERS).status_code == 400
+    assert client.get('/?profile=1&profile_top=abc', headers=HEADERS).status_code == 400
+    with app._PROFILE_LOCK:
+        assert client.get('/?profile=1', headers=HEADERS).status_code == 409
@@ -0,0 +1,185 @@
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def test_decimate_minmax_preserves_extremes():
+    x = np.zeros(1000)
+    x[123] = 5.0
+    x[777] = -3.0
+    bucket, starts, mins, maxs, means = app._decimate_minmax(x, 10)
+    assert bucket == 100
+    assert starts.tolist() == list(range(0, 1000, 100))
+    assert maxs[1] == 5.0 and mins[7] == -3.0
+    assert maxs.max() == x.max() and mins.min() == x.min()
+    assert means[1] == pytest.approx(0.05)
+
+
+def test_decimate_minmax_multi_axis_and_tail():
+    x = np.arange(30.0).reshape(10, 3)
+    bucket, starts, mins, maxs, means = app._decimate_minmax(x, 4)
+    assert bucket == 3
+    assert mins.shape == (4, 3)
+    np.testing.assert_array_equal(mins[-1], x[9])
+    np.testing.assert_array_equal(maxs[0], x[2])
+
+
+def test_resolution_endpoint(client, monkeypatch):
+    sig = np.sin(np.linspace(0, 20, 70000))
+    data = {'subject': 'S9', 'signal': {'chest': {'ECG': sig, 'ACC': np.zeros((70000, 3))}}, 'label': np.zeros(10)}
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: data)
+
+    j = client.get('/participant/9?allow_unpickle=1&resolution=500&range=1000:61000').get_json()
+    ecg = j['available_signals']['chest']['ECG']
+    assert ecg['length'] == 60000
+    assert ecg['bucket_size'] == 120
+    assert len(ecg['min']) == 500
+    assert ecg['index'][0] == 1000
+    assert max(ecg['max']) == pytest.approx(sig[1000:61000].max())
+    assert len(j['available_signals']['chest']['ACC']['mean'][0]) == 3
+
+    assert client.get('/participant/9?allow_unpickle=1&resolution=0').status_code == 400
+
+
+def test_pyramid_built_once_and_served_without_loading(client, tmp_path, monkeypatch):
+    import pickle
+    d = tmp_path / 'S2'
+    d.mkdir()
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', ['S2'])
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 ** 8))
+    rng = np.random.default_rng(3)
+    ecg = rng.normal(size=100_000)
+    acc = rng.normal(size=(100_000, 3))
+    with open(d / 'S4.pkl', 'wb') as f:
+        pickle.dump({'subject': 'S4', 'signal': {'chest': {'ECG': ecg, 'ACC': acc}}, 'label': np.arange(50)}, f)
+    app.ingest_pickle_to_columnar(str(d / 'S4.pkl'))
+
+    url = '/participant/4?allow_unpickle=1&resolution=100&range=4096:69632'
+    first = client.get(url).get_json()
+    pyramid_dir = d / ('S4' + app.PYRAMID_SUFFIX)
+    assert (pyramid_dir / app.PYRAMID_MANIFEST).exists()
+    # tylko poziomy zdecymowane — surowe próbki zostają w magazynie kolumnowym
+    assert not list(pyramid_dir.glob('*L0.npy'))
+    assert sum(p.stat().st_size for p in pyramid_dir.iterdir()) < ecg.nbytes + acc.nbytes
+    assert not list(d.glob('*.tmp*'))
+
+    loads = []
+    real_load = app.load_participant_data
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: loads.append(sid) or real_load(sid))
+    resp = client.get(url)
+    assert resp.headers['X-Resolution-Source'] == 'pyramid'
+    second = resp.get_json()
+    ch = second['available_signals']['chest']['ECG']
+    assert ch['bucket_size'] == 656 and ch['index'][0] == 4096 and len(ch['min']) == 100
+    assert ch['min'] == first['available_signals']['chest']['ECG']['min']
+    np.testing.assert_allclose(np.array(second['available_signals']['chest']['ACC']['max']),
+                               np.array(first['available_signals']['chest']['ACC']['max']))
+    assert second['labels_sample'] == list(range(20))
+    assert loads == []
+
+
+@pytest.fixture
+def pyramid_subject(client, tmp_path, monkeypatch):
+    import pickle
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', [str(tmp_path)])
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 ** 8))
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    rng = np.random.default_rng(5)
+    ecg = rng.normal(size=50_003)
+    ecg[rng.random(ecg.size) < 0.01] = np.nan
+    data = {'subject': 'S6', 'signal': {'chest': {'ECG': ecg, 'ACC': rng.normal(size=(50_003, 3))},
+                                        'wrist': {'TEMP': rng.normal(size=300)}}, 'label': np.arange(50)}
+    with open(tmp_path / 'S6.pkl', 'wb') as f:
+        pickle.dump(data, f)
+    # piramida czyta surowe brzegi z magazynu kolumnowego; zimna odpowiedź i tak liczy z pickla
+    app.ingest_pickle_to_columnar(str(tmp_path / 'S6.pkl'))
+    return tmp_path
+
+
+def _assert_same_resolution_body(cold, warm):
+    assert cold.keys() == warm.keys()
+    assert cold['available_signals'].keys() == warm['available_signals'].keys()
+    for loc, chans in cold['available_signals'].items():
+        assert chans.keys() == warm['available_signals'][loc].keys()
+        for name, c in chans.items():
+            w = warm['available_signals'][loc][name]
+            for key in ('length', 'bucket_size', 'index', 'min', 'max'):
+                assert c[key] == w[key], (loc, name, key)
+            np.testing.assert_allclose(np.array(c['mean'], dtype=float), np.array(w['mean'], dtype=float),
+                                       rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('query', [
+    'range=1000:5000&resolution=100',
+    'resolution=37',
+    'range=17:49999&resolution=500',
+    'range=100:400&resolution=100',
+    'resolution=100&params=ECG',
+])
+def test_pyramid_response_matches_cold_response(client, pyramid_subject, query):
+    url = '/participant/6?allow_unpickle=1&' + query
+    cold = client.get(url)
+    assert 'X-Resolution-Source' not in cold.headers
+    warm = client.get(url)
+    assert warm.headers['X-Resolution-Source'] == 'pyramid'
+    assert warm.headers['ETag'] != cold.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': warm.headers['ETag']}).status_code == 304
+    _assert_same_resolution_body(cold.get_json(), warm.get_json())
+    bucket = cold.get_json()['available_signals']['chest']['ECG']
+    assert len(bucket['min']) == -(-bucket['length'] // bucket['bucket_size'])
+
+
+def test_binary_resolution_ignores_pyramid(client, pyramid_subject):
+    url = '/participant/6?allow_unpickle=1&resolution=100&format=bin'
+    client.get('/participant/6?allow_unpickle=1&resolution=100')  # zbuduj piramidę
+    resp = client.get(url)
+    assert resp.mimetype == 'application/octet-stream'
+    assert 'X-Resolution-Source' not in resp.headers
+
+
+def test_pyramid_levels_combine_uneven_buckets():
+    x = np.arange(100.0)
+    x[5] = np.nan
+    levels = app._pyramid_levels(x)
+    top = levels[max(levels)]
+    assert top.shape[0] == 1
+    assert top[0, 0] == 0.0 and top[0, 1] == 99.0
+    assert top[0, 2] == pytest.approx(np.nansum(x))
+    assert top[0, 3] == 99
+
+
+def test_no_pyramid_without_columnar_store(client, tmp_path, monkeypatch):
+    import pickle
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', [str(tmp_path)])
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 ** 8))
+    with open(tmp_path / 'S8.pkl', 'wb') as f:
+        pickle.dump({'subject': 'S8', 'signal': {'chest': {'ECG': np.arange(5000.0)}}}, f)
+    for _ in range(2):
+        resp = client.get('/participant/8?allow_unpickle=1&resolution=50')
+        assert resp.status_code == 200 and 'X-Resolution-Source' not in resp.headers
+    assert not (tmp_path / ('S8' + app.PYRAMID_SUFFIX)).exists()
+
+
+def test_failed_pyramid_build_leaves_no_tmp_dir(pyramid_subject, monkeypatch):
+    def disk_full(*a, **k):
+        raise OSError('No space left on device')
+    monkeypatch.setattr(app.np, 'save', disk_full)
+    flight = app._SingleFlight()
+    monkeypatch.setattr(app, '_LOAD_FLIGHT', flight)
+    assert app._ensure_participant_pyramid('6') is None
+    assert not list(pyramid_subject.glob('S6.pyramid*'))
+    # budowa piramidy nie wlicza się do statystyk łączenia ładowań pickli
+    assert flight.stats()['executed'] == 0
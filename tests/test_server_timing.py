@@ -0,0 +1,86 @@
+import json
+import logging
+import pickle
+import re
+
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, 'SERVER_TIMING_ENABLED', True)
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def pkl_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', [str(tmp_path)])
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 * 1024 ** 2))
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setenv('ALLOW_UNPICKLE', '1')
+    data = {'subject': 'S7', 'signal': {'chest': {'EDA': np.linspace(0, 1, 3000)}, 'wrist': {'TEMP': np.arange(40.0)}},
+            'label': np.zeros(3000, dtype=int)}
+    with open(tmp_path / 'S7.pkl', 'wb') as f:
+        pickle.dump(data, f)
+    return tmp_path
+
+
+def _parse(header):
+    out = {}
+    for part in header.split(','):
+        m = re.fullmatch(r'\s*([\w-]+);dur=([0-9.]+)\s*', part)
+        assert m, part
+        out[m.group(1)] = float(m.group(2))
+    return out
+
+
+def test_full_request_reports_phase_breakdown(client, pkl_dir):
+    resp = client.get('/participant/7?full=1', buffered=True)
+    assert resp.status_code == 200
+    phases = _parse(resp.headers['Server-Timing'])
+    for name in ('resolve', 'unpickle', 'signals', 'convert', 'serialize', 'total'):
+        assert name in phases
+    assert sum(v for k, v in phases.items() if k != 'total') <= phases['total'] + 0.05
+
+    # drugie żądanie trafia w cache — bez fazy unpickle
+    again = _parse(client.get('/participant/7?full=1', buffered=True).headers['Server-Timing'])
+    assert 'unpickle' not in again
+
+
+def test_nested_phases_report_self_time():
+    with app.app.test_request_context('/'):
+        with app._Phase('outer'):
+            with app._Phase('inner'):
+                sum(range(200000))
+        phases = app.g._timings['phases']
+    assert phases['inner'] > 0
+    assert phases['outer'] < phases['inner']
+
+
+def test_phases_are_noop_outside_requests():
+    with app._Phase('x') as p:
+        pass
+    assert p.timings is None
+
+
+def test_server_timing_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(app, 'SERVER_TIMING_ENABLED', False)
+    assert 'Server-Timing' not in client.get('/', buffered=True).headers
+
+
+def test_structured_timing_log(client, pkl_dir, monkeypatch, caplog):
+    monkeypatch.setattr(app, 'TIMING_LOG_ENABLED', True)
+    with caplog.at_level(logging.INFO, logger='wesad.timing'):
+        client.get('/participant/7?n=5', buffered=True)
+    records = [json.loads(r.getMessage()) for r in caplog.records if r.name == 'wesad.timing']
+    assert len(records) == 1
+    rec = records[0]
+    assert rec['route'] == '/participant/<subject_id>'
+    assert rec['status'] == 200
+    assert {'resolve', 'unpickle', 'signals', 'serialize'} <= set(rec['phases_ms'])
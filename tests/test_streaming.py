@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def fake_data(monkeypatch):
+    data = {
+        'subject': 'S99',
+        'signal': {
+            'chest': {'ACC': np.arange(30.0).reshape(10, 3), 'EDA': np.linspace(0, 1, 25), 'Temp': list(range(40))},
+            'wrist': {'TEMP': pd.Series(np.arange(12.0)), 'BVP': np.arange(7)},
+            'extra': np.arange(5.0),
+        },
+        'label': np.zeros(25, dtype=int),
+        'questionnaire': {'a': 1},
+    }
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: data)
+    monkeypatch.setattr(app, 'STREAM_CHUNK_ITEMS', 4)
+    return data
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    '&range=2:9',
+    '&params=TEMP,EDA',
+    '&params=extra',
+])
+def test_stream_matches_buffered_full_response(client, fake_data, query):
+    url = '/participant/99?allow_unpickle=1&full=1' + query
+    buffered = client.get(url)
+    streamed = client.get(url + '&stream=1')
+    assert streamed.status_code == 200
+    assert streamed.is_streamed
+    assert json.loads(streamed.get_data(as_text=True)) == buffered.get_json()
+
+
+def test_stream_truncates_long_channels(client, fake_data, monkeypatch):
+    monkeypatch.setattr(app, 'MAX_FULL_IN_SUMMARY', 20)
+    url = '/participant/99?allow_unpickle=1&full=1'
+    buffered = client.get(url).get_json()
+    streamed = json.loads(client.get(url + '&stream=1').get_data(as_text=True))
+    assert streamed == buffered
+    assert streamed['available_signals']['chest']['full']['Temp']['total_length'] == 40
+    assert len(streamed['available_signals']['chest']['full']['Temp']['data']) == 20
+    assert 'chest/Temp' in streamed['truncated_channels']
+
+
+def _decode_binary(body):
+    assert body[:4] == app.BINARY_MAGIC
+    hlen = int.from_bytes(body[4:8], 'little')
+    header = json.loads(body[8:8 + hlen])
+    base = 8 + hlen
+    assert base % 8 == 0
+    out = {}
+    for ch in header['channels']:
+        if 'offset' not in ch:
+            continue
+        assert ch['offset'] % 8 == 0
+        start = base + ch['offset']
+        arr = np.frombuffer(body[start:start + ch['nbytes']], dtype=np.dtype(ch['dtype']))
+        out[ch['name']] = arr.reshape(ch['shape'])
+    return header, out
+
+
+def test_binary_format_roundtrip(client, fake_data):
+    res = client.get('/participant/99?allow_unpickle=1&format=bin&range=1:8')
+    assert res.status_code == 200
+    assert res.mimetype == app.BINARY_MIMETYPE
+    body = res.get_data()
+    assert len(body) == int(res.headers['Content-Length'])
+    header, arrays = _decode_binary(body)
+    assert header['subject'] == 'S99'
+    np.testing.assert_array_equal(arrays['chest/ACC'], fake_data['signal']['chest']['ACC'][1:8])
+    np.testing.assert_array_equal(arrays['wrist/TEMP'], np.arange(12.0)[1:8])
+    np.testing.assert_array_equal(arrays['extra'], np.arange(5.0)[1:8])
+    assert 'label' in arrays
+
+
+def test_binary_format_via_accept_header_and_float32(client, fake_data):
+    res = client.get('/participant/99?allow_unpickle=1&params=EDA&dtype=float32',
+                     headers={'Accept': 'application/octet-stream'})
+    assert res.status_code == 200
+    header, arrays = _decode_binary(res.get_data())
+    assert list(arrays) == ['chest/EDA']
+    assert arrays['chest/EDA'].dtype == np.dtype('<f4')
+    np.testing.assert_allclose(arrays['chest/EDA'], fake_data['signal']['chest']['EDA'], rtol=1e-6)
+    # zwykłe żądanie przeglądarki (Accept: */*) nadal dostaje JSON
+    assert client.get('/participant/99?allow_unpickle=1', headers={'Accept': '*/*'}).is_json
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def _signals(n=7000):
+    # pierwsza połowa spokojna, druga — wysokie EDA i niska temperatura (stres)
+    eda = np.concatenate([np.full(n // 2, 0.3), np.full(n - n // 2, 1.2)])
+    temp = np.concatenate([np.full(n // 40, 32.0), np.full(n // 20 - n // 40, 30.0)])
+    return {
+        'chest': {'EDA': eda.reshape(-1, 1), 'ACC': np.tile([[0.5, 0.5, 0.5]], (n, 1))},
+        'wrist': {'TEMP': temp.reshape(-1, 1)},
+    }
+
+
+def test_windowed_features_match_direct_extraction():
+    rng = np.random.default_rng(1)
+    sig = {'chest': {'EDA': rng.random(3000), 'ACC': rng.normal(size=(3000, 3))},
+           'wrist': {'TEMP': 31 + rng.random(300), 'RR': 800 + rng.normal(size=300)}}
+    wins = app._windowed_features(sig, windows=5, window_size=600)
+    assert [w['start_sample'] for w in wins] == [0, 600, 1200, 1800, 2400]
+    for w in wins:
+        a, b = w['start_sample'], w['end_sample']
+        part = {'chest': {'EDA': sig['chest']['EDA'][a:b], 'ACC': sig['chest']['ACC'][a:b]},
+                'wrist': {'TEMP': sig['wrist']['TEMP'][a // 10:b // 10], 'RR': sig['wrist']['RR'][a // 10:b // 10]}}
+        direct = app._extract_features_from_signals(part)
+        for k, v in direct.items():
+            assert w['features'][k] == pytest.approx(v, rel=1e-9), k
+
+
+def test_stress_state_history_from_signals(client, monkeypatch):
+    monkeypatch.setattr(app, 'load_participant_columnar', lambda sid: None)
+    monkeypatch.setattr(app, 'load_participant_data', lambda sid: {'subject': 'S2', 'signal': _signals()})
+    res = client.get('/api/stress_state?subject=S2&windows=20&window_size=300&allow_unpickle=1')
+    assert res.status_code == 200
+    j = res.get_json()
+    assert j['history_source'] == 'signals'
+    assert len(j['history']) == 20
+    assert all(h['end_sample'] - h['start_sample'] == 300 for h in j['history'])
+    assert all('start_s' not in h for h in j['history'])
+    assert all(isinstance(h['score'], int) for h in j['history'])
+    assert j['history'][0]['state'] != 'stres'
+    assert j['history'][-1]['state'] == 'stres'
+    assert j['trend'] == 'rosnący'
+
+
+def test_stress_state_history_falls_back_to_csv_rows(client, monkeypatch):
+    monkeypatch.setattr(app, '_load_raw_signals', lambda sid: None)
+    res = client.get('/api/stress_state?subject=S2&windows=5&allow_unpickle=1')
+    assert res.status_code == 200
+    j = res.get_json()
+    assert j['history_source'] == 'csv'
+    assert len(j['history']) == 5
+    # wiersze CSV niosą czas w sekundach, a nie indeksy próbek
+    assert all('start_sample' not in h and isinstance(h['start_s'], float) for h in j['history'])
+    assert all(h['end_s'] > h['start_s'] for h in j['history'])
+    assert j['trend'] in ('rosnący', 'malejący', 'stabilny')
+
+
+def test_stress_trend():
+    assert app._stress_trend([0, 20, 40, 60]) == 'rosnący'
+    assert app._stress_trend([80, 60, 20, 0]) == 'malejący'
+    assert app._stress_trend([40, 40, 40]) == 'stabilny'
+    assert app._stress_trend([]) == 'stabilny'
+
+
+def _next_event(it):
+    """Następne zdarzenie SSE (pomija komentarze keep-alive)."""
+    import json
+    for chunk in it:
+        text = chunk.decode()
+        if text.startswith(':'):
+            continue
+        fields = dict(line.split(': ', 1) for line in text.strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+
+def test_stress_stream_shares_computation_and_pushes_on_change(client, monkeypatch):
+    version = ['v1']
+    calls = []
+
+    def fake_compute(subject_id, *rest):
+        calls.append(subject_id)
+        return {'subject': f'S{subject_id}', 'score': 10 * len(calls), 'version': version[0]}, None
+
+    monkeypatch.setattr(app, 'STRESS_STREAM_POLL', 0.02)
+    monkeypatch.setattr(app, 'STRESS_STREAM_HEARTBEAT', 0.05)
+    monkeypatch.setattr(app, '_stress_source_version', lambda sid: version[0])
+    monkeypatch.setattr(app, '_compute_stress_state', fake_compute)
+
+    url = '/api/stress_state/stream?subject=S2&windows=5&allow_unpickle=1'
+    a = client.get(url, buffered=False)
+    b = client.get(url, buffered=False)
+    assert a.mimetype == 'text/event-stream'
+    ita, itb = iter(a.response), iter(b.response)
+    assert _next_event(ita) == ('state', {'subject': 'S2', 'score': 10, 'version': 'v1'})
+    assert _next_event(itb)[1]['score'] == 10
+    assert len(calls) == 1
+
+    # bez zmian w danych tylko keep-alive — brak ponownych obliczeń
+    for _ in range(3):
+        assert next(ita) == b': keep-alive\n\n'
+    assert len(calls) == 1
+
+    version[0] = 'v2'
+    assert _next_event(ita)[1] == {'subject': 'S2', 'score': 20, 'version': 'v2'}
+    assert _next_event(itb)[1]['version'] == 'v2'
+    assert len(calls) == 2
+
+    a.close()
+    b.close()
+    assert app._STRESS_CHANNELS == {}
+
+
+def test_stress_stream_reports_missing_data(client, monkeypatch):
+    monkeypatch.setattr(app, '_stress_source_version', lambda sid: None)
+    monkeypatch.setattr(app, '_compute_stress_state', lambda *a: (None, 'Brak danych'))
+    resp = client.get('/api/stress_state/stream?subject=S99&allow_unpickle=1', buffered=False)
+    assert _next_event(iter(resp.response)) == ('error', {'error': 'Brak danych'})
+    resp.close()
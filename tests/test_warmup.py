@@ -0,0 +1,105 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import app
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    d = tmp_path / 'S2'
+    d.mkdir()
+    monkeypatch.setattr(app, 'CURRENT_DATA_DIR', str(d))
+    monkeypatch.setattr(app, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DATA_DIR_CANDIDATES', ['S2'])
+    monkeypatch.setattr(app, 'FEATURES_DIR', str(tmp_path))
+    monkeypatch.setattr(app, '_PICKLE_CACHE', app._LRUCache(10 * 1024 ** 2))
+    monkeypatch.setattr(app, '_SUBJECT_INDEXES', {})
+    monkeypatch.setattr(app, '_WARMUP', {'state': 'idle', 'total': 0, 'done': 0, 'failed': 0,
+                                         'subjects': {}, 'started_at': None, 'finished_at': None})
+    monkeypatch.setenv('ALLOW_UNPICKLE', '1')
+    for sid in (4, 5):
+        with open(d / f'S{sid}.pkl', 'wb') as f:
+            pickle.dump({'subject': f'S{sid}', 'signal': {'chest': {'EDA': np.random.rand(5000)}}}, f)
+    return d
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def test_preload_targets_auto_and_explicit(data_dir):
+    assert app._preload_targets('S3, 2,auto') == ['3', '2', '4', '5']
+    assert app._preload_targets('') == []
+
+
+def test_warmup_populates_cache_and_reports_ready(data_dir, client, monkeypatch):
+    assert client.get('/ready').status_code == 200
+
+    thread = app.start_warmup('auto,9', workers=2)
+    assert thread is not None
+    thread.join(10)
+
+    resp = client.get('/ready')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['state'] == 'done' and body['ready']
+    assert body['total'] == 3 and body['done'] == 2 and body['failed'] == 1
+    # bez magazynu kolumnowego piramida nie powstaje (nie duplikuje surowych próbek)
+    assert body['subjects']['4']['steps'] == ['pickle']
+    assert body['subjects']['9']['state'] == 'failed'
+    assert app._PICKLE_CACHE.stats()['entries'] == 2
+
+    # pierwsze żądanie po rozgrzaniu nie robi już unpicklingu
+    monkeypatch.setattr(app, '_safe_pickle_load', lambda *a, **k: pytest.fail('unpickled again'))
+    assert client.get('/participant/4?allow_unpickle=1').status_code == 200
+
+
+def test_ready_is_503_while_running(client, monkeypatch):
+    monkeypatch.setitem(app._WARMUP, 'state', 'running')
+    resp = client.get('/ready')
+    assert resp.status_code == 503
+    assert resp.get_json()['ready'] is False
+
+
+def test_warmup_starts_when_module_is_imported(tmp_path):
+    # gunicorn / waitress / `flask run --no-reload` tylko importują moduł — __main__ się nie wykonuje
+    import json
+    import os
+    import subprocess
+    import sys
+    (tmp_path / 'S5.csv').write_text('subject,mean_eda,temp,emg,acc_rms,hr,hrv,state\nS5,0.9,30.9,,1.02,70,300,stres\n')
+    env = dict(os.environ, PRELOAD_SUBJECTS='5', FEATURES_DIR=str(tmp_path))
+    env.pop('WERKZEUG_RUN_MAIN', None)
+    code = ('import json, time, app\n'
+            'for _ in range(300):\n'
+            '    if app._WARMUP["state"] == "done": break\n'
+            '    time.sleep(0.05)\n'
+            'print(json.dumps(app._WARMUP))\n')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    warmup = json.loads(out.stdout.strip().splitlines()[-1])
+    assert warmup['state'] == 'done'
+    assert warmup['subjects']['5']['steps'] == ['features']
+
+
+@pytest.mark.parametrize('argv, env, expected', [
+    (['/usr/bin/flask', 'run', '--debug'], {}, True),
+    (['/usr/bin/flask', '--app', 'app', 'run'], {'FLASK_DEBUG': '1'}, True),
+    (['/usr/bin/flask', 'run', '--debug', '--no-reload'], {}, False),
+    (['/usr/bin/flask', 'run'], {}, False),
+    (['/usr/bin/flask', 'run', '--debug'], {'WERKZEUG_RUN_MAIN': 'true'}, False),
+    (['/usr/bin/gunicorn', 'app:app'], {'FLASK_DEBUG': '1'}, False),
+])
+def test_reloader_supervisor_skips_warmup(monkeypatch, argv, env, expected):
+    for k in ('WERKZEUG_RUN_MAIN', 'FLASK_DEBUG', 'FLASK_RUN_RELOAD'):
+        monkeypatch.delenv(k, raising=False)
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    monkeypatch.setattr(app.sys, 'argv', argv)
+    assert app._reloader_supervisor() is expected